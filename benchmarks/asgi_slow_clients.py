@@ -0,0 +1,77 @@
+"""
+Threaded WSGI against ASGI serving, with and without slow clients.
+
+Starts ``zendo serve`` with one worker, threaded and with ``--asgi`` (needs
+the ``asgi`` extra). For each, loads /_dash-layout over keep-alive
+connections, then opens slow clients that send part of a request and
+stall, and times normal requests made meanwhile. Stalled clients hold a
+request thread of the threaded server, ASGI keeps them on its event loop.
+
+    python benchmarks/asgi_slow_clients.py --threads 8 --slow-clients 200
+"""
+
+import argparse
+import http.client
+import socket
+import tempfile
+import time
+from pathlib import Path
+
+from load import free_port, run_load, zendo_serve
+
+
+def timed_get(port: int, path: str, timeout: float) -> float:
+    started = time.perf_counter()
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+        conn.request("GET", path)
+        conn.getresponse().read()
+        conn.close()
+    except OSError:
+        return float("inf")
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=4)
+    parser.add_argument("--slow-clients", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=20)
+    args = parser.parse_args()
+    for mode in ("wsgi", "asgi"):
+        port = free_port()
+        cwd = Path(tempfile.mkdtemp(prefix="zendo-bench-"))
+        serve_args = ["--workers", "1", "--threads", str(args.threads)]
+        if mode == "asgi":
+            serve_args.append("--asgi")
+        with zendo_serve(serve_args, port, cwd) as process:
+            run_load(port, args.connections, 1)  # warm up
+            result = run_load(port, args.connections, args.seconds)
+            if process.poll() is not None:
+                print(f"{mode}  server exited with {process.returncode}, see {cwd}")
+                continue
+            held = []
+            for _ in range(args.slow_clients):
+                sock = socket.create_connection(("127.0.0.1", port))
+                sock.sendall(b"GET / HTTP/1.1\r\nHost: localhost\r\n")
+                held.append(sock)
+            time.sleep(0.5)
+            latencies = sorted(
+                timed_get(port, "/_dash-layout", args.timeout) for _ in range(4)
+            )
+            for sock in held:
+                sock.close()
+        if latencies[-1] == float("inf"):
+            slow = f"timed out after {args.timeout:.0f}s"
+        else:
+            slow = f"max {latencies[-1] * 1000:.0f}ms"
+        print(
+            f"{mode}  {result['rps']:5.0f} req/s  p99 {result['p99']:5.1f}ms  |  "
+            f"with {args.slow_clients} slow clients: {slow}"
+        )
+
+
+if __name__ == "__main__":
+    main()
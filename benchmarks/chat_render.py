@@ -0,0 +1,153 @@
+"""
+Size of the chat rendering against the length of the conversation.
+
+For conversations of growing length, measures the chat layout (which holds
+the latest page of messages) and the response of the callback that renders
+a sent message (which appends the new bubbles only). Both should stay flat
+however long the history is.
+
+    python benchmarks/chat_render.py --history 20 200 2000
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import flask_login
+from plotly.io.json import to_json_plotly
+
+from zendo.app import create_app
+from zendo.config import Config
+from zendo.constants import APP_ID
+from zendo.layouts import MainLayout
+from zendo.services import auth
+from zendo.services.chat import append_messages
+
+ids = MainLayout.ids
+
+
+def prop_id(component_id: dict) -> str:
+    return json.dumps(component_id, separators=(",", ":"), sort_keys=True)
+
+
+def find_output(client, output_id: str, input_id: str) -> str:
+    """The output string of the callback writing output_id from input_id."""
+    for dependency in client.get("/_dash-dependencies").get_json():
+        if f'"{output_id}"' in dependency["output"] and (
+            f'"{input_id}"' in dependency["inputs"][0]["id"]
+        ):
+            return dependency["output"]
+    raise LookupError(output_id)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--history", type=int, nargs="+", default=[20, 200, 2000])
+    parser.add_argument("--sends", type=int, default=20, help="Sends timed per run.")
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="zendo-bench-"))
+    app = create_app(Config(database_url=f"sqlite:///{tmp / 'database.db'}"))
+    server = app.server
+    with server.app_context():
+        _, _, user = auth.register_user("alice", "alice@example.com", "secret1")
+    session = server.session_interface.get_signing_serializer(server)
+    client = server.test_client()
+    client.set_cookie("session", session.dumps({"_user_id": "alice"}))
+    send_output = find_output(client, "send_job", "send_button")
+    render_output = find_output(client, "messages", "state")
+
+    for history in args.history:
+        conversation_id = f"bench-{history}"
+        with server.test_request_context("/"):
+            flask_login.login_user(user)
+            for start in range(0, history, 1000):
+                append_messages(
+                    conversation_id,
+                    user.id,
+                    [
+                        {"role": "user", "content": f"message {n}"}
+                        for n in range(start, min(history, start + 1000))
+                    ],
+                )
+            layout = MainLayout(aio_id=APP_ID, conversation_id=conversation_id)
+            layout_size = len(to_json_plotly(layout))
+            app_state = layout.children[0].data
+            window = layout.children[1].data
+
+        sizes, elapsed = [], 0.0
+        for n in range(args.sends):
+            started = time.perf_counter()
+            response = client.post(
+                "/_dash-update-component",
+                json={
+                    "output": send_output,
+                    "outputs": [
+                        {"id": ids.state(APP_ID), "property": "data"},
+                        {"id": ids.send_job(APP_ID), "property": "data"},
+                    ],
+                    "inputs": [
+                        {
+                            "id": ids.send_button(APP_ID),
+                            "property": "n_clicks",
+                            "value": n + 1,
+                        }
+                    ],
+                    "state": [
+                        {
+                            "id": ids.input_textarea(APP_ID),
+                            "property": "value",
+                            "value": f"new message {n}",
+                        },
+                        {
+                            "id": ids.state(APP_ID),
+                            "property": "data",
+                            "value": app_state,
+                        },
+                    ],
+                    "changedPropIds": [prop_id(ids.send_button(APP_ID)) + ".n_clicks"],
+                },
+            )
+            app_state.update(
+                response.get_json()["response"][prop_id(ids.state(APP_ID))]["data"]
+            )
+            response = client.post(
+                "/_dash-update-component",
+                json={
+                    "output": render_output,
+                    "outputs": [
+                        {"id": ids.messages(APP_ID), "property": "children"},
+                        {"id": ids.window(APP_ID), "property": "data"},
+                        {"id": ids.load_older_button(APP_ID), "property": "style"},
+                        {"id": ids.load_newer_button(APP_ID), "property": "style"},
+                    ],
+                    "inputs": [
+                        {
+                            "id": ids.state(APP_ID),
+                            "property": "data",
+                            "value": app_state,
+                        }
+                    ],
+                    "state": [
+                        {"id": ids.window(APP_ID), "property": "data", "value": window}
+                    ],
+                    "changedPropIds": [prop_id(ids.state(APP_ID)) + ".data"],
+                },
+            )
+            elapsed += time.perf_counter() - started
+            assert response.status_code == 200, response.status_code
+            sizes.append(len(response.data))
+            rendered = response.get_json()["response"]
+            window = rendered.get(prop_id(ids.window(APP_ID)), {}).get("data", window)
+
+        print(
+            f"history={history:6d}  layout={layout_size:7d}B  "
+            f"render response={sum(sizes) / len(sizes):6.0f}B (max {max(sizes)}B)  "
+            f"send+render={elapsed / args.sends * 1000:5.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
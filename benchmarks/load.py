@@ -0,0 +1,105 @@
+"""Helpers of the server benchmarks: run ``zendo serve`` and load it."""
+
+from __future__ import annotations
+
+import http.client
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(port: int, path: str = "/healthz", timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", path)
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Server on port {port} did not start")
+        time.sleep(0.2)
+
+
+@contextmanager
+def serving(
+    command: list[str], port: int, cwd: Path, path: str = "/healthz"
+) -> Iterator[subprocess.Popen]:
+    """Run a server command until the block ends, stopped with SIGTERM."""
+    log = open(cwd / "server.log", "ab")
+    process = subprocess.Popen(
+        command, cwd=cwd, stdout=subprocess.DEVNULL, stderr=log, env=os.environ
+    )
+    try:
+        wait_ready(port, path)
+        yield process
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=60)
+        log.close()
+
+
+def zendo_serve(args: list[str], port: int, cwd: Path):
+    """``zendo serve`` with its data (database, jobs) in cwd."""
+    command = [sys.executable, "-m", "zendo.main", "serve", "--port", str(port)]
+    return serving(command + args, port, cwd)
+
+
+def run_load(
+    port: int, connections: int, seconds: float, path: str = "/_dash-layout"
+) -> dict[str, float]:
+    """GET path over keep-alive connections for some seconds."""
+    latencies: list[float] = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def run() -> None:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        mine = []
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except OSError:
+                conn.close()
+                ok = False
+            if ok:
+                mine.append(time.perf_counter() - started)
+            else:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=run) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    n = len(latencies)
+    return {
+        "rps": n / seconds,
+        "p50": latencies[n // 2] * 1000 if n else float("nan"),
+        "p99": latencies[int(n * 0.99)] * 1000 if n else float("nan"),
+        "errors": errors[0],
+    }
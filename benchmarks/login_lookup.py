@@ -0,0 +1,103 @@
+"""
+Login lookups by username or email, on a table of many users.
+
+Compares the former query, which ORs the username and email columns, with
+the probe of a single lowercase key column that authenticate_user runs
+now. Prints the query plans and the lookup rate of each.
+
+    python benchmarks/login_lookup.py --users 1000000 --database users.db
+
+The database is seeded on the first run and reused by later ones.
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import insert, or_, select
+
+from zendo.app import create_app
+from zendo.config import Config
+from zendo.models import User, db, normalize_login, utcnow
+
+
+def seed(users: int, batch: int = 50000) -> None:
+    now = utcnow()
+    for start in range(0, users, batch):
+        db.session.execute(
+            insert(User.__table__),
+            [
+                {
+                    "username": f"User{i}",
+                    "email": f"User{i}@Example.org",
+                    "username_key": f"user{i}",
+                    "email_key": f"user{i}@example.org",
+                    "password_hash": "x",
+                    "is_active": True,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for i in range(start, min(users, start + batch))
+            ],
+        )
+        db.session.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--database", type=Path, help="SQLite file, kept.")
+    args = parser.parse_args()
+    path = args.database or Path(tempfile.mkdtemp(prefix="zendo-bench-")) / "db"
+    app = create_app(Config(database_url=f"sqlite:///{path.resolve()}"))
+    with app.server.app_context():
+        count = db.session.query(User.id).count()
+        if count < args.users:
+            started = time.perf_counter()
+            seed(args.users)
+            print(f"seeded {args.users} users in {time.perf_counter() - started:.0f}s")
+        else:
+            args.users = count
+
+        def old(login: str):
+            return select(User.id).where(
+                or_(User.username == login, User.email == login)
+            )
+
+        def new(login: str):
+            column = User.email_key if "@" in login else User.username_key
+            return select(User.id).where(column == normalize_login(login))
+
+        conn = db.session.connection()
+        for name, query in [
+            ("old OR", old("User1")),
+            ("new, username", new("User1")),
+            ("new, email", new("User1@Example.org")),
+        ]:
+            sql = str(query.compile(conn, compile_kwargs={"literal_binds": True}))
+            plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").all()
+            print(f"{name:14s} " + " | ".join(row.detail for row in plan))
+
+        rng = random.Random(0)
+        numbers = [rng.randrange(args.users) for _ in range(args.lookups)]
+        for name, make, login in [
+            ("old OR, username", old, "User{}"),
+            ("old OR, email", old, "User{}@Example.org"),
+            ("new, username", new, "User{}"),
+            ("new, email", new, "User{}@Example.org"),
+        ]:
+            started = time.perf_counter()
+            for n in numbers:
+                assert db.session.execute(make(login.format(n))).first() is not None
+            elapsed = time.perf_counter() - started
+            print(
+                f"{name:18s} {len(numbers) / elapsed:7.0f} lookups/s  "
+                f"{elapsed / len(numbers) * 1e6:5.0f} us"
+            )
+
+
+if __name__ == "__main__":
+    main()
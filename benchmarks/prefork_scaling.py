@@ -0,0 +1,89 @@
+"""
+Throughput of ``zendo serve`` by number of worker processes.
+
+Starts the server with each worker count and loads /_dash-layout over
+keep-alive connections. The load generator runs on the same host, so the
+numbers only show scaling when there are cores to spare for both.
+
+Then checks how connections are spread: 2 workers of 1 thread serving a
+handler that takes 1s get 4 concurrent requests. A worker only accepts
+while it has a free thread, so they are served 2 per worker in about 2s.
+
+    python benchmarks/prefork_scaling.py --workers 1 2 4 --connections 8
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from load import free_port, run_load, serving, zendo_serve
+
+
+def slow_app(environ, start_response):
+    if environ["PATH_INFO"] != "/healthz":
+        time.sleep(1)
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [str(os.getpid()).encode()]
+
+
+def serve_slow(port: int) -> None:
+    from zendo.server import PreforkServer
+
+    PreforkServer(lambda: slow_app, "127.0.0.1", port, workers=2, threads=1).run()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--serve-slow", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve_slow:
+        serve_slow(args.serve_slow)
+        return
+
+    print(f"cpus={os.cpu_count()} connections={args.connections} on /_dash-layout")
+    for workers in args.workers:
+        port = free_port()
+        cwd = Path(tempfile.mkdtemp(prefix="zendo-bench-"))
+        serve_args = ["--workers", str(workers), "--threads", str(args.threads)]
+        with zendo_serve(serve_args, port, cwd):
+            run_load(port, args.connections, 1)  # warm up
+            result = run_load(port, args.connections, args.seconds)
+        print(
+            f"workers={workers}  {result['rps']:5.0f} req/s  "
+            f"p50 {result['p50']:5.1f}ms  p99 {result['p99']:5.1f}ms  "
+            f"errors {result['errors']}"
+        )
+
+    port = free_port()
+    cwd = Path(tempfile.mkdtemp(prefix="zendo-bench-"))
+    command = [sys.executable, __file__, "--serve-slow", str(port)]
+    with serving(command, port, cwd):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(4) as executor:
+            pids = list(
+                executor.map(
+                    lambda _: urllib.request.urlopen(
+                        f"http://127.0.0.1:{port}/"
+                    ).read(),
+                    range(4),
+                )
+            )
+        elapsed = time.perf_counter() - started
+    spread = sorted(Counter(pids).values())
+    print(
+        f"2 workers x 1 thread, 4 requests of 1s: per worker {spread}, {elapsed:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
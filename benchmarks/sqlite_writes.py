@@ -0,0 +1,87 @@
+"""
+Concurrent applet state writes per SQLite journal mode and synchronous level.
+
+Threads each commit a series of update_applet calls to their own applet, in
+one database file per setting. Reports the writes per second and the
+writes that failed, e.g. with "database is locked" when the busy timeout
+is 0.
+
+    python benchmarks/sqlite_writes.py --threads 8 --writes 200
+"""
+
+import argparse
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import replace
+from pathlib import Path
+
+from zendo.app import create_app
+from zendo.config import config
+from zendo.models import db
+from zendo.services import auth
+from zendo.services.applet_state import create_applet, update_applet
+
+SETTINGS = [
+    # journal mode, synchronous, busy timeout (ms)
+    ("DELETE", "FULL", 5000),
+    ("DELETE", "FULL", 0),
+    ("WAL", "NORMAL", 5000),
+    ("WAL", "NORMAL", 0),
+]
+
+
+def run(path: Path, journal: str, synchronous: str, busy_timeout: int, args) -> None:
+    app = create_app(
+        replace(
+            config,
+            database_url=f"sqlite:///{path}",
+            sqlite_journal_mode=journal,
+            sqlite_synchronous=synchronous,
+            sqlite_busy_timeout=busy_timeout,
+        )
+    )
+    applet_ids = [str(uuid.uuid4()) for _ in range(args.threads)]
+    with app.server.app_context():
+        _, _, user = auth.register_user("alice", "alice@example.com", "secret1")
+        for applet_id in applet_ids:
+            create_applet(applet_id, user.id, "chat_history", {})
+    errors: list[str] = []
+
+    def write(applet_id: str) -> None:
+        with app.server.app_context():
+            for i in range(args.writes):
+                success, message, _ = update_applet(user.id, applet_id, {"i": i})
+                if not success:
+                    errors.append(message)
+
+    threads = [threading.Thread(target=write, args=(a,)) for a in applet_ids]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    total = args.threads * args.writes
+    print(
+        f"journal={journal:6s} synchronous={synchronous:6s} "
+        f"busy_timeout={busy_timeout:4d}ms  {total / elapsed:6.0f} writes/s  "
+        f"failed {len(errors)}/{total}"
+    )
+    with app.server.app_context():
+        db.engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=200, help="Writes per thread.")
+    args = parser.parse_args()
+    tmp = Path(tempfile.mkdtemp(prefix="zendo-bench-"))
+    for n, (journal, synchronous, busy_timeout) in enumerate(SETTINGS):
+        run(tmp / f"database-{n}.db", journal, synchronous, busy_timeout, args)
+
+
+if __name__ == "__main__":
+    main()
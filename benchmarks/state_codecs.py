@@ -0,0 +1,68 @@
+"""
+Stored size and encode/decode time of a large applet state per codec.
+
+The state is a chat history of random words, which compresses worse than
+real chat text. Codecs whose optional package is missing (``pip install
+zendo[codecs]``) are skipped.
+
+    python benchmarks/state_codecs.py --messages 25000
+"""
+
+import argparse
+import random
+import string
+import time
+
+from zendo.codecs import CODECS, decode, encode, get_codec
+
+
+def chat_history(messages: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    words = [
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9)))
+        for _ in range(5000)
+    ]
+    return {
+        "history": [
+            {
+                "role": "user" if n % 2 == 0 else "assistant",
+                "user": "alice" if n % 2 == 0 else None,
+                "content": " ".join(rng.choices(words, k=rng.randint(5, 25))),
+            }
+            for n in range(messages)
+        ]
+    }
+
+
+def best_of(repeat: int, fn, *args) -> tuple[float, object]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=25000)
+    parser.add_argument("--repeat", type=int, default=5, help="Best of n runs.")
+    args = parser.parse_args()
+    state = chat_history(args.messages)
+    for name in CODECS:
+        try:
+            get_codec(name)
+        except ValueError as e:
+            print(f"{name:8s} skipped: {e}")
+            continue
+        encode_time, data = best_of(args.repeat, encode, state, name, 0)
+        decode_time, value = best_of(args.repeat, decode, data)
+        assert value == state
+        print(
+            f"{name:8s} {len(data) / 1e6:5.2f} MB  "
+            f"encode {encode_time * 1000:4.0f} ms  decode {decode_time * 1000:4.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -6,29 +6,55 @@ with Bootstrap components for styling and integrated user authentication.
 """
 
 import os
+import time
 
 import dash
 import dash_bootstrap_components as dbc
 from dash import Input, Output, callback, html
+from flask import Flask
+from sqlalchemy import text
 
 from zendo.services import auth
+from zendo.services.applet_ticks import schedule_applet_ticks, tick_scheduler
+from zendo.services.lease import scheduler_lease
+from zendo.services.timer import schedule_running_timers
 from zendo.services.auth import login_manager
 from zendo.components import AuthStateAIO, NavbarAIO
 from zendo.constants import APP_ID, APP_MAIN_CONTENT_ID
 from zendo.layouts import AuthLayout, MainLayout
+from zendo.migrations import upgrade
 from zendo.models import db
-from zendo.config import appname
+from zendo.config import Config, appname
+from zendo.config import config as default_config
+from zendo.database import configure_database, install_sqlite_pragmas, is_sqlite
 
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:  # pragma: no cover
+    WSGIMiddleware = None
 
-def create_app():
+# Scheduler key of the recurring sync of the background work
+SYNC_KEY = "zendo-background-sync"
+
+
+def create_app(config: Config | None = None):
     """
     Create and configure the Dash application.
 
+    Parameters
+    ----------
+    config : Config, optional
+        Application configuration, by default the one loaded from the
+        environment.
+
     Returns
     -------
     dash.Dash
         Configured Dash application instance.
     """
+    if config is None:
+        config = default_config
+
     app = dash.Dash(
         __name__,
         # external_stylesheets=[dbc.themes.BOOTSTRAP],
@@ -38,8 +64,7 @@ def create_app():
     app.title = appname
 
     # Configure SQLAlchemy
-    database_path = os.path.join(os.getcwd(), "data", "database.db")
-    app.server.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{database_path}"
+    configure_database(app.server, config)
     app.server.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     app.server.config["SECRET_KEY"] = os.environ.get(
         "SECRET_KEY", "your-secret-key-here"
@@ -47,13 +72,109 @@ def create_app():
     # Initialize SQLAlchemy with the Flask server
     db.init_app(app.server)
     login_manager.init_app(app.server)
-    # Create database tables
+    app.server.add_url_rule("/healthz", "healthz", health_check)
+    # Create database tables and upgrade existing ones
     with app.server.app_context():
+        if is_sqlite(config.database_url):
+            install_sqlite_pragmas(db.engine, config)
         db.create_all()
+        upgrade(db.engine)
     app.layout = create_layout()
     return app
 
 
+def start_background_work(server: Flask, config: Config | None = None) -> None:
+    """
+    Run the applet ticks and timer expiries in the background.
+
+    Called by the processes serving requests, not by ``create_app``: of
+    those, only the one holding ``scheduler_lease`` runs them, so every
+    tick runs once per host. Every ``config.scheduler_sync_interval``
+    seconds the others try to take over the lease, and its holder schedules
+    the applets and timers started by requests the others served.
+
+    Parameters
+    ----------
+    server : Flask
+        The Flask server of the application.
+    config : Config, optional
+        Application configuration, by default the one loaded from the
+        environment.
+    """
+    if config is None:
+        config = default_config
+    sync_background_work(server, config.scheduler_sync_interval)
+
+
+def sync_background_work(server: Flask, interval: float) -> None:
+    """Take the lease if it is free, then schedule what is not scheduled."""
+    try:
+        if scheduler_lease.acquire():
+            with server.app_context():
+                schedule_running_timers()
+                schedule_applet_ticks(MainLayout.applets)
+    finally:
+        tick_scheduler.schedule(
+            SYNC_KEY,
+            time.time() + interval,
+            lambda: sync_background_work(server, interval),
+        )
+
+
+def health_check():
+    """
+    Report whether this process is ready to serve requests.
+
+    Returns
+    -------
+    tuple[dict, int]
+        Status and HTTP status code, 503 when the database is unreachable.
+    """
+    try:
+        db.session.execute(text("SELECT 1"))
+    except Exception:
+        return {"status": "unavailable"}, 503
+    return {"status": "ok", "pid": os.getpid()}, 200
+
+
+def create_asgi_app(config: Config | None = None):
+    """
+    Create the Dash application wrapped as an ASGI application.
+
+    Connections are handled by the event loop of the ASGI server, so idle
+    keep-alive connections and slow clients do not hold a thread. The Dash
+    (Flask) views are synchronous and run in a pool of
+    ``config.asgi_threads`` threads. Needs the optional ``a2wsgi`` package.
+
+    Parameters
+    ----------
+    config : Config, optional
+        Application configuration, by default the one loaded from the
+        environment.
+
+    Returns
+    -------
+    WSGIMiddleware
+        ASGI application.
+    """
+    if WSGIMiddleware is None:
+        raise ImportError("The ASGI app needs the optional 'a2wsgi' package")
+    if config is None:
+        config = default_config
+    app = create_app(config)
+    start_background_work(app.server, config)
+    return WSGIMiddleware(app.server, workers=config.asgi_threads)
+
+
+def __getattr__(name: str):
+    # ``zendo.app:asgi_app`` for ASGI servers, created on first access so
+    # that importing this module has no side effects
+    if name == "asgi_app":
+        globals()["asgi_app"] = create_asgi_app()
+        return globals()["asgi_app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def create_layout():
     """
     Create the main layout for the application.
@@ -132,4 +253,5 @@ def update_main_content(_):
 
 if __name__ == "__main__":
     app = create_app()
+    start_background_work(app.server)
     app.run(debug=True, port=8051)
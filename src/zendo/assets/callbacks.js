@@ -6,6 +6,32 @@ function getByPatternId(partial) {
     return document.querySelector(s);
 }
 
+// Server clock minus browser clock, timer states are stamped by the server
+let serverClockOffset = 0;
+let lastServerNow = null;
+
+function beep() {
+    try {
+        const audioContext = new (window.AudioContext || window.webkitAudioContext)();
+        const oscillator = audioContext.createOscillator();
+        const gainNode = audioContext.createGain();
+
+        oscillator.connect(gainNode);
+        gainNode.connect(audioContext.destination);
+
+        oscillator.frequency.value = 800;
+        oscillator.type = "sine";
+
+        gainNode.gain.setValueAtTime(0.3, audioContext.currentTime);
+        gainNode.gain.exponentialRampToValueAtTime(0.01, audioContext.currentTime + 0.5);
+
+        oscillator.start(audioContext.currentTime);
+        oscillator.stop(audioContext.currentTime + 0.5);
+    } catch (e) {
+        console.log("Audio notification not available");
+    }
+}
+
 window.dash_clientside = Object.assign({}, window.dash_clientside, {
     mainLayout: {
         inputUpdate: function (_, textareaId, buttonId, counter) {
@@ -51,5 +77,82 @@ window.dash_clientside = Object.assign({}, window.dash_clientside, {
             // bump a counter just to produce a deterministic return
             return (counter || 0) + 1;
         },
+        bindScroll: function (contentId, olderId, newerId, counter) {
+            const content = getByPatternId(contentId);
+            const older = getByPatternId(olderId);
+            const newer = getByPatternId(newerId);
+
+            if (!content || !older || !newer) {
+                return window.dash_clientside.no_update;
+            }
+
+            // Only bind once
+            if (content.dataset.scrollBound === "1") {
+                return window.dash_clientside.no_update;
+            }
+            content.dataset.scrollBound = "1";
+
+            // Start at the latest messages and follow new ones while the
+            // user has not scrolled away from the bottom
+            let stickToBottom = true;
+            let lastLoad = 0;
+            content.scrollTop = content.scrollHeight;
+
+            content.addEventListener("scroll", function () {
+                const atBottom = content.scrollHeight - content.scrollTop -
+                    content.clientHeight < 32;
+                // Newer messages are not in the window yet, do not follow
+                // the pages loaded below
+                const newerShown = newer.offsetParent !== null;
+                stickToBottom = atBottom && !newerShown;
+                // Request the previous page when reaching the top, and the
+                // next one when reaching the bottom away from the latest
+                const now = Date.now();
+                if (now - lastLoad <= 500) return;
+                if (content.scrollTop < 32 && older.offsetParent !== null) {
+                    lastLoad = now;
+                    older.click();
+                } else if (atBottom && newerShown) {
+                    lastLoad = now;
+                    newer.click();
+                }
+            });
+
+            new MutationObserver(function () {
+                if (stickToBottom) {
+                    content.scrollTop = content.scrollHeight;
+                }
+            }).observe(content, { childList: true, subtree: true });
+
+            return (counter || 0) + 1;
+        },
+    },
+    timer: {
+        tick: function (_, state, className) {
+            if (!state) return window.dash_clientside.no_update;
+            if (state.server_now !== undefined && state.server_now !== lastServerNow) {
+                // A state just sent by the server
+                lastServerNow = state.server_now;
+                serverClockOffset = state.server_now - Date.now();
+            }
+            // Elapsed time from timestamps, right even when ticks were skipped
+            let elapsed = state.accumulated || 0;
+            if (state.started_at !== null && state.started_at !== undefined) {
+                elapsed += Date.now() + serverClockOffset - state.started_at;
+            }
+            let seconds = Math.floor(elapsed / 1000);
+            const countdown = state.mode === "countdown";
+            if (countdown) {
+                seconds = state.duration - seconds;
+            }
+            const abs = Math.abs(seconds);
+            const text = (seconds < 0 ? "-" : "") + Math.floor(abs / 60) + ":" +
+                String(abs % 60).padStart(2, "0");
+            const expired = countdown && seconds <= 0;
+            if (expired && state.started_at && !/expired/.test(className || "")) {
+                beep();
+            }
+            return [text, expired ? "timer-display expired" : "timer-display"];
+        },
     },
 });
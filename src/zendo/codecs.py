@@ -0,0 +1,183 @@
+"""
+Codecs for large JSON column values.
+
+Small values are stored as plain JSON text, so that SQLite's JSON functions
+keep working on them. Values whose JSON encoding reaches the configured
+threshold are encoded with the configured codec and stored as a BLOB
+prefixed with a one-byte tag naming the codec, which makes every row
+self-describing: rows written with another codec, or before codecs existed,
+decode transparently.
+
+The ``zstd`` and ``msgpack`` codecs need the optional ``zstandard`` and
+``msgpack`` packages.
+"""
+
+from __future__ import annotations
+
+import json
+import zlib
+from typing import Any
+
+from sqlalchemy import LargeBinary, TypeDecorator
+
+from zendo.config import config
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+__all__ = [
+    "CODECS",
+    "Codec",
+    "EncodedJSON",
+    "decode",
+    "encode",
+]
+
+
+class Codec:
+    """Encodes JSON-compatible values to bytes, identified by a tag byte."""
+
+    name: str
+    tag: bytes
+
+    def encode(self, value: Any, text: str) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, data: bytes) -> Any:
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    name = "json"
+    tag = b"\x00"
+
+    def encode(self, value: Any, text: str) -> bytes:
+        return text.encode("utf-8")
+
+    def decode(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class ZlibCodec(Codec):
+    name = "zlib"
+    tag = b"\x01"
+
+    def encode(self, value: Any, text: str) -> bytes:
+        return zlib.compress(text.encode("utf-8"), 1)
+
+    def decode(self, data: bytes) -> Any:
+        return json.loads(zlib.decompress(data))
+
+
+class ZstdCodec(Codec):
+    name = "zstd"
+    tag = b"\x02"
+
+    def encode(self, value: Any, text: str) -> bytes:
+        return zstandard.ZstdCompressor(level=3).compress(text.encode("utf-8"))
+
+    def decode(self, data: bytes) -> Any:
+        return json.loads(zstandard.ZstdDecompressor().decompress(data))
+
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+    tag = b"\x03"
+
+    def encode(self, value: Any, text: str) -> bytes:
+        return msgpack.packb(value)
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data)
+
+
+CODECS: dict[str, Codec] = {
+    codec.name: codec
+    for codec in (JsonCodec(), ZlibCodec(), ZstdCodec(), MsgpackCodec())
+}
+
+_CODECS_BY_TAG = {codec.tag: codec for codec in CODECS.values()}
+
+
+def get_codec(name: str) -> Codec:
+    try:
+        codec = CODECS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown codec '{name}', expected one of: {', '.join(CODECS)}"
+        ) from None
+    if (name == "zstd" and zstandard is None) or (
+        name == "msgpack" and msgpack is None
+    ):
+        raise ValueError(f"Codec '{name}' needs the optional '{name}' package")
+    return codec
+
+
+def encode(
+    value: Any, codec: str | None = None, threshold: int | None = None
+) -> str | bytes:
+    """
+    Encode a value for storage.
+
+    Parameters
+    ----------
+    value : Any
+        JSON-compatible value.
+    codec : str, optional
+        Codec for values at or above the threshold, by default
+        ``config.state_codec``.
+    threshold : int, optional
+        Size in bytes of the JSON text from which the codec is used, by
+        default ``config.state_codec_threshold``.
+
+    Returns
+    -------
+    str | bytes
+        JSON text, or the tagged encoded bytes.
+    """
+    codec = get_codec(codec or config.state_codec)
+    if threshold is None:
+        threshold = config.state_codec_threshold
+    text = json.dumps(value, separators=(",", ":"))
+    if codec.name == "json" or len(text) < threshold:
+        return text
+    return codec.tag + codec.encode(value, text)
+
+
+def decode(data: str | bytes | None) -> Any:
+    """Decode a value stored by :func:`encode` (or plain JSON text)."""
+    if data is None:
+        return None
+    if isinstance(data, str):
+        return json.loads(data)
+    data = bytes(data)
+    codec = _CODECS_BY_TAG.get(data[:1])
+    if codec is None:
+        # untagged bytes, plain JSON written by a driver as a BLOB
+        return json.loads(data)
+    return codec.decode(data[1:])
+
+
+class EncodedJSON(TypeDecorator):
+    """JSON column stored as text or, above a size threshold, encoded bytes."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        def process(value):
+            if value is None:
+                return None
+            return encode(value)
+
+        return process
+
+    def result_processor(self, dialect, coltype):
+        return decode
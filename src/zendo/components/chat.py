@@ -10,7 +10,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Any
 
-from dash import Input, Output, callback, dcc, html, MATCH
+from dash import Input, Output, Patch, callback, dcc, html, no_update, MATCH
 
 
 __all__ = ["ChatHistoryAIO"]
@@ -41,7 +41,8 @@ class ChatHistoryAIO(html.Div):
         Parameters
         ----------
         data : list[dict[str, Any]], optional
-            Initial chat history to display, by default None.
+            Initial chat history to display, by default None. Later updates
+            are made by writing only the new messages to the store.
 
         Returns
         -------
@@ -57,6 +58,12 @@ class ChatHistoryAIO(html.Div):
                 html.Div(
                     id=self.ids.messages(aio_id),
                     children=[
+                        create_message_bubble(
+                            msg["message"], msg["sender"], msg["timestamp"]
+                        )
+                        for msg in reversed(data)
+                    ]
+                    or [
                         create_message_bubble(
                             "Hello! How can I help you today? You can type messages or use commands like /time, /calc, /timer, etc.",
                             sender="assistant",
@@ -72,10 +79,10 @@ class ChatHistoryAIO(html.Div):
                         "flex-direction": "column-reverse",
                     },
                 ),
-                # Chat history store
+                # New messages store, only holds the latest batch
                 dcc.Store(
                     id=self.ids.store(aio_id),
-                    data=data,
+                    data=[],
                 ),
             ],
             style={
@@ -89,42 +96,34 @@ class ChatHistoryAIO(html.Div):
     @callback(
         Output(ids.messages(MATCH), "children"),
         Input(ids.store(MATCH), "data"),
-        prevent_initial_call=False,
+        prevent_initial_call=True,
     )
-    def update_chat_messages(chat_history):
+    def update_chat_messages(new_messages):
         """
-        Update the chat messages display based on chat history.
+        Add the bubbles for newly stored messages to the chat display.
 
         Parameters
         ----------
-        chat_history : list
-            Current chat history.
+        new_messages : list
+            Messages added since the last update.
 
         Returns
         -------
-        list
-            Updated message components.
+        Patch
+            Partial update prepending the new message components.
         """
-        if not chat_history:
-            return [
-                create_message_bubble(
-                    "Hello! How can I help you today? You can type messages.",
-                    sender="assistant",
-                    timestamp="Now",
-                )
-            ]
-
-        # Create message bubbles (reversed order for column-reverse layout)
-        message_components = []
-
-        for msg in reversed(chat_history):
-            bubble = create_message_bubble(
-                msg["message"], msg["sender"], msg["timestamp"]
+        if not new_messages:
+            return no_update
+
+        # Prepend in chronological order so that the newest message ends up
+        # first (the container uses a column-reverse layout).
+        patched_messages = Patch()
+        for msg in new_messages:
+            patched_messages.prepend(
+                create_message_bubble(msg["message"], msg["sender"], msg["timestamp"])
             )
 
-            message_components.append(bubble)
-
-        return message_components
+        return patched_messages
 
 
 def create_message_bubble(
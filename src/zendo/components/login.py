@@ -8,6 +8,7 @@ including registration and login forms with built-in validation and callbacks.
 import uuid
 
 from dash import MATCH, Input, Output, State, callback, dcc, html, no_update
+from flask import request
 import dash_bootstrap_components as dbc
 
 
@@ -172,7 +173,9 @@ class LoginUserAIO(dbc.Card):
             )
 
         # Attempt authentication
-        success, message, user = authenticate_user(username, password)
+        success, message, user = authenticate_user(
+            username, password, remote_addr=request.remote_addr
+        )
 
         if success:
             # Store user info and clear form
@@ -9,19 +9,26 @@ import re
 import uuid
 
 from dash import MATCH, Input, Output, State, callback, dcc, html, no_update
+from flask import request
 import dash_bootstrap_components as dbc
 
-from zendo.services.auth import register_user
-
-EMAIL_REGEX_PATTERN = r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$"
-EMAIL_REGEX_PATTERN_ERROR = "Invalid email format. Please enter a valid email address."
-USERNAME_REGEX_PATTERN = r"^[a-zA-Z0-9_-]{3,20}$"
-USERNAME_REGEX_PATTERN_ERROR = (
-    "Username must be 3-20 characters long and can only contain letters, "
-    "numbers, underscores, and hyphens."
+from zendo.services.auth import (
+    check_lookup_throttle,
+    is_email_taken,
+    is_username_taken,
+    register_user,
+)
+from zendo.constants import (
+    EMAIL_REGEX_PATTERN,
+    EMAIL_REGEX_PATTERN_ERROR,
+    USERNAME_REGEX_PATTERN,
+    USERNAME_REGEX_PATTERN_ERROR,
 )
+
 PASSWORD_MISMATCH_ERROR = "Passwords do not match. Please try again."
 PASSWORD_LENGTH_ERROR = "Password must be at least 6 characters long."
+# Availability is checked once typing pauses for this long
+AVAILABILITY_DEBOUNCE_MS = 300
 
 
 class RegisterUserAIO(dbc.Card):
@@ -42,6 +49,14 @@ class RegisterUserAIO(dbc.Card):
                 "aio_id": aio_id,
             }
 
+        @staticmethod
+        def username_feedback(aio_id):
+            return {
+                "component": "RegisterUserAIO",
+                "subcomponent": "username_feedback",
+                "aio_id": aio_id,
+            }
+
         @staticmethod
         def email_input(aio_id):
             return {
@@ -50,6 +65,14 @@ class RegisterUserAIO(dbc.Card):
                 "aio_id": aio_id,
             }
 
+        @staticmethod
+        def email_feedback(aio_id):
+            return {
+                "component": "RegisterUserAIO",
+                "subcomponent": "email_feedback",
+                "aio_id": aio_id,
+            }
+
         @staticmethod
         def password_input(aio_id):
             return {
@@ -133,7 +156,9 @@ class RegisterUserAIO(dbc.Card):
                         id=self.ids.username_input(aio_id),
                         type="text",
                         placeholder="Enter username",
+                        debounce=AVAILABILITY_DEBOUNCE_MS,
                     ),
+                    dbc.FormFeedback(id=self.ids.username_feedback(aio_id)),
                 ],
             ),
             html.Div(
@@ -146,7 +171,9 @@ class RegisterUserAIO(dbc.Card):
                         id=self.ids.email_input(aio_id),
                         type="email",
                         placeholder="Enter email",
+                        debounce=AVAILABILITY_DEBOUNCE_MS,
                     ),
+                    dbc.FormFeedback(id=self.ids.email_feedback(aio_id)),
                 ],
             ),
         ]
@@ -257,6 +284,49 @@ class RegisterUserAIO(dbc.Card):
             **card_props,
         )
 
+    @callback(
+        Output(ids.username_input(MATCH), "valid"),
+        Output(ids.username_input(MATCH), "invalid"),
+        Output(ids.username_feedback(MATCH), "children"),
+        Output(ids.username_feedback(MATCH), "type"),
+        Input(ids.username_input(MATCH), "value"),
+        prevent_initial_call=True,
+    )
+    def check_username(username):
+        """Show whether the username being typed is valid and available."""
+        if not username:
+            return False, False, "", "invalid"
+        if not re.match(USERNAME_REGEX_PATTERN, username):
+            return False, True, USERNAME_REGEX_PATTERN_ERROR, "invalid"
+        # Throttled per client, or it would list the registered usernames
+        message = check_lookup_throttle(request.remote_addr)
+        if message is not None:
+            return False, True, message, "invalid"
+        if is_username_taken(username):
+            return False, True, "Username is already taken.", "invalid"
+        return True, False, "Username is available.", "valid"
+
+    @callback(
+        Output(ids.email_input(MATCH), "valid"),
+        Output(ids.email_input(MATCH), "invalid"),
+        Output(ids.email_feedback(MATCH), "children"),
+        Output(ids.email_feedback(MATCH), "type"),
+        Input(ids.email_input(MATCH), "value"),
+        prevent_initial_call=True,
+    )
+    def check_email(email):
+        """Show whether the email being typed is valid and not registered."""
+        if not email:
+            return False, False, "", "invalid"
+        if not re.match(EMAIL_REGEX_PATTERN, email):
+            return False, True, EMAIL_REGEX_PATTERN_ERROR, "invalid"
+        message = check_lookup_throttle(request.remote_addr)
+        if message is not None:
+            return False, True, message, "invalid"
+        if is_email_taken(email):
+            return False, True, "Email is already registered.", "invalid"
+        return True, False, "", "valid"
+
     @callback(
         [
             Output(ids.alert(MATCH), "children"),
@@ -401,6 +471,7 @@ class RegisterUserAIO(dbc.Card):
             password=password,
             first_name=first_name if first_name else None,
             last_name=last_name if last_name else None,
+            remote_addr=request.remote_addr,
         )
 
         if success:
@@ -1,398 +1,345 @@
 """
 Timer component for App.
 
-This module provides a Dash-based timer component that can replace the chat interface.
-"""
-
-from dash import html, dcc, Input, Output, State, callback, clientside_callback
-
+This module provides a Dash-based timer component, the layout of the timer
+applet. Every instance is addressed by its applet id, so any number of
+timers can be on a page, and its state is kept in the applet's stored
+state (see ``zendo.services.timer``).
 
-def create_timer_layout(timer_config):
-    """
-    Create the timer applet layout.
+The display is computed from the state's timestamps in the browser, so the
+server is only contacted to start, pause or reset the timer, and the time
+stays right when the tab is throttled. The timestamps come from the server
+clock, as do the expiries, and the state sent to the browser carries the
+server time (``server_now``) so the display can correct for the browser
+clock.
+"""
 
-    Parameters
-    ----------
-    timer_config : dict
-        Timer configuration containing mode and duration.
+from __future__ import annotations
 
-    Returns
-    -------
-    html.Div
-        The timer interface component.
-    """
-    mode = timer_config.get("mode", "stopwatch")
-    duration = timer_config.get("duration", 0)
+from typing import Any
 
-    if mode == "countdown":
-        title = "Countdown Timer"
-        initial_minutes = duration // 60
-        initial_seconds = duration % 60
-        initial_display = f"{initial_minutes}:{initial_seconds:02d}"
-    else:
-        title = "Stopwatch"
-        initial_display = "0:00"
+import dash
+from dash import (
+    MATCH,
+    ClientsideFunction,
+    Input,
+    Output,
+    State,
+    callback,
+    clientside_callback,
+    dcc,
+    html,
+)
 
-    return html.Div(
-        [
-            # Timer state stores
-            dcc.Store(
-                id="timer-state",
-                data={
-                    "mode": mode,
-                    "duration": duration,
-                    "current_time": duration if mode == "countdown" else 0,
-                    "is_running": False,
-                    "is_paused": False,
-                },
-            ),
-            dcc.Store(id="timer-display-store", data=initial_display),
-            # Timer interface
-            html.Div(
-                [
-                    # Clean header
-                    html.Div(
-                        [
-                            html.H3(
-                                title,
-                                style={
-                                    "margin": "0",
-                                    "color": "#1f2937",
-                                    "fontWeight": "500",
-                                    "fontSize": "1.25rem",
-                                    "textAlign": "center",
-                                },
-                            )
-                        ],
-                        style={
-                            "padding": "1.5rem 2rem 1rem 2rem",
-                            "background": "#ffffff",
-                            "borderBottom": "1px solid #f3f4f6",
-                        },
-                    ),
-                    # Timer content
-                    html.Div(
-                        [
-                            # Timer display
-                            html.Div(
-                                id="timer-display",
-                                children=initial_display,
-                                style={
-                                    "fontSize": "4rem",
-                                    "fontWeight": "300",
-                                    "marginBottom": "2rem",
-                                    "fontFamily": "'SF Mono', 'Monaco', 'Inconsolata', 'Roboto Mono', monospace",
-                                    "minWidth": "200px",
-                                    "textAlign": "center",
-                                    "color": "#1f2937",
-                                    "letterSpacing": "0.05em",
-                                },
-                            ),
-                            # Control buttons
-                            html.Div(
-                                [
-                                    html.Button(
-                                        "Start",
-                                        id="timer-start-btn",
-                                        style={
-                                            "background": "#374151",
-                                            "color": "white",
-                                            "border": "none",
-                                            "borderRadius": "8px",
-                                            "padding": "12px 24px",
-                                            "fontSize": "14px",
-                                            "fontWeight": "500",
-                                            "cursor": "pointer",
-                                            "marginRight": "8px",
-                                            "minHeight": "44px",
-                                            "transition": "background-color 0.2s ease",
-                                        },
-                                    ),
-                                    html.Button(
-                                        "Pause",
-                                        id="timer-pause-btn",
-                                        style={
-                                            "background": "#6b7280",
-                                            "color": "white",
-                                            "border": "none",
-                                            "borderRadius": "8px",
-                                            "padding": "12px 24px",
-                                            "fontSize": "14px",
-                                            "fontWeight": "500",
-                                            "cursor": "pointer",
-                                            "marginRight": "8px",
-                                            "minHeight": "44px",
-                                            "transition": "background-color 0.2s ease",
-                                        },
-                                    ),
-                                    html.Button(
-                                        "Reset",
-                                        id="timer-reset-btn",
-                                        style={
-                                            "background": "#ffffff",
-                                            "color": "#374151",
-                                            "border": "1px solid #d1d5db",
-                                            "borderRadius": "8px",
-                                            "padding": "12px 24px",
-                                            "fontSize": "14px",
-                                            "fontWeight": "500",
-                                            "cursor": "pointer",
-                                            "marginRight": "8px",
-                                            "minHeight": "44px",
-                                            "transition": "all 0.2s ease",
-                                        },
-                                    ),
-                                ],
-                                style={
-                                    "display": "flex",
-                                    "justifyContent": "center",
-                                    "marginBottom": "2rem",
-                                    "flexWrap": "wrap",
-                                    "gap": "8px",
-                                },
-                            ),
-                            # Close button
-                            html.Div(
-                                [
-                                    html.Button(
-                                        "Close Timer",
-                                        id="timer-close-btn",
-                                        style={
-                                            "background": "#ffffff",
-                                            "color": "#6b7280",
-                                            "border": "1px solid #e5e7eb",
-                                            "borderRadius": "8px",
-                                            "padding": "8px 16px",
-                                            "fontSize": "14px",
-                                            "fontWeight": "500",
-                                            "cursor": "pointer",
-                                            "transition": "all 0.2s ease",
-                                        },
-                                    )
-                                ],
-                                style={"textAlign": "center"},
-                            ),
-                            # Interval component for timer updates
-                            dcc.Interval(
-                                id="timer-interval",
-                                interval=1000,  # Update every second
-                                n_intervals=0,
-                                disabled=True,
-                            ),
-                        ],
-                        style={
-                            "padding": "2rem",
-                            "background": "#ffffff",
-                            "display": "flex",
-                            "flexDirection": "column",
-                            "alignItems": "center",
-                            "justifyContent": "center",
-                        },
-                    ),
-                ],
-                style={
-                    "maxWidth": "500px",
-                    "margin": "2rem auto",
-                    "background": "#ffffff",
-                    "border": "1px solid #e5e7eb",
-                    "borderRadius": "12px",
-                    "boxShadow": "0 1px 3px 0 rgba(0, 0, 0, 0.1)",
-                    "fontFamily": "-apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', sans-serif",
-                },
-            ),
-        ],
-        style={
-            "height": "100%",
-            "display": "flex",
-            "flexDirection": "column",
-            "fontFamily": "-apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', sans-serif",
-            "background": "#ffffff",
-        },
-    )
+from zendo.services import auth
+from zendo.services.applet_state import get_applet, update_applet
+from zendo.services.timer import (
+    elapsed_ms,
+    init_timer_state,
+    now_ms,
+    schedule_expiry,
+    update_timer_state,
+)
 
+# Attempts at a start/pause/reset when other requests change the timer
+UPDATE_ATTEMPTS = 3
 
-# Timer control callbacks
-@callback(
-    [
-        Output("timer-state", "data"),
-        Output("timer-interval", "disabled"),
-        Output("timer-start-btn", "children"),
-        Output("timer-start-btn", "disabled"),
-    ],
-    [
-        Input("timer-start-btn", "n_clicks"),
-        Input("timer-pause-btn", "n_clicks"),
-        Input("timer-reset-btn", "n_clicks"),
-    ],
-    [State("timer-state", "data")],
-    prevent_initial_call=True,
-)
-def control_timer(start_clicks, pause_clicks, reset_clicks, timer_state):
-    """
-    Control timer start, pause, and reset functionality.
+BUTTON_STYLE = {
+    "border": "none",
+    "borderRadius": "8px",
+    "padding": "12px 24px",
+    "fontSize": "14px",
+    "fontWeight": "500",
+    "cursor": "pointer",
+    "marginRight": "8px",
+    "minHeight": "44px",
+    "transition": "background-color 0.2s ease",
+}
 
-    Parameters
-    ----------
-    start_clicks : int
-        Number of start button clicks.
-    pause_clicks : int
-        Number of pause button clicks.
-    reset_clicks : int
-        Number of reset button clicks.
-    timer_state : dict
-        Current timer state.
 
-    Returns
-    -------
-    tuple
-        Updated timer state, interval disabled status, button text, and button disabled status.
-    """
-    import dash
+def format_display(state: dict[str, Any]) -> tuple[str, str]:
+    """Display text and class of a timer state, as drawn by timer.tick."""
+    seconds = int(elapsed_ms(state) // 1000)
+    countdown = state.get("mode") == "countdown"
+    if countdown:
+        seconds = state["duration"] - seconds
+    sign = "-" if seconds < 0 else ""
+    text = f"{sign}{abs(seconds) // 60}:{abs(seconds) % 60:02d}"
+    expired = countdown and seconds <= 0
+    return text, "timer-display expired" if expired else "timer-display"
 
-    ctx = dash.callback_context
 
-    if not ctx.triggered:
-        return timer_state, True, "Start", False
+def browser_state(state: dict[str, Any]) -> dict[str, Any]:
+    """Timer state as sent to the browser, with the current server time."""
+    return {**state, "server_now": now_ms()}
 
-    button_id = ctx.triggered[0]["prop_id"].split(".")[0]
 
-    if button_id == "timer-start-btn":
-        if not timer_state["is_running"]:
-            # Start the timer
-            timer_state["is_running"] = True
-            timer_state["is_paused"] = False
-            return timer_state, False, "Running...", True
+def start_button_props(state: dict[str, Any]) -> tuple[str, bool]:
+    """Label of the start button and whether it is disabled."""
+    if state.get("started_at") is not None:
+        return "Running...", True
+    if state.get("accumulated"):
+        return "Resume", False
+    return "Start", False
 
-    elif button_id == "timer-pause-btn":
-        if timer_state["is_running"]:
-            # Pause the timer
-            timer_state["is_running"] = False
-            timer_state["is_paused"] = True
-            return timer_state, True, "Resume", False
 
-    elif button_id == "timer-reset-btn":
-        # Reset the timer
-        initial_time = (
-            timer_state["duration"] if timer_state["mode"] == "countdown" else 0
-        )
-        timer_state["current_time"] = initial_time
-        timer_state["is_running"] = False
-        timer_state["is_paused"] = False
-        return timer_state, True, "Start", False
+class TimerAIO(html.Div):
+    class ids:
+        """Pattern-matching callback IDs for TimerAIO subcomponents."""
 
-    return timer_state, True, "Start", False
+        @staticmethod
+        def state(aio_id: str) -> dict:
+            return {
+                "component": "TimerAIO",
+                "subcomponent": "state",
+                "aio_id": aio_id,
+            }
 
+        @staticmethod
+        def display(aio_id: str) -> dict:
+            return {
+                "component": "TimerAIO",
+                "subcomponent": "display",
+                "aio_id": aio_id,
+            }
 
-@callback(
-    [
-        Output("timer-state", "data", allow_duplicate=True),
-        Output("timer-display", "children"),
-        Output("timer-display", "style"),
-    ],
-    [Input("timer-interval", "n_intervals")],
-    [State("timer-state", "data")],
-    prevent_initial_call=True,
-)
-def update_timer_display(n_intervals, timer_state):
-    """
-    Update the timer display every second.
+        @staticmethod
+        def interval(aio_id: str) -> dict:
+            return {
+                "component": "TimerAIO",
+                "subcomponent": "interval",
+                "aio_id": aio_id,
+            }
 
-    Parameters
-    ----------
-    n_intervals : int
-        Number of interval triggers.
-    timer_state : dict
-        Current timer state.
+        @staticmethod
+        def start_button(aio_id: str) -> dict:
+            return {
+                "component": "TimerAIO",
+                "subcomponent": "start_button",
+                "aio_id": aio_id,
+            }
 
-    Returns
-    -------
-    tuple
-        Updated timer state, display text, and display style.
-    """
-    if not timer_state["is_running"]:
-        # Format current time for display
-        current_time = timer_state["current_time"]
-        minutes = abs(current_time) // 60
-        seconds = abs(current_time) % 60
-        sign = "-" if current_time < 0 else ""
-        display_text = f"{sign}{minutes}:{seconds:02d}"
+        @staticmethod
+        def pause_button(aio_id: str) -> dict:
+            return {
+                "component": "TimerAIO",
+                "subcomponent": "pause_button",
+                "aio_id": aio_id,
+            }
 
-        # Change color if countdown is negative
-        display_style = {
-            "fontSize": "4rem",
-            "fontWeight": "300",
-            "marginBottom": "2rem",
-            "fontFamily": "'SF Mono', 'Monaco', 'Inconsolata', 'Roboto Mono', monospace",
-            "minWidth": "200px",
-            "textAlign": "center",
-            "color": "#ef4444"
-            if timer_state["mode"] == "countdown" and current_time <= 0
-            else "#1f2937",
-            "letterSpacing": "0.05em",
-        }
+        @staticmethod
+        def reset_button(aio_id: str) -> dict:
+            return {
+                "component": "TimerAIO",
+                "subcomponent": "reset_button",
+                "aio_id": aio_id,
+            }
 
-        return timer_state, display_text, display_style
+    ids = ids
 
-    # Update timer
-    if timer_state["mode"] == "countdown":
-        timer_state["current_time"] -= 1
-    else:
-        timer_state["current_time"] += 1
+    def __init__(self, aio_id: str, state: dict[str, Any] | None = None):
+        """
+        Create the timer interface.
 
-    # Format time for display
-    current_time = timer_state["current_time"]
-    minutes = abs(current_time) // 60
-    seconds = abs(current_time) % 60
-    sign = "-" if current_time < 0 else ""
-    display_text = f"{sign}{minutes}:{seconds:02d}"
+        Parameters
+        ----------
+        aio_id : str
+            Id of the timer applet.
+        state : dict, optional
+            Stored timer state, by default a stopped stopwatch.
+        """
+        state = {**init_timer_state(), **(state or {})}
+        title = "Countdown Timer" if state["mode"] == "countdown" else "Stopwatch"
+        display, display_class = format_display(state)
+        start_label, start_disabled = start_button_props(state)
+        super().__init__(
+            [
+                dcc.Store(id=self.ids.state(aio_id), data=browser_state(state)),
+                # Timer interface
+                html.Div(
+                    [
+                        # Clean header
+                        html.Div(
+                            [
+                                html.H3(
+                                    title,
+                                    style={
+                                        "margin": "0",
+                                        "color": "#1f2937",
+                                        "fontWeight": "500",
+                                        "fontSize": "1.25rem",
+                                        "textAlign": "center",
+                                    },
+                                )
+                            ],
+                            style={
+                                "padding": "1.5rem 2rem 1rem 2rem",
+                                "background": "#ffffff",
+                                "borderBottom": "1px solid #f3f4f6",
+                            },
+                        ),
+                        # Timer content
+                        html.Div(
+                            [
+                                # Timer display
+                                html.Div(
+                                    display,
+                                    id=self.ids.display(aio_id),
+                                    className=display_class,
+                                    style={
+                                        "fontSize": "4rem",
+                                        "fontWeight": "300",
+                                        "marginBottom": "2rem",
+                                        "fontFamily": "'SF Mono', 'Monaco', 'Inconsolata', 'Roboto Mono', monospace",
+                                        "minWidth": "200px",
+                                        "textAlign": "center",
+                                        "letterSpacing": "0.05em",
+                                    },
+                                ),
+                                # Control buttons
+                                html.Div(
+                                    [
+                                        html.Button(
+                                            start_label,
+                                            id=self.ids.start_button(aio_id),
+                                            disabled=start_disabled,
+                                            style={
+                                                **BUTTON_STYLE,
+                                                "background": "#374151",
+                                                "color": "white",
+                                            },
+                                        ),
+                                        html.Button(
+                                            "Pause",
+                                            id=self.ids.pause_button(aio_id),
+                                            style={
+                                                **BUTTON_STYLE,
+                                                "background": "#6b7280",
+                                                "color": "white",
+                                            },
+                                        ),
+                                        html.Button(
+                                            "Reset",
+                                            id=self.ids.reset_button(aio_id),
+                                            style={
+                                                **BUTTON_STYLE,
+                                                "background": "#ffffff",
+                                                "color": "#374151",
+                                                "border": "1px solid #d1d5db",
+                                                "transition": "all 0.2s ease",
+                                            },
+                                        ),
+                                    ],
+                                    style={
+                                        "display": "flex",
+                                        "justifyContent": "center",
+                                        "marginBottom": "2rem",
+                                        "flexWrap": "wrap",
+                                        "gap": "8px",
+                                    },
+                                ),
+                                # Redraws the display in the browser while running
+                                dcc.Interval(
+                                    id=self.ids.interval(aio_id),
+                                    interval=250,
+                                    n_intervals=0,
+                                    disabled=state["started_at"] is None,
+                                ),
+                            ],
+                            style={
+                                "padding": "2rem",
+                                "background": "#ffffff",
+                                "display": "flex",
+                                "flexDirection": "column",
+                                "alignItems": "center",
+                                "justifyContent": "center",
+                            },
+                        ),
+                    ],
+                    style={
+                        "maxWidth": "500px",
+                        "margin": "2rem auto",
+                        "background": "#ffffff",
+                        "border": "1px solid #e5e7eb",
+                        "borderRadius": "12px",
+                        "boxShadow": "0 1px 3px 0 rgba(0, 0, 0, 0.1)",
+                        "fontFamily": "-apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', sans-serif",
+                    },
+                ),
+            ],
+        )
 
-    # Change color if countdown reaches zero or goes negative
-    display_style = {
-        "fontSize": "4rem",
-        "fontWeight": "300",
-        "marginBottom": "2rem",
-        "fontFamily": "'SF Mono', 'Monaco', 'Inconsolata', 'Roboto Mono', monospace",
-        "minWidth": "200px",
-        "textAlign": "center",
-        "color": "#ef4444"
-        if timer_state["mode"] == "countdown" and current_time <= 0
-        else "#1f2937",
-        "letterSpacing": "0.05em",
-    }
+    # Timer control callbacks
+    @callback(
+        Output(ids.state(MATCH), "data"),
+        Output(ids.interval(MATCH), "disabled"),
+        Output(ids.start_button(MATCH), "children"),
+        Output(ids.start_button(MATCH), "disabled"),
+        Input(ids.start_button(MATCH), "n_clicks"),
+        Input(ids.pause_button(MATCH), "n_clicks"),
+        Input(ids.reset_button(MATCH), "n_clicks"),
+        prevent_initial_call=True,
+    )
+    def control_timer(start_clicks, pause_clicks, reset_clicks):
+        """
+        Start, pause or reset a timer and store its new state.
 
-    return timer_state, display_text, display_style
+        Parameters
+        ----------
+        start_clicks : int
+            Number of start button clicks.
+        pause_clicks : int
+            Number of pause button clicks.
+        reset_clicks : int
+            Number of reset button clicks.
 
+        Returns
+        -------
+        tuple
+            Updated timer state, interval disabled status, button text, and
+            button disabled status.
+        """
+        current_user = auth.current_user
+        if not current_user or not current_user.is_authenticated:
+            return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+        triggered = dash.ctx.triggered_id
+        applet_id = triggered["aio_id"]
+        action = {
+            "start_button": "start",
+            "pause_button": "pause",
+            "reset_button": "reset",
+        }[triggered["subcomponent"]]
+        # Read again and retried when another request changed the timer
+        # between the read and the write
+        for _ in range(UPDATE_ATTEMPTS):
+            success, msg, applet_state = get_applet(current_user.id, applet_id)
+            if not success:
+                return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+            # Stamped with the server clock, like expiries and /send actions
+            state = update_timer_state(applet_state.state_data, action)
+            success, msg, _ = update_applet(
+                current_user.id,
+                applet_id,
+                state_data=state,
+                revision=applet_state.revision,
+            )
+            if success:
+                break
+        else:
+            return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+        schedule_expiry(applet_id, state)
+        return (
+            browser_state(state),
+            state["started_at"] is None,
+            *start_button_props(state),
+        )
 
-# Client-side callback for sound notification when countdown reaches zero
-clientside_callback(
-    """
-    function(timer_state) {
-        if (timer_state && timer_state.mode === 'countdown' && 
-            timer_state.current_time === 0 && timer_state.is_running) {
-            // Play a simple beep sound
-            try {
-                const audioContext = new (window.AudioContext || window.webkitAudioContext)();
-                const oscillator = audioContext.createOscillator();
-                const gainNode = audioContext.createGain();
-                
-                oscillator.connect(gainNode);
-                gainNode.connect(audioContext.destination);
-                
-                oscillator.frequency.value = 800;
-                oscillator.type = 'sine';
-                
-                gainNode.gain.setValueAtTime(0.3, audioContext.currentTime);
-                gainNode.gain.exponentialRampToValueAtTime(0.01, audioContext.currentTime + 0.5);
-                
-                oscillator.start(audioContext.currentTime);
-                oscillator.stop(audioContext.currentTime + 0.5);
-            } catch (e) {
-                console.log('Audio notification not available');
-            }
-        }
-        return window.dash_clientside.no_update;
-    }
-    """,
-    Output("timer-display", "id"),
-    Input("timer-state", "data"),
-)
+    # Redraw the display in the browser, and beep when a countdown expires
+    clientside_callback(
+        ClientsideFunction(namespace="timer", function_name="tick"),
+        Output(ids.display(MATCH), "children"),
+        Output(ids.display(MATCH), "className"),
+        Input(ids.interval(MATCH), "n_intervals"),
+        Input(ids.state(MATCH), "data"),
+        State(ids.display(MATCH), "className"),
+    )
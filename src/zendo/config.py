@@ -1,3 +1,4 @@
+import os
 from dataclasses import dataclass, field
 from pathlib import Path
 
@@ -13,9 +14,141 @@ def get_user_config_dir() -> Path:
     return Path(pth).resolve()
 
 
+def env(name: str, default: str | None = None) -> str | None:
+    """Get a configuration value from the ``ZENDO_*`` environment variables."""
+    return os.environ.get(f"{appname.upper()}_{name}", default)
+
+
+def env_int(name: str, default: int) -> int:
+    """Get an integer configuration value from the environment."""
+    return int(env(name, str(default)))
+
+
 @dataclass
 class Config:
     user_config_dir: Path = field(default_factory=get_user_config_dir)
+    # Database engine settings
+    database_url: str = field(
+        default_factory=lambda: env(
+            "DATABASE_URL",
+            f"sqlite:///{os.path.join(os.getcwd(), 'data', 'database.db')}",
+        )
+    )
+    database_pool: str = field(default_factory=lambda: env("DATABASE_POOL", "queue"))
+    database_pool_size: int = field(
+        default_factory=lambda: env_int("DATABASE_POOL_SIZE", 5)
+    )
+    sqlite_journal_mode: str = field(
+        default_factory=lambda: env("SQLITE_JOURNAL_MODE", "WAL")
+    )
+    sqlite_synchronous: str = field(
+        default_factory=lambda: env("SQLITE_SYNCHRONOUS", "NORMAL")
+    )
+    sqlite_busy_timeout: int = field(
+        default_factory=lambda: env_int("SQLITE_BUSY_TIMEOUT", 5000)
+    )
+    sqlite_mmap_size: int = field(
+        default_factory=lambda: env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)
+    )
+    # Applet states whose JSON reaches the threshold (bytes) are stored
+    # encoded with the codec: json, zlib, zstd or msgpack
+    state_codec: str = field(default_factory=lambda: env("STATE_CODEC", "zlib"))
+    state_codec_threshold: int = field(
+        default_factory=lambda: env_int("STATE_CODEC_THRESHOLD", 64 * 1024)
+    )
+    # PID of the `zendo serve` master, read by `zendo reload`
+    pid_file: Path = field(
+        default_factory=lambda: Path(
+            env("PID_FILE", os.path.join(os.getcwd(), "data", f"{appname}.pid"))
+        )
+    )
+    # Threads running the (synchronous) Dash views behind the ASGI app
+    asgi_threads: int = field(default_factory=lambda: env_int("ASGI_THREADS", 10))
+    # Password hashing, werkzeug method notation with the cost parameters,
+    # run in this many processes (0 hashes in the request thread)
+    password_hash_method: str = field(
+        default_factory=lambda: env("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+    )
+    password_hash_workers: int = field(
+        default_factory=lambda: env_int(
+            "PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)
+        )
+    )
+    # Maximum hashing jobs in flight, further logins are turned away
+    password_hash_queue: int = field(
+        default_factory=lambda: env_int("PASSWORD_HASH_QUEUE", 8)
+    )
+    # "session" loads the logged-in user for every request (from the user
+    # cache), "token" serves requests from signed claims in the session
+    auth_mode: str = field(default_factory=lambda: env("AUTH_MODE", "session"))
+    # Lifetime of claims tokens in seconds, and entries in their denylist
+    auth_token_ttl: int = field(default_factory=lambda: env_int("AUTH_TOKEN_TTL", 900))
+    # Login attempts allowed per minute (and at once) for a username and for
+    # a client address, and the number of buckets kept for each
+    login_attempts_per_username: int = field(
+        default_factory=lambda: env_int("LOGIN_ATTEMPTS_PER_USERNAME", 5)
+    )
+    login_attempts_per_ip: int = field(
+        default_factory=lambda: env_int("LOGIN_ATTEMPTS_PER_IP", 30)
+    )
+    # Username/email availability lookups of the registration form allowed
+    # per minute (and at once) for a client address
+    login_lookups_per_ip: int = field(
+        default_factory=lambda: env_int("LOGIN_LOOKUPS_PER_IP", 60)
+    )
+    login_throttle_size: int = field(
+        default_factory=lambda: env_int("LOGIN_THROTTLE_SIZE", 10000)
+    )
+    # Seconds after which the filter of taken usernames/emails is rebuilt
+    login_filter_ttl: int = field(
+        default_factory=lambda: env_int("LOGIN_FILTER_TTL", 300)
+    )
+    # Read-through cache of applet states, per process
+    applet_cache_size: int = field(
+        default_factory=lambda: env_int("APPLET_CACHE_SIZE", 256)
+    )
+    applet_cache_ttl: int = field(
+        default_factory=lambda: env_int("APPLET_CACHE_TTL", 300)
+    )
+    # Cache of logged-in users loaded by Flask-Login, per process
+    user_cache_size: int = field(
+        default_factory=lambda: env_int("USER_CACHE_SIZE", 1024)
+    )
+    user_cache_ttl: int = field(default_factory=lambda: env_int("USER_CACHE_TTL", 60))
+    # Threads running applet ticks, and the random delay added to each tick
+    # as a fraction of the applet's tick interval
+    applet_tick_workers: int = field(
+        default_factory=lambda: env_int("APPLET_TICK_WORKERS", 4)
+    )
+    applet_tick_jitter: float = field(
+        default_factory=lambda: float(env("APPLET_TICK_JITTER", "0.1"))
+    )
+    # Ticks and timer expiries run in the one process of the host holding
+    # the lock on this file. Every this many seconds it picks up the applets
+    # and timers started in other processes, and the others retry the lock.
+    scheduler_lock_file: Path = field(
+        default_factory=lambda: Path(
+            env(
+                "SCHEDULER_LOCK_FILE",
+                os.path.join(os.getcwd(), "data", "scheduler.lock"),
+            )
+        )
+    )
+    scheduler_sync_interval: float = field(
+        default_factory=lambda: float(env("SCHEDULER_SYNC_INTERVAL", "5"))
+    )
+    # Threads running background callbacks (e.g. /send), per process, and
+    # the directory of their results, shared by the processes of a server
+    job_workers: int = field(default_factory=lambda: env_int("JOB_WORKERS", 4))
+    jobs_dir: Path = field(
+        default_factory=lambda: Path(
+            env("JOBS_DIR", os.path.join(os.getcwd(), "data", "jobs"))
+        )
+    )
+    # Event-sourced applets fold their events into a snapshot every N events
+    applet_snapshot_every: int = field(
+        default_factory=lambda: env_int("APPLET_SNAPSHOT_EVERY", 100)
+    )
 
     @property
     def applets_dir(self) -> Path:
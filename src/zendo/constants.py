@@ -1,6 +1,16 @@
-import uuid
+from zendo.config import appname, env
 
-from zendo.config import appname
-
-APP_ID = f"{appname}-{uuid.uuid4()}"
+# Must be the same in every worker process, callbacks are registered under
+# component IDs derived from it
+APP_ID = env("APP_ID", appname)
 APP_MAIN_CONTENT_ID = f"{APP_ID}-current-layout"
+
+# Formats of the usernames and emails of new accounts, checked by the
+# registration form and the bulk import
+EMAIL_REGEX_PATTERN = r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$"
+EMAIL_REGEX_PATTERN_ERROR = "Invalid email format. Please enter a valid email address."
+USERNAME_REGEX_PATTERN = r"^[a-zA-Z0-9_-]{3,20}$"
+USERNAME_REGEX_PATTERN_ERROR = (
+    "Username must be 3-20 characters long and can only contain letters, "
+    "numbers, underscores, and hyphens."
+)
@@ -0,0 +1,125 @@
+"""
+Database engine configuration.
+
+This module translates the database settings of :class:`zendo.config.Config`
+into Flask-SQLAlchemy engine options and installs the connection hooks that
+tune every new SQLite connection (WAL journaling, busy timeout, mmap).
+"""
+
+import os
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool, SingletonThreadPool
+
+from zendo.config import Config
+
+__all__ = [
+    "configure_database",
+    "engine_options",
+    "install_sqlite_pragmas",
+    "is_sqlite",
+]
+
+POOL_CLASSES = {
+    "queue": QueuePool,
+    # one connection per thread, reused by every request served by it
+    "thread": SingletonThreadPool,
+}
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def is_sqlite_memory(url: str) -> bool:
+    return is_sqlite(url) and make_url(url).database in {None, "", ":memory:"}
+
+
+def engine_options(config: Config) -> dict:
+    """
+    Build the engine options for the configured database.
+
+    Parameters
+    ----------
+    config : Config
+        Application configuration.
+
+    Returns
+    -------
+    dict
+        Keyword arguments for :func:`sqlalchemy.create_engine`.
+    """
+    try:
+        poolclass = POOL_CLASSES[config.database_pool]
+    except KeyError:
+        raise ValueError(
+            f"Unknown database pool '{config.database_pool}', "
+            f"expected one of: {', '.join(POOL_CLASSES)}"
+        ) from None
+    if is_sqlite_memory(config.database_url):
+        # Flask-SQLAlchemy shares a single connection for in-memory databases
+        return {}
+    options = {
+        "poolclass": poolclass,
+        "pool_size": config.database_pool_size,
+    }
+    if is_sqlite(config.database_url):
+        options["connect_args"] = {
+            # sqlite3 waits this long on a locked database before raising
+            "timeout": config.sqlite_busy_timeout / 1000,
+            # connections are handed between request threads by the pool
+            "check_same_thread": False,
+        }
+    return options
+
+
+def install_sqlite_pragmas(engine: Engine, config: Config) -> None:
+    """
+    Apply the SQLite pragmas to every connection opened by the engine.
+
+    Parameters
+    ----------
+    engine : Engine
+        Engine to install the connection hook on.
+    config : Config
+        Application configuration.
+    """
+    pragmas = [
+        ("journal_mode", config.sqlite_journal_mode),
+        ("synchronous", config.sqlite_synchronous),
+        ("busy_timeout", config.sqlite_busy_timeout),
+        ("mmap_size", config.sqlite_mmap_size),
+    ]
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def configure_database(server: Flask, config: Config) -> None:
+    """
+    Configure Flask-SQLAlchemy for the Flask server.
+
+    Must be called before ``db.init_app``; call :func:`install_sqlite_pragmas`
+    on ``db.engine`` afterwards, before the first connection is made.
+
+    Parameters
+    ----------
+    server : Flask
+        The Flask server of the Dash application.
+    config : Config
+        Application configuration.
+    """
+    url = make_url(config.database_url)
+    if is_sqlite(config.database_url) and url.database:
+        if os.path.isabs(url.database):
+            os.makedirs(os.path.dirname(url.database), exist_ok=True)
+    server.config["SQLALCHEMY_DATABASE_URI"] = config.database_url
+    server.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(config)
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+import asyncio
 from collections.abc import Mapping
 from dataclasses import dataclass, field
+import inspect
 from typing import Any, ClassVar, Type, TypedDict
 import uuid
 
@@ -18,13 +20,26 @@ from dash import (
     html,
 )
 
+from zendo.components.timer import TimerAIO
+from zendo.models import ChatMessage
 from zendo.services import auth
 from zendo.services.applet_state import (
     create_applet,
     get_applet,
     list_applets,
+    patch_applet,
     update_applet,
 )
+from zendo.services.applet_ticks import schedule_applet_tick
+from zendo.services.chat import append_messages, latest_conversation_id, list_messages
+from zendo.services.jobs import (
+    JobCancelled,
+    check_cancelled,
+    job_cancelled,
+    job_manager,
+)
+from zendo.services.json_patch import JsonPatch, MergePatch, StatePatch
+from zendo.services.timer import init_timer_state, schedule_expiry, update_timer_state
 
 
 @dataclass
@@ -32,6 +47,17 @@ class Applet:
     name: ClassVar[str]
     description: ClassVar[str | None] = None
     aliases: ClassVar[list[str] | None] = None
+    # "events" stores each change as an event row and compacts them into
+    # periodic snapshots, suited for append-heavy applets
+    storage: ClassVar[str] = "state"
+    # Seconds between calls of tick, None for applets without periodic work
+    tick_interval: ClassVar[float | None] = None
+    # Ticks of this applet type running at once, across all its instances
+    max_concurrent_ticks: ClassVar[int] = 1
+    # For an async def process: calls running at once, across all instances,
+    # and seconds each may take (None waits forever)
+    max_concurrent_process: ClassVar[int] = 32
+    process_timeout: ClassVar[float | None] = 60
     id: str = field(default_factory=lambda: str(uuid.uuid4()))
 
     class ids:
@@ -51,10 +77,10 @@ class Applet:
                 "aio_id": aio_id,
             }
 
-    def render(self, aio_id: str) -> html.Div:
+    def render(self, aio_id: str, state: dict[str, Any] | None = None) -> html.Div:
         return html.Div(
             [
-                dcc.Store(id=Applet.ids.state(aio_id), data={}),
+                dcc.Store(id=Applet.ids.state(aio_id), data=state or {}),
                 self.layout(),
             ],
             id=Applet.ids.container(aio_id),
@@ -66,9 +92,35 @@ class Applet:
 
     def process(
         self, input: str, state: dict[str, Any] | None = None
-    ) -> dict[str, Any]:
+    ) -> dict[str, Any] | StatePatch:
+        """Process an input and return the new state.
+
+        Applets that change a small part of a large state should return a
+        ``JsonPatch`` or ``MergePatch`` delta instead of the full state, so
+        only the change is written.
+
+        Messages are processed in a background job. Slow applets can accept
+        a ``progress`` keyword argument, a function to call with a status
+        text shown while they run. It raises ``JobCancelled`` once a newer
+        message was sent, which stops the applet there.
+
+        Applets waiting on I/O can define ``async def process``. It is
+        awaited on the shared event loop instead of holding a thread,
+        limited by ``max_concurrent_process`` and ``process_timeout``.
+        """
         raise NotImplementedError("Applet must implement process method.")
 
+    def tick(
+        self, state: dict[str, Any], now: float
+    ) -> dict[str, Any] | StatePatch | None:
+        """Do periodic work and return the new state, a patch or None.
+
+        Called about every ``tick_interval`` seconds for each instance by a
+        shared scheduler (see ``zendo.services.applet_ticks``), with the
+        current time as ``time.time()``. None leaves the state unchanged.
+        """
+        return None
+
     def layout(self) -> html.Div:
         raise NotImplementedError("Applet must implement layout method.")
 
@@ -77,14 +129,15 @@ class ChatHistory(Applet):
     name: ClassVar[str] = "chat_history"
     description: ClassVar[str] = "Displays the chat history."
     aliases: ClassVar[list[str]] = ["history", "chats"]
+    storage: ClassVar[str] = "events"
 
-    def process(
-        self, input: str, state: dict[str, Any] | None = None
-    ) -> dict[str, Any]:
-        history: list = (state or {}).get("history", [])
-        history.append(input)
-        state["history"] = history
-        return state
+    def init_state(self) -> dict[str, Any]:
+        return {"history": []}
+
+    def process(self, input: str, state: dict[str, Any] | None = None) -> JsonPatch:
+        if "history" not in (state or {}):
+            return JsonPatch([{"op": "add", "path": "/history", "value": [input]}])
+        return JsonPatch([{"op": "add", "path": "/history/-", "value": input}])
 
     def layout(self) -> html.Div:
         return html.Div(
@@ -95,12 +148,42 @@ class ChatHistory(Applet):
         )
 
 
+class Timer(Applet):
+    name: ClassVar[str] = "timer"
+    description: ClassVar[str] = "A stopwatch or countdown timer."
+    aliases: ClassVar[list[str]] = ["stopwatch", "countdown"]
+
+    def init_state(self) -> dict[str, Any]:
+        return init_timer_state()
+
+    def process(
+        self, input: str, state: dict[str, Any] | None = None
+    ) -> dict[str, Any]:
+        # start, pause, reset, stopwatch or countdown <seconds>
+        state = update_timer_state(state, input)
+        # Stale entries are harmless, expiry re-checks the stored state
+        schedule_expiry(self.id, state)
+        return state
+
+    def render(self, aio_id: str, state: dict[str, Any] | None = None) -> html.Div:
+        return TimerAIO(aio_id=aio_id, state=state)
+
+    def layout(self) -> html.Div:
+        return TimerAIO(aio_id=self.id)
+
+
 class AppletRegistry(Mapping[str, Type[Applet]]):
     def __init__(self):
         self._applets = {}
         self._aliases = {}
+        # Names of the applets with an async def process
+        self._async: set[str] = set()
+        # Applet name -> limit of its running process calls, used on the
+        # shared event loop only
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
         # add default applets
         self.register(ChatHistory)
+        self.register(Timer)
 
     def __getitem__(self, key: str) -> Type[Applet]:
         return self._applets[self._aliases.get(key, key)]
@@ -115,11 +198,208 @@ class AppletRegistry(Mapping[str, Type[Applet]]):
         self._applets[applet.name] = applet
         for alias in applet.aliases or []:
             self._aliases[alias] = applet.name
+        if inspect.iscoroutinefunction(applet.process):
+            self._async.add(applet.name)
+        else:
+            self._async.discard(applet.name)
+
+    def is_async(self, key: str) -> bool:
+        """Whether an applet's process is a coroutine function."""
+        return self._aliases.get(key, key) in self._async
+
+    async def process_async(
+        self, applet: Applet, input: str, state: dict[str, Any] | None, **kwargs
+    ) -> dict[str, Any] | StatePatch:
+        """
+        Await the process of an async applet, on the shared event loop.
+
+        Waits while ``max_concurrent_process`` calls of the applet type are
+        running.
+
+        Raises
+        ------
+        TimeoutError
+            If process takes longer than the applet's ``process_timeout``.
+        """
+        applet_class = type(applet)
+        semaphore = self._semaphores.get(applet_class.name)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(applet_class.max_concurrent_process)
+            self._semaphores[applet_class.name] = semaphore
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(
+                    applet.process(input, state, **kwargs),
+                    applet_class.process_timeout,
+                )
+            except asyncio.TimeoutError:
+                raise TimeoutError(
+                    f"Applet {applet_class.name} did not answer within "
+                    f"{applet_class.process_timeout}s."
+                ) from None
+
+
+# Number of messages fetched per page, on first render and on scroll-up
+CHAT_PAGE_SIZE = 50
+# Upper bound on the number of messages kept in the DOM at any time
+MAX_RENDERED_MESSAGES = 200
+# Milliseconds between polls for the progress and result of a /send
+SEND_POLL_INTERVAL = 250
+
+
+def create_chat_message(msg: dict[str, Any]) -> html.Div:
+    return html.Div(
+        f"{msg['role']}: {msg['content']}",
+        className="chat-message",
+        style={
+            "backgroundColor": "#f1f1f1",
+        },
+    )
+
+
+def accepts_progress(applet_class: Type[Applet]) -> bool:
+    return "progress" in inspect.signature(applet_class.process).parameters
+
+
+def create_window(history: list[ChatMessage], at_tail: bool = True) -> WindowDict:
+    return {
+        "oldest": history[0].id if history else None,
+        "newest": history[-1].id if history else None,
+        "count": len(history),
+        "at_tail": at_tail,
+    }
+
+
+def create_load_older_style(page: list[ChatMessage]) -> dict[str, str]:
+    # A full page means there may be more messages before it
+    return {"display": "block" if len(page) >= CHAT_PAGE_SIZE else "none"}
+
+
+def create_load_newer_style(window: WindowDict) -> dict[str, str]:
+    # Away from the tail, newer messages were dropped from the window
+    return {"display": "none" if window["at_tail"] else "block"}
+
+
+def save_send_result(
+    user_id: int,
+    send_job: SendJobDict,
+    applet_name: str | None,
+    result: dict[str, Any] | StatePatch | Exception,
+    status_id: dict,
+    revision: int | None = None,
+) -> dash.Patch:
+    """
+    Store the state an applet returned for a /send and reply in the chat.
+
+    Parameters
+    ----------
+    user_id : int
+        Owner of the applet.
+    send_job : SendJobDict
+        The /send being answered.
+    applet_name : str, optional
+        Name of the applet, None if it was not found.
+    result : dict | StatePatch | Exception
+        New state or patch returned by the applet, or what it raised.
+    status_id : dict
+        Id of the progress display, cleared.
+    revision : int, optional
+        Revision of the state the applet processed, a new state is not
+        stored over a newer one.
+
+    Returns
+    -------
+    dash.Patch
+        Update of the app state with the reply.
+    """
+    # Replaced by a newer /send while it ran, drop the result
+    if job_cancelled():
+        raise dash.exceptions.PreventUpdate
+    revised = False
+    if isinstance(result, Exception):
+        content = str(result)
+    else:
+        if isinstance(result, (JsonPatch, MergePatch)):
+            success, msg, _ = patch_applet(
+                user_id=user_id, applet_id=send_job["applet_id"], patch=result
+            )
+        else:
+            success, msg, _ = update_applet(
+                user_id=user_id,
+                applet_id=send_job["applet_id"],
+                state_data=result,
+                revision=revision,
+            )
+        revised = success
+        if success:
+            content = f"Message sent to applet {applet_name}: {send_job['message']}"
+        else:
+            content = f"Error updating applet state: {msg}"
+    dash.set_props(status_id, {"children": ""})
+    success, msg, rows = append_messages(
+        conversation_id=send_job["conversation_id"],
+        user_id=user_id,
+        messages=[{"role": "system", "content": content}],
+    )
+    if not success:
+        raise dash.exceptions.PreventUpdate
+    # Patched rather than replaced, other commands may have changed the app
+    # state while the job ran
+    patched_state = dash.Patch()
+    patched_state["cursor"] = rows[-1].id
+    patched_state["messages"] = [row.to_dict() for row in rows]
+    if revised:
+        patched_state["applet_revision"] += 1
+    return patched_state
+
+
+async def send_async(
+    applet: Applet,
+    state: dict[str, Any] | None,
+    user_id: int,
+    send_job: SendJobDict,
+    status_id: dict,
+    revision: int | None = None,
+    **kwargs,
+) -> dash.Patch:
+    """Await an async applet's process for a /send, then save the result."""
+    try:
+        result = await MainLayout.applets.process_async(
+            applet, send_job["message"], state, **kwargs
+        )
+    except JobCancelled:
+        raise dash.exceptions.PreventUpdate
+    except Exception as e:
+        result = e
+    # The database is blocking, keep it off the event loop
+    return await asyncio.to_thread(
+        save_send_result, user_id, send_job, applet.name, result, status_id, revision
+    )
+
+
+class WindowDict(TypedDict):
+    oldest: int | None
+    newest: int | None
+    count: int
+    at_tail: bool
 
 
 class AppStateDict(TypedDict):
     mode: str
     current_applet: str | None
+    # Bumped when the current applet's state changes, to redraw it
+    applet_revision: int
+    conversation_id: str
+    cursor: int | None
+    messages: list[dict[str, Any]]
+
+
+class SendJobDict(TypedDict):
+    applet_id: str
+    message: str
+    conversation_id: str
+    # Id of the /send chat message, so sending the same text runs again
+    message_id: int
 
 
 class MainLayout(html.Div):
@@ -140,6 +420,46 @@ class MainLayout(html.Div):
                 "aio_id": aio_id,
             }
 
+        @staticmethod
+        def messages(aio_id: str) -> dict:
+            return {
+                "component": "MainLayout",
+                "subcomponent": "messages",
+                "aio_id": aio_id,
+            }
+
+        @staticmethod
+        def window(aio_id: str) -> dict:
+            return {
+                "component": "MainLayout",
+                "subcomponent": "window",
+                "aio_id": aio_id,
+            }
+
+        @staticmethod
+        def load_older_button(aio_id: str) -> dict:
+            return {
+                "component": "MainLayout",
+                "subcomponent": "load_older_button",
+                "aio_id": aio_id,
+            }
+
+        @staticmethod
+        def load_newer_button(aio_id: str) -> dict:
+            return {
+                "component": "MainLayout",
+                "subcomponent": "load_newer_button",
+                "aio_id": aio_id,
+            }
+
+        @staticmethod
+        def scroll_trigger(aio_id: str) -> dict:
+            return {
+                "component": "MainLayout",
+                "subcomponent": "scroll_trigger",
+                "aio_id": aio_id,
+            }
+
         @staticmethod
         def input_textarea(aio_id: str) -> dict:
             return {
@@ -164,29 +484,125 @@ class MainLayout(html.Div):
                 "aio_id": aio_id,
             }
 
+        @staticmethod
+        def applet(aio_id: str) -> dict:
+            return {
+                "component": "MainLayout",
+                "subcomponent": "applet",
+                "aio_id": aio_id,
+            }
+
+        @staticmethod
+        def applet_view(aio_id: str) -> dict:
+            return {
+                "component": "MainLayout",
+                "subcomponent": "applet_view",
+                "aio_id": aio_id,
+            }
+
+        @staticmethod
+        def send_job(aio_id: str) -> dict:
+            return {
+                "component": "MainLayout",
+                "subcomponent": "send_job",
+                "aio_id": aio_id,
+            }
+
+        @staticmethod
+        def send_status(aio_id: str) -> dict:
+            return {
+                "component": "MainLayout",
+                "subcomponent": "send_status",
+                "aio_id": aio_id,
+            }
+
     ids = ids
 
     applets: ClassVar[AppletRegistry] = AppletRegistry()
 
-    def __init__(self, aio_id: str):
+    def __init__(self, aio_id: str, conversation_id: str | None = None):
+        current_user = auth.current_user
+        user_id = (
+            current_user.id if current_user and current_user.is_authenticated else None
+        )
+        if conversation_id is None and user_id is not None:
+            conversation_id = latest_conversation_id(user_id)
+        history = []
+        if conversation_id is None:
+            conversation_id = str(uuid.uuid4())
+        elif user_id is not None:
+            _, _, history = list_messages(
+                conversation_id=conversation_id, user_id=user_id, limit=CHAT_PAGE_SIZE
+            )
         super().__init__(
             [
-                # Store for app state (chat is default, timer can be opened)
+                # Store for app state (chat is default, timer can be opened).
+                # The chat history itself lives in the ChatMessage table.
                 dcc.Store(
                     id=self.ids.state(aio_id),
-                    data={"mode": "chat", "history": []},
+                    data={
+                        "mode": "chat",
+                        "applet_revision": 0,
+                        "conversation_id": conversation_id,
+                        "cursor": history[-1].id if history else None,
+                        "messages": [],
+                    },
                 ),
+                # Window of rendered messages, only the most recent ones are
+                # in the DOM and older pages are loaded on scroll-up
+                dcc.Store(
+                    id=self.ids.window(aio_id),
+                    data=create_window(history),
+                ),
+                # The current applet, and the (id, revision) it was drawn at
+                html.Div(id=self.ids.applet(aio_id)),
+                dcc.Store(id=self.ids.applet_view(aio_id), data=None),
+                # The latest /send, processed in the background
+                dcc.Store(id=self.ids.send_job(aio_id), data=None),
                 # content area
                 html.Div(
+                    [
+                        html.Button(
+                            "Load earlier messages",
+                            id=self.ids.load_older_button(aio_id),
+                            n_clicks=0,
+                            className="btn btn-link btn-sm w-100",
+                            style=create_load_older_style(history),
+                        ),
+                        html.Div(
+                            [create_chat_message(row.to_dict()) for row in history],
+                            id=self.ids.messages(aio_id),
+                            className="chats-container p-3 d-flex flex-column justify-content-end gap-2",
+                            style={"minHeight": "100%"},
+                        ),
+                        html.Button(
+                            "Load newer messages",
+                            id=self.ids.load_newer_button(aio_id),
+                            n_clicks=0,
+                            className="btn btn-link btn-sm w-100",
+                            style={"display": "none"},
+                        ),
+                    ],
                     id=self.ids.content(aio_id),
                     style={
                         "flex": "1",
-                        "overflow": "hidden",
+                        "overflowY": "auto",
                     },
                 ),
                 # Generic input area
                 html.Div(
                     [
+                        # Progress of the running /send
+                        html.Div(
+                            id=self.ids.send_status(aio_id),
+                            style={
+                                "maxWidth": "48rem",
+                                "margin": "0 auto 0.25rem auto",
+                                "color": "#6b7280",
+                                "fontSize": "12px",
+                                "minHeight": "1rem",
+                            },
+                        ),
                         html.Div(
                             [
                                 html.Div(
@@ -239,7 +655,7 @@ class MainLayout(html.Div):
                                 "maxWidth": "48rem",
                                 "margin": "0 auto",
                             },
-                        )
+                        ),
                     ],
                     style={
                         "padding": "1rem",
@@ -247,6 +663,8 @@ class MainLayout(html.Div):
                 ),
                 # Hidden div to trigger send on Cmd+Enter
                 dcc.Store(id=self.ids.cmd_enter_trigger(aio_id), data=0),
+                # Hidden div to bind the scroll handler of the content area
+                dcc.Store(id=self.ids.scroll_trigger(aio_id), data=0),
             ],
             style={
                 "height": "calc(100vh - 62px)",  # Account for navbar height
@@ -280,38 +698,213 @@ class MainLayout(html.Div):
         prevent_initial_call=False,
     )
 
+    clientside_callback(
+        ClientsideFunction(namespace="mainLayout", function_name="bindScroll"),
+        Output(ids.scroll_trigger(MATCH), "data"),
+        Input(ids.content(MATCH), "id"),
+        State(ids.load_older_button(MATCH), "id"),
+        State(ids.load_newer_button(MATCH), "id"),
+        State(ids.scroll_trigger(MATCH), "data"),
+        prevent_initial_call=False,
+    )
+
     @callback(
-        Output(ids.content(MATCH), "children"),
+        Output(ids.messages(MATCH), "children"),
+        Output(ids.window(MATCH), "data"),
+        Output(ids.load_older_button(MATCH), "style"),
+        Output(ids.load_newer_button(MATCH), "style"),
         Input(ids.state(MATCH), "data"),
+        State(ids.window(MATCH), "data"),
+        prevent_initial_call=True,
     )
-    def update_current_content(app_state: AppStateDict):
-        history = app_state.get("history", [])
-        if not history:
-            # If no history, return an empty div
-            chats_div = html.Div(
-                "No messages yet. Start chatting!",
-                style={"padding": "1rem", "textAlign": "center"},
+    def update_current_content(app_state: AppStateDict, window: WindowDict):
+        current_user = auth.current_user
+        if not current_user or not current_user.is_authenticated:
+            return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+        messages = app_state.get("messages")
+        if app_state["mode"] != "chat" or not messages:
+            return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+        count = window["count"] + len(messages)
+        if not window["at_tail"] or count > MAX_RENDERED_MESSAGES:
+            # The window would grow past its bound (or the user scrolled away
+            # from the latest messages), re-render the most recent page only.
+            _, _, history = list_messages(
+                conversation_id=app_state["conversation_id"],
+                user_id=current_user.id,
+                limit=CHAT_PAGE_SIZE,
             )
-        elif app_state["mode"] == "chat":
-            # Render chat history
-            chats_div = html.Div(
-                [
-                    html.Div(
-                        f"{msg['role']}: {msg['content']}",
-                        className="chat-message",
-                        style={
-                            "backgroundColor": "#f1f1f1",
-                        },
-                    )
-                    for msg in history
-                ],
-                className="chats-container p-3 h-100 d-flex flex-column justify-content-end gap-2",
+            window = create_window(history)
+            return (
+                [create_chat_message(row.to_dict()) for row in history],
+                window,
+                create_load_older_style(history),
+                create_load_newer_style(window),
+            )
+        # Append only the bubbles for the new messages; the ones already in
+        # the DOM are left untouched.
+        patched_messages = dash.Patch()
+        patched_messages.extend([create_chat_message(msg) for msg in messages])
+        window = {
+            "oldest": window["oldest"] or messages[0]["id"],
+            "newest": messages[-1]["id"],
+            "count": count,
+            "at_tail": True,
+        }
+        return patched_messages, window, dash.no_update, dash.no_update
+
+    @callback(
+        Output(ids.applet(MATCH), "children"),
+        Output(ids.applet_view(MATCH), "data"),
+        Input(ids.state(MATCH), "data"),
+        State(ids.applet_view(MATCH), "data"),
+        prevent_initial_call=True,
+    )
+    def render_current_applet(app_state: AppStateDict, view: list | None):
+        applet_id = app_state.get("current_applet")
+        current_view = [applet_id, app_state.get("applet_revision", 0)]
+        if view == current_view:
+            return dash.no_update, dash.no_update
+        current_user = auth.current_user
+        if applet_id is None or not current_user or not current_user.is_authenticated:
+            return None, current_view
+        success, msg, applet_state = get_applet(
+            user_id=current_user.id, applet_id=applet_id
+        )
+        applet_class = (
+            MainLayout.applets.get(applet_state.applet_name) if success else None
+        )
+        if applet_class is None:
+            return None, current_view
+        applet = applet_class(id=applet_id)
+        return applet.render(applet_id, applet_state.state_data), current_view
+
+    @callback(
+        Output(ids.messages(MATCH), "children", allow_duplicate=True),
+        Output(ids.window(MATCH), "data", allow_duplicate=True),
+        Output(ids.load_older_button(MATCH), "style", allow_duplicate=True),
+        Output(ids.load_newer_button(MATCH), "style", allow_duplicate=True),
+        Input(ids.load_older_button(MATCH), "n_clicks"),
+        State(ids.state(MATCH), "data"),
+        State(ids.window(MATCH), "data"),
+        prevent_initial_call=True,
+    )
+    def load_older_messages(
+        n_clicks: int | None, app_state: AppStateDict, window: WindowDict
+    ):
+        current_user = auth.current_user
+        if not current_user or not current_user.is_authenticated:
+            return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+        if not n_clicks or window["oldest"] is None:
+            return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+        conversation_id = app_state["conversation_id"]
+        _, _, page = list_messages(
+            conversation_id=conversation_id,
+            user_id=current_user.id,
+            before=window["oldest"],
+            limit=CHAT_PAGE_SIZE,
+        )
+        if not page:
+            return (
+                dash.no_update,
+                dash.no_update,
+                create_load_older_style(page),
+                dash.no_update,
+            )
+        if window["count"] + len(page) > MAX_RENDERED_MESSAGES:
+            # Slide the window up: keep the loaded page plus as many of the
+            # following messages as fit, dropping the newest ones.
+            _, _, following = list_messages(
+                conversation_id=conversation_id,
+                user_id=current_user.id,
+                after=page[-1].id,
+                limit=MAX_RENDERED_MESSAGES - len(page),
+            )
+            history = page + following
+            window = create_window(history, at_tail=False)
+            return (
+                [create_chat_message(row.to_dict()) for row in history],
+                window,
+                create_load_older_style(page),
+                create_load_newer_style(window),
+            )
+        patched_messages = dash.Patch()
+        for row in reversed(page):
+            patched_messages.prepend(create_chat_message(row.to_dict()))
+        window = {
+            "oldest": page[0].id,
+            "newest": window.get("newest"),
+            "count": window["count"] + len(page),
+            "at_tail": window["at_tail"],
+        }
+        return patched_messages, window, create_load_older_style(page), dash.no_update
+
+    @callback(
+        Output(ids.messages(MATCH), "children", allow_duplicate=True),
+        Output(ids.window(MATCH), "data", allow_duplicate=True),
+        Output(ids.load_older_button(MATCH), "style", allow_duplicate=True),
+        Output(ids.load_newer_button(MATCH), "style", allow_duplicate=True),
+        Input(ids.load_newer_button(MATCH), "n_clicks"),
+        State(ids.state(MATCH), "data"),
+        State(ids.window(MATCH), "data"),
+        prevent_initial_call=True,
+    )
+    def load_newer_messages(
+        n_clicks: int | None, app_state: AppStateDict, window: WindowDict
+    ):
+        current_user = auth.current_user
+        if not current_user or not current_user.is_authenticated:
+            return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+        if not n_clicks or window["at_tail"] or window.get("newest") is None:
+            return dash.no_update, dash.no_update, dash.no_update, dash.no_update
+        conversation_id = app_state["conversation_id"]
+        _, _, page = list_messages(
+            conversation_id=conversation_id,
+            user_id=current_user.id,
+            after=window["newest"],
+            limit=CHAT_PAGE_SIZE,
+        )
+        if not page:
+            window = {**window, "at_tail": True}
+            return (
+                dash.no_update,
+                window,
+                dash.no_update,
+                create_load_newer_style(window),
             )
-        return chats_div
+        # A short page reaches the latest message
+        at_tail = len(page) < CHAT_PAGE_SIZE
+        if window["count"] + len(page) > MAX_RENDERED_MESSAGES:
+            # Slide the window down: keep the loaded page plus as many of the
+            # preceding messages as fit, dropping the oldest ones.
+            _, _, preceding = list_messages(
+                conversation_id=conversation_id,
+                user_id=current_user.id,
+                before=page[0].id,
+                limit=MAX_RENDERED_MESSAGES - len(page),
+            )
+            history = preceding + page
+            window = create_window(history, at_tail=at_tail)
+            return (
+                [create_chat_message(row.to_dict()) for row in history],
+                window,
+                # Messages before the window were dropped
+                {"display": "block"},
+                create_load_newer_style(window),
+            )
+        patched_messages = dash.Patch()
+        patched_messages.extend([create_chat_message(row.to_dict()) for row in page])
+        window = {
+            "oldest": window["oldest"],
+            "newest": page[-1].id,
+            "count": window["count"] + len(page),
+            "at_tail": at_tail,
+        }
+        return patched_messages, window, dash.no_update, create_load_newer_style(window)
 
     # Callback to handle input from the message input field
     @callback(
         Output(ids.state(MATCH), "data"),
+        Output(ids.send_job(MATCH), "data"),
         Input(ids.send_button(MATCH), "n_clicks"),
         State(ids.input_textarea(MATCH), "value"),
         State(ids.state(MATCH), "data"),
@@ -324,16 +917,17 @@ class MainLayout(html.Div):
 
         # Check authentication
         if not current_user or not current_user.is_authenticated:
-            return dash.no_update
+            return dash.no_update, dash.no_update
 
         message = message.strip() if message else ""
 
         if not message or message == "":
-            return dash.no_update
+            return dash.no_update, dash.no_update
 
-        history: list = app_state.setdefault("history", [])
+        messages: list = []
+        send_job: SendJobDict | None = None
 
-        history.append(
+        messages.append(
             {
                 "role": "user",
                 "content": message,
@@ -344,14 +938,14 @@ class MainLayout(html.Div):
         if message.startswith("/"):
             cmd = list(map(str.strip, message[1:].strip().split(" ")))
             if cmd[0] == "help":
-                history.append(
+                messages.append(
                     {
                         "role": "system",
-                        "content": "Available commands: /help, /avail, /new <applet_name>, /list, /state, /switch <applet_id>, /send <message>",
+                        "content": "Available commands: /help, /avail, /new <applet_name>, /list, /state [revision], /switch <applet_id>, /send <message>",
                     }
                 )
             elif cmd[0] == "avail":
-                history.append(
+                messages.append(
                     {
                         "role": "system",
                         "content": "Available applets: "
@@ -367,19 +961,21 @@ class MainLayout(html.Div):
                     success, msg, applet_state = create_applet(
                         id=applet.id,
                         user_id=current_user.id,
-                        applet_name=applet_name,
+                        applet_name=applet_class.name,
                         state_data=applet.init_state(),
+                        storage=applet.storage,
                     )
                     app_state["current_applet"] = applet_state.id
                 if success:
-                    history.append(
+                    schedule_applet_tick(applet_class, current_user.id, applet_state.id)
+                    messages.append(
                         {
                             "role": "system",
                             "content": f"Created and switched to applet: {applet_name} of type {applet_class}.",
                         }
                     )
                 else:
-                    history.append(
+                    messages.append(
                         {
                             "role": "system",
                             "content": f"Error creating applet: {msg}",
@@ -390,7 +986,7 @@ class MainLayout(html.Div):
                 success, msg, applets = list_applets(user_id=current_user.id)
                 for applet in applets:
                     applets_list.append(f"{applet.applet_name}({applet.id})")
-                history.append(
+                messages.append(
                     {
                         "role": "system",
                         "content": "Current applets: " + ", ".join(applets_list)
@@ -400,26 +996,35 @@ class MainLayout(html.Div):
                 )
             elif cmd[0] == "state":
                 applet_id = app_state.get("current_applet")
-                if applet_id:
+                if len(cmd) > 1 and not cmd[1].isdigit():
+                    messages.append(
+                        {
+                            "role": "system",
+                            "content": "Usage: /state [revision]",
+                        }
+                    )
+                elif applet_id:
                     success, msg, applet_state = get_applet(
-                        user_id=current_user.id, applet_id=applet_id
+                        user_id=current_user.id,
+                        applet_id=applet_id,
+                        at=int(cmd[1]) if len(cmd) > 1 else None,
                     )
                     if success:
-                        history.append(
+                        messages.append(
                             {
                                 "role": "system",
                                 "content": f"Applet state for {applet_state.applet_name} ({applet_id}): {applet_state.state_data}",
                             }
                         )
                     else:
-                        history.append(
+                        messages.append(
                             {
                                 "role": "system",
                                 "content": f"Error retrieving applet state: {msg}",
                             }
                         )
                 else:
-                    history.append(
+                    messages.append(
                         {
                             "role": "system",
                             "content": "No current applet to show state.",
@@ -427,7 +1032,7 @@ class MainLayout(html.Div):
                     )
             elif cmd[0] == "switch":
                 if len(cmd) < 2:
-                    history.append(
+                    messages.append(
                         {
                             "role": "system",
                             "content": "Usage: /switch <applet_id>",
@@ -440,14 +1045,14 @@ class MainLayout(html.Div):
                     )
                     if success:
                         app_state["current_applet"] = applet_state.id
-                        history.append(
+                        messages.append(
                             {
                                 "role": "system",
                                 "content": f"Switched to applet: {applet_state.applet_name} ({applet_id})",
                             }
                         )
                     else:
-                        history.append(
+                        messages.append(
                             {
                                 "role": "system",
                                 "content": f"Error switching to applet: {msg}",
@@ -456,75 +1061,113 @@ class MainLayout(html.Div):
             elif cmd[0] == "send":
                 applet_id = app_state.get("current_applet")
                 if applet_id:
-                    success, msg, applet_state = get_applet(
-                        user_id=current_user.id, applet_id=applet_id
-                    )
-                    if success:
-                        applet_class = MainLayout.applets.get(applet_state.applet_name)
-                        if applet_class:
-                            try:
-                                real_message = message[len(cmd[0]) + 1 :].strip()
-                                applet = applet_class(id=applet_id)
-                                new_state = applet.process(
-                                    real_message, applet_state.state_data
-                                )
-                                print("New state:", new_state)
-                                success, msg, _ = update_applet(
-                                    user_id=current_user.id,
-                                    applet_id=applet_id,
-                                    state_data=new_state,
-                                )
-                                if success:
-                                    history.append(
-                                        {
-                                            "role": "system",
-                                            "content": f"Message sent to applet {applet_state.applet_name}: {real_message}",
-                                        }
-                                    )
-                                else:
-                                    history.append(
-                                        {
-                                            "role": "system",
-                                            "content": f"Error updating applet state: {msg}",
-                                        }
-                                    )
-                            except Exception as e:
-                                history.append(
-                                    {
-                                        "role": "system",
-                                        "content": str(e),
-                                    }
-                                )
-                        else:
-                            history.append(
-                                {
-                                    "role": "system",
-                                    "content": f"Applet {applet_state.applet_name} not found.",
-                                }
-                            )
-                    else:
-                        history.append(
-                            {
-                                "role": "system",
-                                "content": f"Error retrieving applet: {msg}",
-                            }
-                        )
+                    # Processed by run_send_job, in the background
+                    send_job = {
+                        "applet_id": applet_id,
+                        "message": message[len(cmd[0]) + 1 :].strip(),
+                    }
                 else:
-                    history.append(
+                    messages.append(
                         {
                             "role": "system",
                             "content": "No current applet to send message to.",
                         }
                     )
         else:
-            # Regular message, add to history
-            history.append(
+            # Regular message, reply from the assistant
+            messages.append(
                 {
                     "role": "assistant",
                     "content": "You said: " + message,
                 }
             )
 
-        app_state["history"] = history
+        conversation_id = app_state.get("conversation_id") or str(uuid.uuid4())
+        success, msg, rows = append_messages(
+            conversation_id=conversation_id,
+            user_id=current_user.id,
+            messages=messages,
+        )
+        if not success:
+            return dash.no_update, dash.no_update
+
+        # Only the new messages travel back to the client; the full history
+        # stays server-side and is addressed by the conversation id + cursor.
+        app_state["conversation_id"] = conversation_id
+        app_state["cursor"] = rows[-1].id
+        app_state["messages"] = [row.to_dict() for row in rows]
 
-        return app_state
+        if send_job is None:
+            return app_state, dash.no_update
+        send_job["conversation_id"] = conversation_id
+        send_job["message_id"] = rows[0].id
+        return app_state, send_job
+
+    # Runs /send on the job pool (see zendo.services.jobs), so a slow applet
+    # holds no request thread. The browser polls for progress and result,
+    # and cancels the running job when a newer /send starts. Progress goes
+    # through set_props, background callbacks take no pattern-matching
+    # progress outputs.
+    @callback(
+        Output(ids.state(MATCH), "data", allow_duplicate=True),
+        Input(ids.send_job(MATCH), "data"),
+        background=True,
+        manager=job_manager,
+        interval=SEND_POLL_INTERVAL,
+        prevent_initial_call=True,
+    )
+    def run_send_job(send_job: SendJobDict | None):
+        current_user = auth.current_user
+        if not send_job or not current_user or not current_user.is_authenticated:
+            return dash.no_update
+
+        status_id = MainLayout.ids.send_status(dash.ctx.triggered_id["aio_id"])
+        success, msg, applet_state = get_applet(
+            user_id=current_user.id, applet_id=send_job["applet_id"]
+        )
+        applet_class = (
+            MainLayout.applets.get(applet_state.applet_name) if success else None
+        )
+        if not success:
+            result = LookupError(f"Error retrieving applet: {msg}")
+            return save_send_result(current_user.id, send_job, None, result, status_id)
+        if applet_class is None:
+            result = LookupError(f"Applet {applet_state.applet_name} not found.")
+            return save_send_result(
+                current_user.id, send_job, applet_state.applet_name, result, status_id
+            )
+
+        def progress(text: str) -> None:
+            check_cancelled()
+            dash.set_props(status_id, {"children": f"{applet_class.name}: {text}"})
+
+        applet = applet_class(id=send_job["applet_id"])
+        kwargs = {"progress": progress} if accepts_progress(applet_class) else {}
+        progress("working...")
+        if MainLayout.applets.is_async(applet_class.name):
+            # Awaited on the shared event loop, freeing this job's thread
+            return send_async(
+                applet,
+                applet_state.state_data,
+                current_user.id,
+                send_job,
+                status_id,
+                applet_state.revision,
+                **kwargs,
+            )
+        try:
+            result = applet.process(
+                send_job["message"], applet_state.state_data, **kwargs
+            )
+        except JobCancelled:
+            raise dash.exceptions.PreventUpdate
+        except Exception as e:
+            result = e
+        return save_send_result(
+            current_user.id,
+            send_job,
+            applet_class.name,
+            result,
+            status_id,
+            applet_state.revision,
+        )
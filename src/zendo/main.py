@@ -1,9 +1,12 @@
-import subprocess
+import os
+import signal
 import time
+from dataclasses import replace
+from pathlib import Path
 
 import click
 
-from zendo.config import appname
+from zendo.config import config
 
 
 @click.group()
@@ -12,34 +15,218 @@ def cli():
     pass
 
 
+def load_app():
+    from zendo.app import create_app
+
+    return create_app().server
+
+
+def post_fork(server):
+    from zendo.models import db
+
+    # Pooled connections must not be shared with the master process
+    with server.app_context():
+        db.engine.dispose(close=False)
+
+
+def start_worker(server):
+    from zendo.app import start_background_work
+
+    # Only one worker runs it, the others stand by
+    start_background_work(server)
+
+
 @cli.command()
 @click.option("--port", default=8000, help="Port to run the application on.")
 def server(port: int):
-    """Start the application."""
-    while True:
-        try:
-            # Attempt to run the application
-            subprocess.run(
-                [
-                    "watchmedo",
-                    "auto-restart",
-                    "-d",
-                    ".",
-                    "-p",
-                    "*.py",
-                    "--recursive",
-                    "--",
-                    "uv",
-                    "run",
-                    "-m",
-                    f"{appname}.app",
-                ]
+    """Start the application, reloading it when a source file changes."""
+    from zendo.server import PreforkServer
+
+    PreforkServer(
+        load_app,
+        "127.0.0.1",
+        port,
+        workers=1,
+        preload=False,
+        worker_init=start_worker,
+        watch=[Path(__file__).resolve().parent],
+    ).run()
+
+
+@cli.command()
+@click.option("--host", default="127.0.0.1", show_default=True, help="Address.")
+@click.option("--port", default=8000, show_default=True, help="Port.")
+@click.option(
+    "--workers",
+    type=int,
+    default=None,
+    help="Worker processes, defaults to the number of CPUs.",
+)
+@click.option(
+    "--threads", default=8, show_default=True, help="Request threads per worker."
+)
+@click.option(
+    "--preload/--no-preload",
+    default=True,
+    show_default=True,
+    help="Load the app once before forking; reloads then keep the old code.",
+)
+@click.option(
+    "--asgi",
+    is_flag=True,
+    help="Serve zendo.app:asgi_app with uvicorn (needs the 'asgi' extra).",
+)
+def serve(
+    host: str,
+    port: int,
+    workers: int | None,
+    threads: int,
+    preload: bool,
+    asgi: bool,
+):
+    """Run the production server with several worker processes.
+
+    `zendo reload` (SIGHUP) replaces the workers without downtime.
+    """
+    if asgi:
+        import uvicorn
+
+        workers = workers or os.cpu_count() or 1
+        if workers == 1:
+            from zendo.app import create_asgi_app
+
+            # Served by this process, whose configuration is already loaded
+            app = create_asgi_app(replace(config, asgi_threads=threads))
+        else:
+            # Worker processes spawned by uvicorn load their configuration
+            # from the environment
+            os.environ["ZENDO_ASGI_THREADS"] = str(threads)
+            app = "zendo.app:asgi_app"
+        uvicorn.run(app, host=host, port=port, workers=workers, log_level="warning")
+        return
+
+    from zendo.server import PreforkServer
+
+    PreforkServer(
+        load_app,
+        host,
+        port,
+        workers=workers or os.cpu_count() or 1,
+        threads=threads,
+        preload=preload,
+        post_fork=post_fork,
+        worker_init=start_worker,
+        pid_file=config.pid_file,
+    ).run()
+
+
+@cli.command()
+def reload():
+    """Reload a running `zendo serve` without dropping requests."""
+    try:
+        pid = int(config.pid_file.read_text())
+        os.kill(pid, signal.SIGHUP)
+    except (FileNotFoundError, ValueError, ProcessLookupError):
+        raise click.ClickException(
+            f"No server is running ({config.pid_file})"
+        ) from None
+    click.echo(f"Sent reload signal to {pid}.")
+
+
+@cli.group("db")
+def database():
+    """Manage the application database."""
+    pass
+
+
+@database.command()
+def upgrade():
+    """Upgrade the database schema in place."""
+    from zendo.app import create_app
+    from zendo.migrations import MigrationError
+    from zendo.migrations import upgrade as upgrade_schema
+    from zendo.models import db
+
+    try:
+        app = create_app()
+    except MigrationError as e:
+        raise click.ClickException(str(e)) from None
+    with app.server.app_context():
+        revision = upgrade_schema(db.engine)
+    click.echo(f"Database schema is at revision {revision}.")
+
+
+@database.command()
+def reencode():
+    """Re-encode stored applet states with the configured codec."""
+    from zendo.app import create_app
+    from zendo.migrations import reencode_applet_states
+    from zendo.models import db
+
+    app = create_app()
+    with app.server.app_context():
+        count, size_before, size_after = reencode_applet_states(db.engine)
+    click.echo(
+        f"Re-encoded {count} applet states: {size_before} -> {size_after} bytes."
+    )
+
+
+@cli.group()
+def users():
+    """Manage user accounts."""
+    pass
+
+
+@users.command("import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--batch-size", default=1000, show_default=True, help="Rows per batch.")
+@click.option(
+    "--workers",
+    type=int,
+    default=None,
+    help="Password hashing processes, defaults to the number of CPUs.",
+)
+def import_users(path: str, batch_size: int, workers: int | None):
+    """Import users from a CSV or NDJSON file.
+
+    Rows have the fields username, email, password and optionally
+    first_name and last_name.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    from zendo.app import create_app
+    from zendo.services.user_import import import_users, read_rows
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    executor = None
+    if workers > 0:
+        executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+    app = create_app()
+    imported = failed = 0
+    start = time.perf_counter()
+    try:
+        with app.server.app_context():
+            batches = import_users(
+                read_rows(path), batch_size=batch_size, executor=executor
             )
-            break  # Exit loop if successful
-        except subprocess.CalledProcessError as e:
-            print(f"Error starting application: {e}")
-            print("Retrying in 5 seconds...")
-            time.sleep(5)
+            for batch in batches:
+                imported += batch.imported
+                failed += len(batch.errors)
+                for line_no, error in sorted(batch.errors):
+                    click.echo(f"{path}:{line_no}: {error}", err=True)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    elapsed = time.perf_counter() - start
+    rate = (imported + failed) / elapsed if elapsed else 0.0
+    click.echo(
+        f"Imported {imported} users, {failed} rows failed "
+        f"in {elapsed:.1f}s ({rate:.0f} rows/s)."
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,258 @@
+"""
+In-place schema migrations for existing SQLite databases.
+
+``db.create_all`` only creates missing tables, so changes to existing tables
+are applied here. The schema revision is tracked with ``PRAGMA user_version``
+and every migration checks the actual table layout first, which makes them
+no-ops on databases that were created with the current models.
+"""
+
+import uuid
+from collections.abc import Callable
+
+from sqlalchemy import Connection, Engine, bindparam, func, inspect, select, update
+
+from zendo.database import is_sqlite
+from zendo.models import AppletState, User, normalize_login
+
+__all__ = [
+    "MIGRATIONS",
+    "MigrationError",
+    "reencode_applet_states",
+    "upgrade",
+]
+
+# Rows copied per batch when a table has to be rebuilt
+BATCH_SIZE = 1000
+
+
+class MigrationError(RuntimeError):
+    """Raised when the data of a database prevents a migration."""
+
+
+def get_columns(conn: Connection, table: str) -> dict[str, dict]:
+    inspector = inspect(conn)
+    if not inspector.has_table(table):
+        return {}
+    return {column["name"]: column for column in inspector.get_columns(table)}
+
+
+def applet_state_compact_keys(conn: Connection) -> None:
+    """Store applet ids as 16-byte UUIDs and index the per-user lookups."""
+    columns = get_columns(conn, "applet_state")
+    if not columns:
+        return
+    if str(columns["id"]["type"]).upper() != "BLOB":
+        conn.exec_driver_sql("ALTER TABLE applet_state RENAME TO applet_state_old")
+        conn.exec_driver_sql(
+            "CREATE TABLE applet_state ("
+            "id BLOB NOT NULL, "
+            "user_id INTEGER NOT NULL, "
+            "applet_name VARCHAR(80) NOT NULL, "
+            "state_data JSON, "
+            "created_at DATETIME NOT NULL, "
+            "updated_at DATETIME NOT NULL, "
+            "PRIMARY KEY (id))"
+        )
+        result = conn.exec_driver_sql(
+            "SELECT id, user_id, applet_name, state_data, created_at, updated_at "
+            "FROM applet_state_old"
+        )
+        for rows in result.partitions(BATCH_SIZE):
+            conn.exec_driver_sql(
+                "INSERT INTO applet_state "
+                "(id, user_id, applet_name, state_data, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(uuid.UUID(row[0]).bytes, *row[1:]) for row in rows],
+            )
+        conn.exec_driver_sql("DROP TABLE applet_state_old")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_applet_state_user_id_updated_at "
+        "ON applet_state (user_id, updated_at)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_applet_state_user_id_applet_name "
+        "ON applet_state (user_id, applet_name)"
+    )
+
+
+def applet_state_event_storage(conn: Connection) -> None:
+    """Add the storage mode and snapshot sequence of event-sourced applets."""
+    columns = get_columns(conn, "applet_state")
+    if not columns:
+        return
+    if "storage" not in columns:
+        conn.exec_driver_sql(
+            "ALTER TABLE applet_state "
+            "ADD COLUMN storage VARCHAR(16) DEFAULT 'state' NOT NULL"
+        )
+    if "snapshot_seq" not in columns:
+        conn.exec_driver_sql(
+            "ALTER TABLE applet_state ADD COLUMN snapshot_seq INTEGER DEFAULT '0' NOT NULL"
+        )
+
+
+def user_login_keys(conn: Connection) -> None:
+    """Add and fill the lowercase username and email lookup keys."""
+    columns = get_columns(conn, "user")
+    if not columns:
+        return
+    for name, length in [("username_key", 80), ("email_key", 120)]:
+        if name not in columns:
+            conn.exec_driver_sql(
+                f"ALTER TABLE user ADD COLUMN {name} VARCHAR({length}) "
+                "DEFAULT '' NOT NULL"
+            )
+    # Normalized in Python, SQLite's lower() only folds ASCII letters
+    table = User.__table__
+    result = conn.execute(select(table.c.id, table.c.username, table.c.email))
+    for rows in result.partitions(BATCH_SIZE):
+        conn.execute(
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .values(
+                username_key=bindparam("b_username_key"),
+                email_key=bindparam("b_email_key"),
+            ),
+            [
+                {
+                    "b_id": row.id,
+                    "b_username_key": normalize_login(row.username),
+                    "b_email_key": normalize_login(row.email),
+                }
+                for row in rows
+            ],
+        )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_user_username_key ON user (username_key)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_user_email_key ON user (email_key)"
+    )
+
+
+def chat_message_owner_index(conn: Connection) -> None:
+    """Index chat messages by conversation and owner."""
+    if not get_columns(conn, "chat_message"):
+        return
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_chat_message_conversation_id")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_chat_message_conversation_id_user_id "
+        "ON chat_message (conversation_id, user_id, id)"
+    )
+
+
+def applet_state_version(conn: Connection) -> None:
+    """Add the version checked by writes of applet states."""
+    columns = get_columns(conn, "applet_state")
+    if columns and "version" not in columns:
+        conn.exec_driver_sql(
+            "ALTER TABLE applet_state ADD COLUMN version INTEGER DEFAULT '0' NOT NULL"
+        )
+
+
+def user_login_keys_unique(conn: Connection) -> None:
+    """Make the lowercase username and email lookup keys unique."""
+    if not get_columns(conn, "user"):
+        return
+    table = User.__table__
+    for column in (table.c.username_key, table.c.email_key):
+        duplicates = conn.execute(
+            select(column)
+            .group_by(column)
+            .having(func.count() > 1)
+            .order_by(column)
+            .limit(10)
+        ).scalars()
+        duplicates = list(duplicates)
+        if duplicates:
+            kind = column.name.removesuffix("_key")
+            raise MigrationError(
+                f"Cannot make {column.name} unique, {kind}s differing only in "
+                f"case are used by several users: {', '.join(duplicates)}. "
+                "Rename or remove these users, then upgrade again."
+            )
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS ix_user_{column.name}")
+        conn.exec_driver_sql(
+            f"CREATE UNIQUE INDEX ix_user_{column.name} ON user ({column.name})"
+        )
+
+
+# Migrations in revision order, the n-th entry upgrades to revision n
+MIGRATIONS: list[Callable[[Connection], None]] = [
+    applet_state_compact_keys,
+    applet_state_event_storage,
+    user_login_keys,
+    chat_message_owner_index,
+    applet_state_version,
+    user_login_keys_unique,
+]
+
+
+def upgrade(engine: Engine) -> int:
+    """
+    Upgrade the database schema to the latest revision.
+
+    Parameters
+    ----------
+    engine : Engine
+        Engine connected to the database to upgrade.
+
+    Returns
+    -------
+    int
+        The schema revision of the database after the upgrade.
+    """
+    if not is_sqlite(str(engine.url)):
+        # other backends are created from the current models only
+        return len(MIGRATIONS)
+    with engine.begin() as conn:
+        revision = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        for migration in MIGRATIONS[revision:]:
+            migration(conn)
+            revision += 1
+            conn.exec_driver_sql(f"PRAGMA user_version = {revision}")
+    return revision
+
+
+def reencode_applet_states(engine: Engine) -> tuple[int, int, int]:
+    """
+    Re-encode all stored applet states with the configured codec settings.
+
+    Rows are rewritten in batches, each in its own transaction.
+
+    Parameters
+    ----------
+    engine : Engine
+        Engine connected to the database.
+
+    Returns
+    -------
+    tuple[int, int, int]
+        Number of rows rewritten, and the total size of the stored states in
+        bytes before and after.
+    """
+    table = AppletState.__table__
+    size = select(func.coalesce(func.sum(func.length(table.c.state_data)), 0))
+    with engine.connect() as conn:
+        size_before = conn.execute(size).scalar()
+    count, last_id = 0, None
+    while True:
+        with engine.begin() as conn:
+            query = select(table.c.id, table.c.state_data).order_by(table.c.id)
+            if last_id is not None:
+                query = query.where(table.c.id > last_id)
+            rows = conn.execute(query.limit(BATCH_SIZE)).all()
+            if not rows:
+                break
+            conn.execute(
+                update(table)
+                .where(table.c.id == bindparam("b_id"))
+                .values(state_data=bindparam("b_state_data")),
+                [{"b_id": row.id, "b_state_data": row.state_data} for row in rows],
+            )
+        count += len(rows)
+        last_id = rows[-1].id
+    with engine.connect() as conn:
+        size_after = conn.execute(size).scalar()
+    return count, size_before, size_after
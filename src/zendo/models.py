@@ -1,23 +1,64 @@
+import uuid
 from datetime import datetime, timezone
 from typing import Optional
 
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import JSON, Boolean, DateTime, Integer, String
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from werkzeug.security import check_password_hash, generate_password_hash
+from sqlalchemy import (
+    JSON,
+    Boolean,
+    DateTime,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Text,
+    TypeDecorator,
+)
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, validates
+from zendo.codecs import EncodedJSON
+from zendo.services.passwords import hash_password, verify_password
 
 
 def utcnow() -> datetime:
     return datetime.now(timezone.utc)
 
 
+def normalize_login(value: str) -> str:
+    """Normalized form of a username or email address used for lookups."""
+    return value.strip().lower()
+
+
+class BinaryUUID(TypeDecorator):
+    """UUID stored as 16 raw bytes and exposed as its canonical string."""
+
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            return uuid.UUID(str(value)).bytes
+        except ValueError:
+            # not a UUID, bind it as is so that lookups simply find nothing
+            return str(value).encode()
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return str(uuid.UUID(bytes=value))
+
+
 # Initialize SQLAlchemy with new style base
 class Base(DeclarativeBase):
     pass
 
 
-db = SQLAlchemy(model_class=Base)
+# Committed objects keep their loaded values: services hand them back to the
+# caller after committing, reading them must not refresh them with a SELECT.
+# Flask-SQLAlchemy scopes the session (and its identity map) to the request.
+db = SQLAlchemy(model_class=Base, session_options={"expire_on_commit": False})
 
 
 class User(db.Model, UserMixin):
@@ -30,6 +71,13 @@ class User(db.Model, UserMixin):
     email: Mapped[str] = mapped_column(
         String(120), unique=True, nullable=False, index=True
     )
+    # Lowercase lookup keys, logins and uniqueness checks ignore case
+    username_key: Mapped[str] = mapped_column(
+        String(80), unique=True, nullable=False, index=True
+    )
+    email_key: Mapped[str] = mapped_column(
+        String(120), unique=True, nullable=False, index=True
+    )
     password_hash: Mapped[str] = mapped_column(String(255), nullable=False)
     first_name: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
     last_name: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
@@ -54,16 +102,21 @@ class User(db.Model, UserMixin):
         self.first_name = first_name
         self.last_name = last_name
 
+    @validates("username", "email")
+    def set_login_key(self, key: str, value: str) -> str:
+        setattr(self, f"{key}_key", normalize_login(value))
+        return value
+
     def get_id(self) -> str:
         # Note: Flask-Login expects the user ID to be a string
         # Do not use this method manually
         return self.username
 
     def set_password(self, password: str) -> None:
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password: str) -> bool:
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
 
     def get_full_name(self) -> str:
         if self.first_name and self.last_name:
@@ -107,12 +160,29 @@ class User(db.Model, UserMixin):
 
 class AppletState(db.Model):
     __tablename__ = "applet_state"
+    __table_args__ = (
+        Index("ix_applet_state_user_id_updated_at", "user_id", "updated_at"),
+        Index("ix_applet_state_user_id_applet_name", "user_id", "applet_name"),
+    )
 
-    id: Mapped[str] = mapped_column(String, primary_key=True)
+    id: Mapped[str] = mapped_column(BinaryUUID, primary_key=True)
     user_id: Mapped[int] = mapped_column(Integer, nullable=False)
     applet_name: Mapped[str] = mapped_column(String(80), nullable=False)
     state_data: Mapped[Optional[JSON]] = mapped_column(
-        JSON, nullable=True, default=None
+        EncodedJSON, nullable=True, default=None
+    )
+    # "state" keeps the whole state in state_data, "events" keeps a snapshot
+    # in state_data and the changes made since in AppletEvent rows
+    storage: Mapped[str] = mapped_column(
+        String(16), default="state", server_default="state", nullable=False
+    )
+    snapshot_seq: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0", nullable=False
+    )
+    # Bumped by every write of state_data, writes based on an older version
+    # are refused
+    version: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0", nullable=False
     )
     created_at: Mapped[datetime] = mapped_column(
         DateTime, default=utcnow, nullable=False
@@ -121,13 +191,27 @@ class AppletState(db.Model):
         DateTime, default=utcnow, onupdate=utcnow, nullable=False
     )
 
+    # Sequence number of the last event applied to state_data, not persisted
+    event_seq = None
+    # Version (the event_seq with event storage) a new state computed from
+    # state_data is based on, see update_applet
+    revision = None
+
     def __init__(
-        self, id: str, user_id: int, applet_name: str, state_data: Optional[dict] = None
+        self,
+        id: str,
+        user_id: int,
+        applet_name: str,
+        state_data: Optional[dict] = None,
+        storage: str = "state",
     ):
         self.id = id
         self.user_id = user_id
         self.applet_name = applet_name
         self.state_data = state_data
+        self.storage = storage
+        self.snapshot_seq = 0
+        self.version = 0
 
     def to_dict(self) -> dict:
         return {
@@ -135,9 +219,82 @@ class AppletState(db.Model):
             "user_id": self.user_id,
             "applet_name": self.applet_name,
             "state_data": self.state_data,
+            "storage": self.storage,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
         }
 
     def __repr__(self) -> str:
         return f"<AppletState {self.applet_name} for User {self.user_id}>"
+
+
+class AppletEvent(db.Model):
+    __tablename__ = "applet_event"
+    __table_args__ = (
+        Index("ix_applet_event_applet_id_seq", "applet_id", "seq", unique=True),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    applet_id: Mapped[str] = mapped_column(BinaryUUID, nullable=False)
+    seq: Mapped[int] = mapped_column(Integer, nullable=False)
+    patch: Mapped[JSON] = mapped_column(JSON, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=utcnow, nullable=False
+    )
+
+    def __init__(self, applet_id: str, seq: int, patch: dict):
+        self.applet_id = applet_id
+        self.seq = seq
+        self.patch = patch
+
+    def __repr__(self) -> str:
+        return f"<AppletEvent {self.seq} for AppletState {self.applet_id}>"
+
+
+class ChatMessage(db.Model):
+    __tablename__ = "chat_message"
+    __table_args__ = (
+        # Messages are always read within a conversation of their owner
+        Index(
+            "ix_chat_message_conversation_id_user_id",
+            "conversation_id",
+            "user_id",
+            "id",
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    conversation_id: Mapped[str] = mapped_column(String(36), nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    role: Mapped[str] = mapped_column(String(20), nullable=False)
+    content: Mapped[str] = mapped_column(Text, nullable=False)
+    username: Mapped[Optional[str]] = mapped_column(String(80), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=utcnow, nullable=False
+    )
+
+    def __init__(
+        self,
+        conversation_id: str,
+        user_id: int,
+        role: str,
+        content: str,
+        username: Optional[str] = None,
+    ):
+        self.conversation_id = conversation_id
+        self.user_id = user_id
+        self.role = role
+        self.content = content
+        self.username = username
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "role": self.role,
+            "content": self.content,
+            "user": self.username,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+    def __repr__(self) -> str:
+        return f"<ChatMessage {self.id} in {self.conversation_id}>"
@@ -0,0 +1,421 @@
+"""
+Pre-forking production server.
+
+The master process opens the listening socket and forks the worker
+processes. Every worker accepts connections on the shared socket and
+serves them with a fixed pool of threads, so the kernel spreads
+connections over the workers and each worker can use its own core. The
+master restarts workers that die and stops them on SIGINT/SIGTERM,
+letting them finish their in-flight requests. Needs ``os.fork`` (POSIX).
+
+On SIGHUP the workers are replaced without downtime: a new generation of
+workers is started (one first, then the rest), and only once every new
+worker reports ready are the old ones stopped gracefully. The listening
+socket stays open in the master the whole time, so no connection is
+refused. If the new workers fail or are not ready in time, the old ones
+keep serving. With ``preload=False`` every worker loads the application
+itself, so a reload also picks up code changes.
+"""
+
+from __future__ import annotations
+
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from werkzeug.test import Client
+
+__all__ = ["PreforkServer"]
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Idle keep-alive connections hold a thread of the pool, drop them soon
+    timeout = 5
+
+
+class ThreadPoolWSGIServer(BaseWSGIServer):
+    """WSGI server handling requests with a bounded pool of threads.
+
+    A connection is only accepted while one of the threads is free. The
+    others wait in the listen backlog, where a worker process with a free
+    thread accepts them, instead of queueing behind busy threads.
+    """
+
+    multithread = True
+    multiprocess = True
+
+    def __init__(self, *args, threads: int, **kwargs):
+        super().__init__(*args, handler=KeepAliveRequestHandler, **kwargs)
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="zendo-worker"
+        )
+        # Taken before accepting a connection, released when it is closed
+        self.free_threads = threading.BoundedSemaphore(threads)
+
+    def get_request(self):
+        self.free_threads.acquire()
+        try:
+            return super().get_request()
+        except BaseException:
+            self.free_threads.release()
+            raise
+
+    def process_request(self, request, client_address):
+        try:
+            self.executor.submit(self.process_request_thread, request, client_address)
+        except BaseException:
+            self.free_threads.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.free_threads.release()
+
+    def server_close(self):
+        # let the in-flight requests finish
+        executor = getattr(self, "executor", None)
+        if executor is not None:
+            executor.shutdown(wait=True)
+        super().server_close()
+
+
+@dataclass
+class Worker:
+    number: int
+    generation: int
+    ready: bool = False
+    # monotonic time after which a stopping worker is killed
+    kill_at: float | None = None
+
+
+class PreforkServer:
+    """
+    Serve a WSGI application from several forked worker processes.
+
+    Parameters
+    ----------
+    load_app : Callable[[], Callable]
+        Creates the WSGI application.
+    host : str
+        Address to listen on.
+    port : int
+        Port to listen on.
+    workers : int, optional
+        Number of worker processes, by default 2.
+    threads : int, optional
+        Request threads per worker, by default 8.
+    preload : bool, optional
+        Create the application once in the master, before forking, so the
+        workers share the loaded code, by default True. Otherwise every
+        worker creates it, and reloads pick up code changes.
+    post_fork : Callable[[Callable], None], optional
+        Called with the preloaded application in every worker right after
+        it is forked, e.g. to drop database connections inherited from the
+        master.
+    worker_init : Callable[[Callable], None], optional
+        Called with the application in every worker once it is loaded,
+        e.g. to start background work, which must not run in the master.
+    health_path : str, optional
+        Path requested (in-process) by a new worker before it reports
+        ready, by default ``/healthz``. It must answer 200. None only
+        waits for the application to load.
+    ready_timeout : float, optional
+        Seconds a new generation of workers has to become ready, by
+        default 60.
+    graceful_timeout : float, optional
+        Seconds a stopping worker has to finish its requests before it is
+        killed, by default 30.
+    pid_file : str | Path, optional
+        File the master writes its PID to, e.g. for ``zendo reload``.
+    watch : Iterable[str | Path], optional
+        Directories whose ``*.py`` files are watched, a change triggers a
+        reload.
+    """
+
+    def __init__(
+        self,
+        load_app: Callable[[], Callable],
+        host: str,
+        port: int,
+        workers: int = 2,
+        threads: int = 8,
+        preload: bool = True,
+        post_fork: Callable[[Callable], None] | None = None,
+        worker_init: Callable[[Callable], None] | None = None,
+        health_path: str | None = "/healthz",
+        ready_timeout: float = 60,
+        graceful_timeout: float = 30,
+        pid_file: str | Path | None = None,
+        watch: Iterable[str | Path] = (),
+    ):
+        self.load_app = load_app
+        self.host = host
+        self.port = port
+        self.num_workers = workers
+        self.threads = threads
+        self.preload = preload
+        self.post_fork = post_fork
+        self.worker_init = worker_init
+        self.health_path = health_path
+        self.ready_timeout = ready_timeout
+        self.graceful_timeout = graceful_timeout
+        self.pid_file = Path(pid_file) if pid_file else None
+        self.watch = [Path(path) for path in watch]
+        self.app: Callable | None = None
+        self.socket: socket.socket | None = None
+        self.workers: dict[int, Worker] = {}  # pid -> worker
+        # workers write their pid here once ready
+        self.ready_pipe: tuple[int, int] | None = None
+        # generation being served, and the one being started
+        self.generation = 0
+        self.serving: int | None = None
+        self.pending: int | None = None
+        self.pending_deadline = 0.0
+        self.sources_mtime = 0.0
+        self.stopping = False
+        self.failed = False
+        self.reload_requested = False
+
+    def log(self, message: str) -> None:
+        print(f"[{os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+    def listen(self) -> socket.socket:
+        family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        sock = socket.create_server((self.host, self.port), family=family, backlog=2048)
+        sock.set_inheritable(True)
+        self.socket = sock
+        return sock
+
+    def spawn_worker(self, number: int, generation: int) -> int:
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = Worker(number, generation)
+            return pid
+        # worker process, never returns
+        status = 0
+        try:
+            self.run_worker()
+        except SystemExit:
+            pass
+        except BaseException:
+            status = 1
+            traceback.print_exc()
+        finally:
+            os._exit(status)
+
+    def run_worker(self) -> None:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, self.handle_worker_exit)
+        if self.app is None:
+            app = self.load_app()
+        else:
+            app = self.app
+            if self.post_fork is not None:
+                self.post_fork(app)
+        if self.worker_init is not None:
+            self.worker_init(app)
+        server = ThreadPoolWSGIServer(
+            self.host,
+            self.port,
+            app,
+            threads=self.threads,
+            fd=self.socket.fileno(),
+        )
+        try:
+            self.report_ready(app)
+            server.serve_forever()
+        except SystemExit:
+            pass
+        finally:
+            server.server_close()
+
+    def report_ready(self, app: Callable) -> None:
+        if self.health_path is not None:
+            response = Client(app).get(self.health_path)
+            if response.status_code != 200:
+                raise RuntimeError(
+                    f"Health check {self.health_path} failed: {response.status}"
+                )
+        os.write(self.ready_pipe[1], f"{os.getpid()}\n".encode())
+
+    def handle_worker_exit(self, signum, frame) -> None:
+        raise SystemExit(0)
+
+    def handle_stop(self, signum, frame) -> None:
+        self.stopping = True
+
+    def handle_reload(self, signum, frame) -> None:
+        self.reload_requested = True
+
+    def run(self) -> None:
+        """Start the workers and supervise them until stopped."""
+        if not hasattr(os, "fork"):
+            raise RuntimeError("The pre-forking server needs os.fork (POSIX)")
+        if self.preload:
+            self.app = self.load_app()
+        self.listen()
+        self.ready_pipe = os.pipe()
+        os.set_blocking(self.ready_pipe[0], False)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+        if self.pid_file is not None:
+            self.pid_file.parent.mkdir(parents=True, exist_ok=True)
+            self.pid_file.write_text(f"{os.getpid()}\n")
+        self.sources_mtime = self.get_sources_mtime()
+        self.log(
+            f"Listening on http://{self.host}:{self.port} with "
+            f"{self.num_workers} workers x {self.threads} threads"
+        )
+        try:
+            self.start_generation()
+            while not self.stopping:
+                self.read_ready(timeout=0.5)
+                self.reap_workers()
+                self.advance_generation()
+                self.kill_overdue()
+                if self.watch and self.pending is None:
+                    mtime = self.get_sources_mtime()
+                    if mtime != self.sources_mtime:
+                        self.sources_mtime = mtime
+                        self.reload_requested = True
+                if self.reload_requested and self.pending is None:
+                    self.reload_requested = False
+                    self.start_generation()
+            self.stop_workers(list(self.workers))
+        finally:
+            if self.pid_file is not None:
+                self.pid_file.unlink(missing_ok=True)
+        if self.failed:
+            raise RuntimeError("The workers failed to start")
+
+    def reload(self) -> None:
+        """Replace the workers with a new generation, without downtime."""
+        self.reload_requested = True
+
+    def start_generation(self) -> None:
+        self.generation += 1
+        self.pending = self.generation
+        self.pending_deadline = time.monotonic() + self.ready_timeout
+        if self.serving is not None:
+            self.log(f"Reloading, starting worker generation {self.generation}")
+        # One worker first: broken code fails fast, and only one process
+        # runs the application's startup (e.g. schema upgrades) at a time
+        self.spawn_worker(0, self.generation)
+
+    def advance_generation(self) -> None:
+        """Start the rest of a new generation, or retire the old one."""
+        if self.pending is None:
+            return
+        workers = [w for w in self.workers.values() if w.generation == self.pending]
+        if not all(worker.ready for worker in workers):
+            if time.monotonic() > self.pending_deadline:
+                self.abort_generation(f"not ready after {self.ready_timeout}s")
+            return
+        if len(workers) < self.num_workers:
+            for number in range(len(workers), self.num_workers):
+                self.spawn_worker(number, self.pending)
+            return
+        old = [pid for pid, w in self.workers.items() if w.generation != self.pending]
+        first = self.serving is None
+        self.serving, self.pending = self.pending, None
+        self.stop_workers(old, wait=False)
+        if not first:
+            self.log(f"Reloaded, generation {self.serving} is serving")
+
+    def abort_generation(self, reason: str) -> None:
+        generation, self.pending = self.pending, None
+        self.log(f"Worker generation {generation} failed: {reason}")
+        self.stop_workers(
+            [pid for pid, w in self.workers.items() if w.generation == generation],
+            wait=False,
+        )
+        if self.serving is None:
+            self.stopping = self.failed = True
+
+    def read_ready(self, timeout: float) -> None:
+        """Wait up to timeout for workers reporting ready."""
+        fd = self.ready_pipe[0]
+        if not select.select([fd], [], [], timeout)[0]:
+            return
+        try:
+            data = os.read(fd, 4096)
+        except BlockingIOError:
+            return
+        for pid in data.split():
+            worker = self.workers.get(int(pid))
+            if worker is not None:
+                worker.ready = True
+
+    def reap_workers(self) -> None:
+        """Collect exited workers and start replacements."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None or worker.kill_at is not None or self.stopping:
+                continue
+            if worker.generation == self.pending:
+                self.abort_generation(f"worker {pid} exited ({status})")
+            elif worker.generation == self.serving:
+                self.log(f"Worker {pid} exited ({status}), restarting")
+                self.spawn_worker(worker.number, worker.generation)
+
+    def kill_overdue(self) -> None:
+        now = time.monotonic()
+        for pid, worker in list(self.workers.items()):
+            if worker.kill_at is not None and now > worker.kill_at:
+                self.log(f"Worker {pid} did not stop in time, killing it")
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                worker.kill_at = float("inf")
+
+    def stop_workers(self, pids: list[int], wait: bool = True) -> None:
+        """Stop workers, letting them finish their requests first."""
+        kill_at = time.monotonic() + self.graceful_timeout
+        for pid in pids:
+            self.workers[pid].kill_at = kill_at
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        if not wait:
+            return
+        while self.workers:
+            self.reap_workers()
+            self.kill_overdue()
+            time.sleep(0.1)
+        self.log("Stopped")
+
+    def get_sources_mtime(self) -> float:
+        return max(
+            (
+                path.stat().st_mtime
+                for directory in self.watch
+                for path in directory.rglob("*.py")
+            ),
+            default=0.0,
+        )
@@ -1,56 +1,467 @@
-from zendo.models import AppletState, db
-from sqlalchemy.orm.attributes import flag_modified
+import copy
+import threading
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import delete, func, insert, select, update
+
+from zendo.config import config
+from zendo.database import is_sqlite
+from zendo.models import AppletEvent, AppletState, db, utcnow
+from zendo.services.cache import TTLCache
+from zendo.services.json_patch import JsonPatch, StatePatch, patch_from_dict
+
+
+@dataclass
+class CachedApplet:
+    """Applet row with its current state, as kept in the applet cache."""
+
+    id: str
+    user_id: int
+    applet_name: str
+    storage: str
+    state_data: Any
+    snapshot_seq: int
+    # Sequence number of the last event applied to state_data
+    event_seq: int | None
+    # Version of the row state_data was read at
+    version: int
+    created_at: datetime | None
+    updated_at: datetime | None
+    # Set when another writer got ahead, the entry is neither patched nor
+    # cached again
+    stale: bool = False
+    # Guards state_data, which writes replace or patch in place once committed
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def revision(self) -> int:
+        """Revision of state_data a new state computed from it is based on."""
+        return self.event_seq if self.storage == "events" else self.version
+
+    def to_model(self) -> AppletState:
+        """Detached AppletState with a private copy of the state."""
+        with self.lock:
+            state_data = copy.deepcopy(self.state_data)
+        applet = AppletState(
+            id=self.id,
+            user_id=self.user_id,
+            applet_name=self.applet_name,
+            state_data=state_data,
+            storage=self.storage,
+        )
+        applet.snapshot_seq = self.snapshot_seq
+        applet.event_seq = self.event_seq
+        applet.version = self.version
+        applet.revision = self.revision
+        applet.created_at = self.created_at
+        applet.updated_at = self.updated_at
+        return applet
+
+
+# Read-through cache of applet states keyed by (user_id, applet_id), kept
+# current by the write functions below. Other processes keep their own, so a
+# cached state may be behind the database: writes check the row version and
+# reload entries that fell behind.
+applet_cache: TTLCache[tuple[int, str], CachedApplet] = TTLCache(
+    maxsize=config.applet_cache_size, ttl=config.applet_cache_ttl
+)
+
+
+def applet_cache_stats() -> dict[str, Any]:
+    return applet_cache.stats()
 
 
 def create_applet(
-    id: str, user_id: int, applet_name: str, state_data: str | None = None
+    id: str,
+    user_id: int,
+    applet_name: str,
+    state_data: str | None = None,
+    storage: str = "state",
 ) -> tuple[bool, str, AppletState | None]:
     applet = AppletState(
         id=id,
         user_id=user_id,
         applet_name=applet_name,
         state_data=state_data,
+        storage=storage,
     )
     try:
         db.session.add(applet)
+        db.session.flush()
+        entry = CachedApplet(
+            id=id,
+            user_id=user_id,
+            applet_name=applet_name,
+            storage=storage,
+            state_data=copy.deepcopy(state_data),
+            snapshot_seq=0,
+            event_seq=0 if storage == "events" else None,
+            version=0,
+            created_at=applet.created_at,
+            updated_at=applet.updated_at,
+        )
         db.session.commit()
     except Exception as e:
         db.session.rollback()
         return False, f"Failed to create AppletState: {e}", None
+    applet_cache.set((user_id, id), entry)
     return True, "AppletState created successfully", applet
 
 
 def list_applets(user_id: int) -> tuple[bool, str, list[AppletState]]:
     try:
-        applets = AppletState.query.filter_by(user_id=user_id).all()
+        applets = (
+            AppletState.query.filter_by(user_id=user_id)
+            .order_by(AppletState.updated_at)
+            .all()
+        )
         return True, "User applets retrieved successfully", applets
     except Exception as e:
         return False, f"Failed to retrieve user applets: {e}", []
 
 
-def get_applet(user_id: int, applet_id: str) -> tuple[bool, str, AppletState | None]:
+def select_applet(user_id: int, applet_id: str):
+    return db.session.execute(
+        select(
+            AppletState.id,
+            AppletState.user_id,
+            AppletState.applet_name,
+            AppletState.storage,
+            AppletState.state_data,
+            AppletState.snapshot_seq,
+            AppletState.version,
+            AppletState.created_at,
+            AppletState.updated_at,
+        ).where(AppletState.user_id == user_id, AppletState.id == applet_id)
+    ).one_or_none()
+
+
+def load_applet(
+    user_id: int, applet_id: str, at: int | None = None
+) -> CachedApplet | None:
+    """Load an applet from the database, rebuilding event-sourced state.
+
+    The latest state is put in the applet cache, point-in-time states
+    (``at``) are not.
+    """
+    row = select_applet(user_id, applet_id)
+    if row is None:
+        return None
+    state, seq = row.state_data, None
+    if row.storage == "events":
+        state, seq = replay_events(row.id, state, row.snapshot_seq, at=at)
+    entry = CachedApplet(
+        id=row.id,
+        user_id=row.user_id,
+        applet_name=row.applet_name,
+        storage=row.storage,
+        state_data=state,
+        snapshot_seq=row.snapshot_seq,
+        event_seq=seq,
+        version=row.version,
+        created_at=row.created_at,
+        updated_at=row.updated_at,
+    )
+    if at is None:
+        applet_cache.set((user_id, applet_id), entry)
+    return entry
+
+
+def lookup_applet(user_id: int, applet_id: str) -> CachedApplet | None:
+    entry = applet_cache.get((user_id, applet_id))
+    if entry is None:
+        entry = load_applet(user_id, applet_id)
+    return entry
+
+
+def get_applet(
+    user_id: int, applet_id: str, at: int | None = None
+) -> tuple[bool, str, AppletState | None]:
     try:
-        applet = AppletState.query.filter_by(user_id=user_id, id=applet_id).first()
-        if applet is None:
+        if at is None:
+            entry = lookup_applet(user_id, applet_id)
+        else:
+            row = select_applet(user_id, applet_id)
+            if row is not None and row.storage != "events":
+                return False, "Point-in-time reads need event storage", None
+            if row is not None and at < row.snapshot_seq:
+                return (
+                    False,
+                    f"AppletState before revision {row.snapshot_seq} "
+                    "has been compacted",
+                    None,
+                )
+            entry = load_applet(user_id, applet_id, at=at)
+        if entry is None:
             return False, "AppletState not found", None
-        return True, "AppletState retrieved successfully", applet
+        return True, "AppletState retrieved successfully", entry.to_model()
     except Exception as e:
         return False, f"Failed to retrieve AppletState: {e}", None
 
 
+def replay_events(
+    applet_id: str, state: Any, snapshot_seq: int, at: int | None = None
+) -> tuple[Any, int]:
+    """Rebuild the state of an event-sourced applet from its snapshot.
+
+    Returns the state and the sequence number of the last event applied.
+    """
+    query = select(AppletEvent.seq, AppletEvent.patch).where(
+        AppletEvent.applet_id == applet_id, AppletEvent.seq > snapshot_seq
+    )
+    if at is not None:
+        query = query.where(AppletEvent.seq <= at)
+    seq = snapshot_seq
+    for event in db.session.execute(query.order_by(AppletEvent.seq)):
+        state = patch_from_dict(event.patch).apply(state)
+        seq = event.seq
+    return state, seq
+
+
+def commit_event(
+    entry: CachedApplet, patch: StatePatch, revision: int | None = None
+) -> CachedApplet | None:
+    """Record a change of an event-sourced applet as a new event row.
+
+    Every ``config.applet_snapshot_every`` events the state is folded into
+    the snapshot stored in ``state_data`` and the older events are deleted.
+    With a ``revision``, returns None without writing when other events were
+    recorded after it.
+    """
+    next_seq = (
+        select(func.coalesce(func.max(AppletEvent.seq), 0) + 1)
+        .where(AppletEvent.applet_id == entry.id)
+        .scalar_subquery()
+    )
+    seq = db.session.execute(
+        insert(AppletEvent)
+        .values(applet_id=entry.id, seq=next_seq, patch=patch.to_dict())
+        .returning(AppletEvent.seq)
+    ).scalar_one()
+    if revision is not None and seq != revision + 1:
+        db.session.rollback()
+        mark_stale(entry)
+        return None
+    with entry.lock:
+        current = not entry.stale and entry.event_seq == seq - 1
+        if current:
+            # Patched on a copy, the cached state only changes once the event
+            # is committed
+            written = replace(
+                entry,
+                state_data=patch.apply(copy.deepcopy(entry.state_data)),
+                event_seq=seq,
+                lock=threading.Lock(),
+            )
+    if not current:
+        # Written by another process since it was cached, rebuild it
+        written = load_applet(entry.user_id, entry.id, at=seq)
+    if seq - written.snapshot_seq >= config.applet_snapshot_every:
+        db.session.execute(
+            update(AppletState)
+            .where(AppletState.id == entry.id)
+            .values(
+                state_data=written.state_data, snapshot_seq=seq, updated_at=utcnow()
+            )
+        )
+        # Keep the event at the snapshot, it anchors the next sequence number
+        db.session.execute(
+            delete(AppletEvent).where(
+                AppletEvent.applet_id == entry.id, AppletEvent.seq < seq
+            )
+        )
+        written.snapshot_seq = seq
+    db.session.commit()
+    with entry.lock:
+        # Left as is when a newer event got there first
+        if current and not entry.stale and entry.event_seq == seq - 1:
+            entry.state_data = written.state_data
+            entry.event_seq = seq
+            entry.snapshot_seq = written.snapshot_seq
+            return entry
+    if not current:
+        mark_stale(entry)
+        applet_cache.set((written.user_id, written.id), written)
+    return written
+
+
+def mark_stale(entry: CachedApplet) -> None:
+    """Drop an entry another writer got ahead of, it is reloaded on use."""
+    with entry.lock:
+        entry.stale = True
+    applet_cache.pop((entry.user_id, entry.id))
+
+
 def update_applet(
-    user_id: int, applet_id: str, state_data: dict | None = None
+    user_id: int,
+    applet_id: str,
+    state_data: dict | None = None,
+    revision: int | None = None,
 ) -> tuple[bool, str, AppletState | None]:
+    """
+    Replace the state of an applet.
+
+    Parameters
+    ----------
+    user_id : int
+        Owner of the applet.
+    applet_id : str
+        Id of the applet.
+    state_data : dict, optional
+        The new state.
+    revision : int, optional
+        ``AppletState.revision`` of the state state_data was computed from.
+        The update fails if the applet changed since, so that concurrent
+        read-modify-write updates are not lost. By default the state is
+        replaced whatever it is.
+    """
     try:
-        applet: AppletState = AppletState.query.filter_by(
-            user_id=user_id, id=applet_id
-        ).first()
-        if applet is None:
+        entry = lookup_applet(user_id, applet_id)
+        if entry is None:
             return False, "AppletState not found", None
-        applet.state_data = state_data
-        flag_modified(applet, "state_data")
+        if entry.storage == "events":
+            entry = commit_event(
+                entry,
+                JsonPatch([{"op": "replace", "path": "", "value": state_data}]),
+                revision=revision,
+            )
+            if entry is None:
+                return False, "AppletState changed since it was read", None
+            return True, "AppletState updated successfully", entry.to_model()
+        updated_at = utcnow()
+        query = update(AppletState).where(
+            AppletState.user_id == user_id, AppletState.id == applet_id
+        )
+        if revision is not None:
+            query = query.where(AppletState.version == revision)
+        version = db.session.execute(
+            query.values(
+                state_data=state_data,
+                version=AppletState.version + 1,
+                updated_at=updated_at,
+            ).returning(AppletState.version),
+            execution_options={"synchronize_session": False},
+        ).scalar_one_or_none()
+        if version is None:
+            db.session.rollback()
+            mark_stale(entry)
+            return False, "AppletState changed since it was read", None
         db.session.commit()
-        return True, "AppletState updated successfully", applet
+        written = replace(
+            entry,
+            state_data=state_data,
+            version=version,
+            updated_at=updated_at,
+            stale=False,
+            lock=threading.Lock(),
+        )
+        with entry.lock:
+            # Left as is when a newer write got there first
+            if not entry.stale and entry.version < version:
+                entry.state_data = copy.deepcopy(state_data)
+                entry.version = version
+                entry.updated_at = updated_at
+            cached = not entry.stale
+        if cached:
+            applet_cache.set((user_id, applet_id), entry)
+        return True, "AppletState updated successfully", written.to_model()
     except Exception as e:
         db.session.rollback()
+        applet_cache.pop((user_id, applet_id))
         return False, f"Failed to update AppletState: {e}", None
+
+
+def patch_applet(
+    user_id: int, applet_id: str, patch: StatePatch
+) -> tuple[bool, str, AppletState | None]:
+    try:
+        entry = lookup_applet(user_id, applet_id)
+        if entry is None:
+            return False, "AppletState not found", None
+        if entry.storage == "events":
+            entry = commit_event(entry, patch)
+            return True, "AppletState patched successfully", entry.to_model()
+        updated_at = utcnow()
+        version = None
+        expression = None
+        if is_sqlite(str(db.engine.url)):
+            expression = patch.to_sql(AppletState.state_data)
+        if expression is not None:
+            # Let SQLite patch the stored document in place, the state is
+            # neither loaded nor re-serialized here. Only possible while the
+            # state is stored as plain JSON text (see zendo.codecs).
+            version = db.session.execute(
+                update(AppletState)
+                .where(
+                    AppletState.user_id == user_id,
+                    AppletState.id == applet_id,
+                    func.typeof(AppletState.state_data) == "text",
+                    # The patch does not apply, let patch.apply raise
+                    expression.is_not(None),
+                )
+                .values(
+                    state_data=expression,
+                    version=AppletState.version + 1,
+                    updated_at=updated_at,
+                )
+                .returning(AppletState.version),
+                execution_options={"synchronize_session": False},
+            ).scalar_one_or_none()
+        if version is not None:
+            db.session.commit()
+            with entry.lock:
+                # Once committed, patch the cached state like the database
+                # did, unless it missed a write
+                current = not entry.stale and entry.version == version - 1
+                if current:
+                    entry.state_data = patch.apply(entry.state_data)
+                    entry.version = version
+                    entry.updated_at = updated_at
+            if not current:
+                mark_stale(entry)
+                entry = load_applet(user_id, applet_id)
+        else:
+            while True:
+                with entry.lock:
+                    state_data = patch.apply(copy.deepcopy(entry.state_data))
+                    # Only over the version the patch was applied to
+                    version = db.session.execute(
+                        update(AppletState)
+                        .where(
+                            AppletState.user_id == user_id,
+                            AppletState.id == applet_id,
+                            AppletState.version == entry.version,
+                        )
+                        .values(
+                            state_data=state_data,
+                            version=entry.version + 1,
+                            updated_at=updated_at,
+                        )
+                        .returning(AppletState.version),
+                        execution_options={"synchronize_session": False},
+                    ).scalar_one_or_none()
+                    if version is not None:
+                        break
+                # Written by another process since it was cached, patch the
+                # current state
+                db.session.rollback()
+                mark_stale(entry)
+                entry = load_applet(user_id, applet_id)
+                if entry is None:
+                    return False, "AppletState not found", None
+            db.session.commit()
+            with entry.lock:
+                # Left as is when a newer write got there first
+                if not entry.stale and entry.version == version - 1:
+                    entry.state_data = state_data
+                    entry.version = version
+                    entry.updated_at = updated_at
+        if not entry.stale:
+            applet_cache.set((user_id, applet_id), entry)
+        return True, "AppletState patched successfully", entry.to_model()
+    except Exception as e:
+        db.session.rollback()
+        applet_cache.pop((user_id, applet_id))
+        return False, f"Failed to patch AppletState: {e}", None
@@ -0,0 +1,258 @@
+"""
+Periodic applet work.
+
+Applets with a ``tick_interval`` have their ``tick(state, now)`` hook
+called about every ``tick_interval`` seconds, for every stored instance, by
+one shared :class:`Scheduler`. Ticks run on a bounded pool of
+``config.applet_tick_workers`` threads, so any number of ticking applets
+costs a fixed number of threads and no requests. The new state or patch a
+tick returns is written through the applet state service.
+
+- Jitter: the first tick of an instance is spread over its interval and
+  every tick is delayed by up to ``config.applet_tick_jitter`` of it, so
+  instances do not tick in lockstep.
+- Coalescing: an instance has at most one tick pending or running. Ticks
+  missed while it ran late are dropped and the next one is due at the
+  following multiple of the interval.
+- Limits: at most ``max_concurrent_ticks`` ticks of one applet type run at
+  once. Ticks over the limit wait in line and run, in order, as the running
+  ones finish.
+- One process: ticks only run in the process of the host holding
+  ``scheduler_lease`` (see ``zendo.services.lease``), elsewhere scheduling
+  a tick does nothing. That process schedules the instances created by the
+  others when it syncs with the database (:func:`schedule_applet_ticks`).
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import random
+import threading
+import time
+import traceback
+from collections import deque
+from collections.abc import Callable, Mapping
+from typing import Any
+
+from flask import Flask, current_app
+from sqlalchemy import select
+
+from zendo.config import config
+from zendo.models import AppletState, db
+from zendo.services.applet_state import lookup_applet, patch_applet, update_applet
+from zendo.services.json_patch import JsonPatch, MergePatch
+from zendo.services.lease import scheduler_lease
+from zendo.services.scheduler import Scheduler
+
+__all__ = [
+    "applet_tick_stats",
+    "schedule_applet_tick",
+    "schedule_applet_ticks",
+    "tick_scheduler",
+]
+
+tick_scheduler = Scheduler(
+    name="zendo-applet-ticks", workers=config.applet_tick_workers
+)
+
+
+class TickLimit:
+    """Slots for the running ticks of one applet type."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.active = 0
+        # (applet id, tick) waiting for a slot
+        self.waiting: deque[tuple[str, Callable[[], None]]] = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self, applet_id: str, tick: Callable[[], None]) -> bool:
+        """Take a slot, or put the tick in line and return False."""
+        with self.lock:
+            if self.active < self.size:
+                self.active += 1
+                return True
+            self.waiting.append((applet_id, tick))
+            return False
+
+    def release(self) -> tuple[str, Callable[[], None]] | None:
+        """Free a slot, or hand it to the next tick in line and return it."""
+        with self.lock:
+            if self.waiting:
+                return self.waiting.popleft()
+            self.active -= 1
+            return None
+
+
+# Applet name -> limit of its concurrent ticks
+_limits: dict[str, TickLimit] = {}
+_limits_lock = threading.Lock()
+
+# Ids of the instances with a tick scheduled, waiting for a slot or
+# running, each has one chain of ticks at most
+_active: set[str] = set()
+_stats = {"ticks": 0, "coalesced": 0, "deferred": 0, "errors": 0}
+# Guards _active and _stats, updated from the scheduler's threads
+_lock = threading.Lock()
+
+
+def _after_fork() -> None:
+    # The schedule is not copied into the child (see Scheduler)
+    global _lock
+    _lock = threading.Lock()
+    _active.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def count(name: str, n: int = 1) -> None:
+    with _lock:
+        _stats[name] += n
+
+
+def applet_tick_stats() -> dict[str, Any]:
+    with _lock:
+        stats = {**_stats, "active": len(_active)}
+    return {**stats, **tick_scheduler.stats()}
+
+
+def get_limit(applet_class: type) -> TickLimit:
+    with _limits_lock:
+        limit = _limits.get(applet_class.name)
+        if limit is None:
+            limit = TickLimit(applet_class.max_concurrent_ticks)
+            _limits[applet_class.name] = limit
+        return limit
+
+
+def jitter(interval: float) -> float:
+    return random.uniform(0, interval * config.applet_tick_jitter)
+
+
+def schedule_applet_tick(
+    applet_class: type, user_id: int, applet_id: str, due: float | None = None
+) -> None:
+    """
+    Schedule the next tick of an applet instance.
+
+    Parameters
+    ----------
+    applet_class : type[Applet]
+        Class of the applet, nothing is scheduled without a tick_interval.
+    user_id : int
+        Owner of the applet.
+    applet_id : str
+        Id of the applet.
+    due : float, optional
+        Time (``time.time()``) the tick is due, before jitter. By default a
+        random time within the first interval.
+    """
+    interval = applet_class.tick_interval
+    if not interval or not scheduler_lease.held:
+        return
+    if due is None:
+        due = time.time() + random.uniform(0, interval)
+    app = current_app._get_current_object()
+    with _lock:
+        _active.add(applet_id)
+    tick_scheduler.schedule(
+        applet_id,
+        due + jitter(interval),
+        lambda: run_tick(app, applet_class, user_id, applet_id, due),
+    )
+
+
+def run_tick(
+    app: Flask,
+    applet_class: type,
+    user_id: int,
+    applet_id: str,
+    due: float,
+    has_slot: bool = False,
+) -> None:
+    interval = applet_class.tick_interval
+    limit = get_limit(applet_class)
+    if not has_slot and not limit.acquire(
+        applet_id,
+        lambda: run_tick(app, applet_class, user_id, applet_id, due, has_slot=True),
+    ):
+        count("deferred")
+        return
+    rescheduled = False
+    try:
+        try:
+            with app.app_context():
+                exists = tick_applet(applet_class, user_id, applet_id)
+        finally:
+            waiting = limit.release()
+            if waiting is not None:
+                # Due right away, it has waited for the slot already
+                tick_scheduler.schedule(waiting[0], 0, waiting[1])
+        if exists:
+            missed = max(0, math.floor((time.time() - due) / interval))
+            count("coalesced", missed)
+            with app.app_context():
+                schedule_applet_tick(
+                    applet_class, user_id, applet_id, due + (missed + 1) * interval
+                )
+            rescheduled = True
+    finally:
+        if not rescheduled:
+            # The chain ends, a sync may start a new one
+            with _lock:
+                _active.discard(applet_id)
+
+
+def tick_applet(applet_class: type, user_id: int, applet_id: str) -> bool:
+    """Run one tick of an applet and store its result.
+
+    Returns False when the applet no longer exists.
+    """
+    entry = lookup_applet(user_id, applet_id)
+    if entry is None:
+        return False
+    count("ticks")
+    try:
+        applet = applet_class(id=applet_id)
+        result = applet.tick(entry.to_model().state_data, time.time())
+        if isinstance(result, (JsonPatch, MergePatch)):
+            success, msg, _ = patch_applet(user_id, applet_id, result)
+        elif result is not None:
+            success, msg, _ = update_applet(
+                user_id, applet_id, state_data=result, revision=entry.revision
+            )
+        else:
+            success, msg = True, ""
+        if not success:
+            raise RuntimeError(msg)
+    except Exception:
+        count("errors")
+        traceback.print_exc()
+    return True
+
+
+def schedule_applet_ticks(applets: Mapping[str, type]) -> int:
+    """Schedule the ticks of the stored instances of the ticking applets.
+
+    Instances with a tick scheduled, waiting for a slot or running are left
+    as they are. Returns the number of applet instances scheduled.
+    """
+    classes = {cls.name: cls for cls in applets.values() if cls.tick_interval}
+    if not classes:
+        return 0
+    rows = db.session.execute(
+        select(AppletState.id, AppletState.user_id, AppletState.applet_name).where(
+            AppletState.applet_name.in_(classes)
+        )
+    )
+    with _lock:
+        active = set(_active)
+    scheduled = 0
+    for row in rows:
+        if row.id not in active:
+            schedule_applet_tick(classes[row.applet_name], row.user_id, row.id)
+            scheduled += 1
+    return scheduled
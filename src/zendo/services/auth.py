@@ -1,12 +1,32 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from flask import Flask, current_app, session
 from flask_login import (
     LoginManager,
     current_user,
     login_required,
     login_user,
     logout_user,
+    user_logged_in,
+    user_logged_out,
 )
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy import event, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, make_transient_to_detached
 
-from zendo.models import User, db
+from zendo.config import config
+from zendo.models import User, db, normalize_login
+from zendo.services.bloom import BloomFilter
+from zendo.services.cache import TTLCache
+from zendo.services.passwords import PasswordHashBusy, needs_rehash
+from zendo.services.throttle import RateLimiter
 
 __all__ = [
     "login_manager",
@@ -18,6 +38,14 @@ __all__ = [
     "authenticate_user",
     "update_user_profile",
     "change_password",
+    "user_cache_stats",
+    "UserClaims",
+    "revoke_tokens",
+    "login_throttle_stats",
+    "build_login_filter",
+    "is_username_taken",
+    "is_email_taken",
+    "check_lookup_throttle",
 ]
 
 login_manager = LoginManager()
@@ -27,40 +55,371 @@ login_manager.login_view = "/login"  # Redirect to login page
 current_user: User | None
 
 
+# Column values of users loaded by Flask-Login, keyed by username (the id
+# returned by User.get_id)
+user_cache: TTLCache[str, dict[str, Any]] = TTLCache(
+    maxsize=config.user_cache_size, ttl=config.user_cache_ttl
+)
+
+
+def user_cache_stats() -> dict[str, Any]:
+    return user_cache.stats()
+
+
 @login_manager.user_loader
-def load_user(user_id: str) -> User | None:
-    return User.query.filter_by(username=user_id).one_or_none()
+def load_user(user_id: str) -> User | UserClaims | None:
+    if config.auth_mode == "token":
+        claims = load_claims(user_id)
+        if claims is not None:
+            return claims
+    user = load_user_snapshot(user_id)
+    if user is not None and config.auth_mode == "token":
+        # (re)issue the token, so the next requests need no lookup
+        issue_token(user)
+    return user
+
+
+def load_user_snapshot(user_id: str) -> User | None:
+    values = user_cache.get(user_id)
+    if values is None:
+        row = (
+            db.session.execute(select(User.__table__).where(User.username == user_id))
+            .mappings()
+            .one_or_none()
+        )
+        if row is None:
+            return None
+        values = dict(row)
+        user_cache.set(user_id, values)
+    # Every request gets its own detached snapshot, it is not tracked by the
+    # session and reading it never triggers a query
+    user = User(username=values["username"], email=values["email"])
+    for key, value in values.items():
+        setattr(user, key, value)
+    make_transient_to_detached(user)
+    return user
+
+
+@event.listens_for(User, "after_update")
+def invalidate_cached_user(mapper, connection, target: User) -> None:
+    # update_user_profile, change_password, activate and deactivate all flush
+    # the user, a renamed user is cached under its old username
+    history = inspect(target).attrs.username.history
+    usernames = {target.username, *history.deleted}
+    for username in usernames:
+        user_cache.pop(username)
+        revoke_tokens(username)
+    db_session = inspect(target).session
+    if db_session is not None:
+        db_session.info.setdefault("stale_usernames", set()).update(usernames)
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_committed_users(db_session: Session) -> None:
+    # Drop them again, a concurrent request may have cached the old row
+    # between the flush and the commit
+    for username in db_session.info.pop("stale_usernames", ()):
+        user_cache.pop(username)
+        revoke_tokens(username)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_stale_users(db_session: Session) -> None:
+    db_session.info.pop("stale_usernames", None)
+
+
+# Token auth mode (config.auth_mode = "token"): the Flask session carries a
+# signed, short-lived token with the claims the UI needs, so requests are
+# served without loading the user. Tokens older than half their lifetime
+# are reissued from a fresh user snapshot.
+TOKEN_SESSION_KEY = "_zendo_claims"
+
+
+@dataclass
+class UserClaims:
+    """Logged-in user as described by the claims of a session token."""
+
+    id: int
+    username: str
+    email: str
+    first_name: str | None
+    last_name: str | None
+    is_active: bool
+
+    # Flask-Login user interface
+    is_authenticated = True
+    is_anonymous = False
+
+    def get_id(self) -> str:
+        return self.username
+
+    def get_full_name(self) -> str:
+        return User.get_full_name(self)
+
+
+# Usernames whose tokens issued up to the stored time are refused, in the
+# order they were revoked. Not bounded by a size: evicting an entry early
+# would make its revoked tokens valid again. Entries go once every such token
+# has expired anyway.
+token_denylist: OrderedDict[str, float] = OrderedDict()
+token_denylist_lock = threading.Lock()
+
+
+def token_serializer() -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(current_app.secret_key, salt="zendo-claims")
+
+
+def issue_token(user: User | UserClaims) -> None:
+    claims = UserClaims(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        first_name=user.first_name,
+        last_name=user.last_name,
+        is_active=user.is_active,
+    )
+    # The signature timestamp has whole seconds, too coarse for the denylist
+    payload = {**asdict(claims), "iat": time.time()}
+    session[TOKEN_SESSION_KEY] = token_serializer().dumps(payload)
+
+
+def load_claims(user_id: str) -> UserClaims | None:
+    token = session.get(TOKEN_SESSION_KEY)
+    if token is None:
+        return None
+    try:
+        claims = token_serializer().loads(token, max_age=config.auth_token_ttl)
+    except BadSignature:
+        # tampered or expired
+        return None
+    if claims.get("username") != user_id:
+        return None
+    issued_at = claims.pop("iat")
+    revoked_at = token_denylist.get(user_id)
+    if revoked_at is not None and issued_at <= revoked_at:
+        return None
+    if time.time() - issued_at > config.auth_token_ttl / 2:
+        # due for a refresh
+        return None
+    return UserClaims(**claims)
+
+
+def revoke_tokens(username: str) -> None:
+    """Refuse the tokens issued to a user so far, they are reissued on use."""
+    now = time.time()
+    with token_denylist_lock:
+        # Moved to the end, so the oldest revocations come first
+        token_denylist[username] = now
+        token_denylist.move_to_end(username)
+        while token_denylist:
+            name = next(iter(token_denylist))
+            if now - token_denylist[name] <= config.auth_token_ttl:
+                break
+            del token_denylist[name]
+
+
+@user_logged_in.connect
+def on_logged_in(sender, user) -> None:
+    if config.auth_mode == "token":
+        issue_token(user)
+
+
+@user_logged_out.connect
+def on_logged_out(sender, user) -> None:
+    session.pop(TOKEN_SESSION_KEY, None)
+
+
+# Bloom filter of the username and email keys of all users, answers most
+# availability checks without a query. Users added by other processes are
+# picked up when it is rebuilt, every config.login_filter_ttl seconds. It is
+# first built on use, so processes that never check a login (e.g. the CLI
+# commands) do not read every user.
+login_filter: BloomFilter | None = None
+login_filter_built_at = 0.0
+login_filter_lock = threading.Lock()
+login_filter_build_lock = threading.Lock()
+login_filter_rebuilding = False
+
+
+def build_login_filter() -> BloomFilter:
+    """Build the filter of existing usernames and emails, needs an app context."""
+    global login_filter, login_filter_built_at
+    built_at = time.monotonic()
+    count = db.session.query(User.id).count()
+    # two keys per user, and as much room again to grow before it fills
+    keys = BloomFilter(capacity=max(4 * count, 1000))
+    result = db.session.execute(
+        select(User.username_key, User.email_key).execution_options(yield_per=10000)
+    )
+    for row in result:
+        keys.add(f"u:{row.username_key}")
+        keys.add(f"e:{row.email_key}")
+    with login_filter_lock:
+        login_filter, login_filter_built_at = keys, built_at
+    return keys
+
+
+def rebuild_login_filter(app: Flask) -> None:
+    global login_filter_rebuilding
+    try:
+        with app.app_context():
+            build_login_filter()
+    finally:
+        login_filter_rebuilding = False
+
+
+def get_login_filter() -> BloomFilter:
+    global login_filter_rebuilding
+    keys = login_filter
+    if keys is None:
+        # Requests arriving meanwhile wait for this first build
+        with login_filter_build_lock:
+            keys = login_filter
+            if keys is None:
+                keys = build_login_filter()
+        return keys
+    stale = time.monotonic() - login_filter_built_at > config.login_filter_ttl
+    if (stale or keys.full) and not login_filter_rebuilding:
+        # Keep answering from the current filter while a new one is built,
+        # building it takes seconds with many users
+        with login_filter_lock:
+            if login_filter_rebuilding:
+                return keys
+            login_filter_rebuilding = True
+        threading.Thread(
+            target=rebuild_login_filter,
+            args=(current_app._get_current_object(),),
+            daemon=True,
+        ).start()
+    return keys
+
+
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_update")
+def add_login_keys(mapper, connection, target: User) -> None:
+    keys = login_filter
+    if keys is not None:
+        keys.add(f"u:{target.username_key}")
+        keys.add(f"e:{target.email_key}")
+
+
+def is_username_taken(username: str) -> bool:
+    """Whether a username is taken in any casing, queries only on a filter hit."""
+    key = normalize_login(username)
+    if f"u:{key}" not in get_login_filter():
+        return False
+    return (
+        db.session.query(User.id).filter(User.username_key == key).first() is not None
+    )
+
+
+def is_email_taken(email: str) -> bool:
+    """Whether an email is taken in any casing, queries only on a filter hit."""
+    key = normalize_login(email)
+    if f"e:{key}" not in get_login_filter():
+        return False
+    return db.session.query(User.id).filter(User.email_key == key).first() is not None
 
 
 def register_user(
-    username, email, password, first_name=None, last_name=None
+    username, email, password, first_name=None, last_name=None, remote_addr=None
 ) -> tuple[bool, str, User | None]:
-    # Check if username already exists
-    if User.query.filter_by(username=username).first():
+    message = check_lookup_throttle(remote_addr)
+    if message is not None:
+        return False, message, None
+    # Login identifiers containing "@" are looked up as email addresses
+    if "@" in username:
+        return False, "Username cannot contain '@'", None
+    # Check if username already exists (in any casing)
+    if User.query.filter_by(username_key=normalize_login(username)).first():
         return False, "Username already exists", None
-    # Check if email already exists
-    if User.query.filter_by(email=email).first():
+    # Check if email already exists (in any casing)
+    if User.query.filter_by(email_key=normalize_login(email)).first():
         return False, "Email already exists", None
     # Create new user
     user = User(
         username=username, email=email, first_name=first_name, last_name=last_name
     )
-    user.set_password(password)
     try:
+        user.set_password(password)
         db.session.add(user)
         db.session.commit()
         return True, "User registered successfully", user
+    except IntegrityError:
+        # Taken by a concurrent registration, the lookup keys are unique
+        db.session.rollback()
+        return False, "Username or email already exists", None
     except Exception as e:
         db.session.rollback()
         return False, f"Registration failed: {str(e)}", None
 
 
-def authenticate_user(username: str, password: str):
-    # Try to find user by username or email
-    user: User = User.query.filter(
-        (User.username == username) | (User.email == username)
-    ).first()
-    if user and user.check_password(password) and user.is_active:
+# Token buckets limiting login attempts, checked before any database or
+# hashing work is done for an attempt
+username_throttle = RateLimiter(
+    rate=config.login_attempts_per_username / 60,
+    burst=config.login_attempts_per_username,
+    maxsize=config.login_throttle_size,
+)
+ip_throttle = RateLimiter(
+    rate=config.login_attempts_per_ip / 60,
+    burst=config.login_attempts_per_ip,
+    maxsize=config.login_throttle_size,
+)
+
+# Limits the registration form's lookups (availability checks and
+# submissions), each tells whether a username or email is registered
+lookup_throttle = RateLimiter(
+    rate=config.login_lookups_per_ip / 60,
+    burst=config.login_lookups_per_ip,
+    maxsize=config.login_throttle_size,
+)
+
+
+def login_throttle_stats() -> dict[str, Any]:
+    return {
+        "username": username_throttle.stats(),
+        "ip": ip_throttle.stats(),
+        "lookup": lookup_throttle.stats(),
+    }
+
+
+def check_lookup_throttle(remote_addr: str | None) -> str | None:
+    """Error message for a client over its lookups, None when allowed."""
+    if remote_addr is None or lookup_throttle.hit(remote_addr):
+        return None
+    wait = lookup_throttle.retry_after(remote_addr)
+    return f"Too many checks, try again in {wait:.0f}s"
+
+
+def authenticate_user(username: str, password: str, remote_addr: str | None = None):
+    if remote_addr is not None and not ip_throttle.hit(remote_addr):
+        wait = ip_throttle.retry_after(remote_addr)
+        return False, f"Too many login attempts, try again in {wait:.0f}s", None
+    key = normalize_login(username)
+    if not username_throttle.hit(key):
+        wait = username_throttle.retry_after(key)
+        return False, f"Too many login attempts, try again in {wait:.0f}s", None
+    # Usernames cannot contain "@", so the identifier is either an email or
+    # a username: a single probe of one index, in any casing
+    column = User.email_key if "@" in key else User.username_key
+    user: User = User.query.filter(column == key).first()
+    try:
+        valid = user is not None and user.check_password(password)
+    except PasswordHashBusy:
+        username_throttle.refund(key)
+        return False, "Too many login attempts, please try again shortly", None
+    if valid and user.is_active:
+        # Only failed attempts count against the username
+        username_throttle.refund(key)
+        if needs_rehash(user.password_hash):
+            # Upgrade to the configured hash parameters while the plain
+            # password is at hand
+            try:
+                user.set_password(password)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
         return True, "Login successful", user
     return False, "Invalid username/email or password", None
 
@@ -71,11 +430,18 @@ def update_user_profile(user_id: int, **kwargs):
         return False, "User not found", None
     # Check for username conflicts
     if "username" in kwargs and kwargs["username"] != user.username:
-        if User.query.filter_by(username=kwargs["username"]).first():
+        if "@" in kwargs["username"]:
+            return False, "Username cannot contain '@'", None
+        if User.query.filter(
+            User.username_key == normalize_login(kwargs["username"]),
+            User.id != user.id,
+        ).first():
             return False, "Username already exists", None
     # Check for email conflicts
     if "email" in kwargs and kwargs["email"] != user.email:
-        if User.query.filter_by(email=kwargs["email"]).first():
+        if User.query.filter(
+            User.email_key == normalize_login(kwargs["email"]), User.id != user.id
+        ).first():
             return False, "Email already exists", None
     # Update allowed fields
     allowed_fields = ["username", "email", "first_name", "last_name"]
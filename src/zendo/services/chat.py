@@ -0,0 +1,93 @@
+from sqlalchemy import insert, select
+
+from zendo.models import ChatMessage, db
+
+
+def conversation_owner(conversation_id: str) -> int | None:
+    """Id of the user a conversation belongs to, None for a new one.
+
+    The author of the first message owns the conversation and only they
+    append to it, so any of its messages tells.
+    """
+    return db.session.scalar(
+        select(ChatMessage.user_id)
+        .where(ChatMessage.conversation_id == conversation_id)
+        .limit(1)
+    )
+
+
+def append_messages(
+    conversation_id: str, user_id: int, messages: list[dict]
+) -> tuple[bool, str, list[ChatMessage]]:
+    # Conversation ids come from the browser, never write into another
+    # user's conversation
+    owner = conversation_owner(conversation_id)
+    if owner is not None and owner != user_id:
+        return False, "Conversation not found", []
+    values = [
+        {
+            "conversation_id": conversation_id,
+            "user_id": user_id,
+            "role": message["role"],
+            "content": message["content"],
+            "username": message.get("user"),
+        }
+        for message in messages
+    ]
+    try:
+        # One INSERT ... RETURNING for the whole batch, render_nulls keeps
+        # rows with and without a username in the same statement. RETURNING
+        # order is unspecified, ids are assigned in VALUES order.
+        result = db.session.scalars(
+            insert(ChatMessage).returning(ChatMessage),
+            values,
+            execution_options={"render_nulls": True},
+        )
+        rows = sorted(result, key=lambda row: row.id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return False, f"Failed to append ChatMessages: {e}", []
+    return True, "ChatMessages appended successfully", rows
+
+
+def list_messages(
+    conversation_id: str,
+    user_id: int,
+    after: int | None = None,
+    before: int | None = None,
+    limit: int | None = None,
+) -> tuple[bool, str, list[ChatMessage]]:
+    """List messages of a conversation of user_id in chronological order.
+
+    Pages are addressed by keyset cursors on the message id (``after`` /
+    ``before``) so that each page is a range scan on the
+    ``(conversation_id, user_id, id)`` index regardless of how deep it is.
+    With a ``limit`` and no ``after`` cursor the most recent messages are
+    returned. A conversation of another user has no messages.
+    """
+    try:
+        query = ChatMessage.query.filter_by(
+            conversation_id=conversation_id, user_id=user_id
+        )
+        if after is not None:
+            query = query.filter(ChatMessage.id > after)
+        if before is not None:
+            query = query.filter(ChatMessage.id < before)
+        if limit is not None and after is None:
+            messages = query.order_by(ChatMessage.id.desc()).limit(limit).all()
+            messages.reverse()
+        else:
+            messages = query.order_by(ChatMessage.id).limit(limit).all()
+        return True, "ChatMessages retrieved successfully", messages
+    except Exception as e:
+        return False, f"Failed to retrieve ChatMessages: {e}", []
+
+
+def latest_conversation_id(user_id: int) -> str | None:
+    message = (
+        ChatMessage.query.filter_by(user_id=user_id)
+        .order_by(ChatMessage.id.desc())
+        .first()
+    )
+    return message.conversation_id if message else None
@@ -0,0 +1,87 @@
+"""
+Shared asyncio event loop.
+
+One background thread runs an event loop for the coroutines of the whole
+process (e.g. applets with an ``async def process``), so any number of them
+waiting on I/O costs one thread instead of one each. Code running in other
+threads hands coroutines over with :meth:`EventLoop.submit`, or
+:meth:`EventLoop.run` to wait for the result.
+
+Blocking calls (e.g. database writes) should not run on the loop, they
+stop every coroutine while they wait; use ``asyncio.to_thread``.
+
+The loop lives in the memory of each process and starts on first use. A
+process forked from one with a running loop starts its own.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from collections.abc import Coroutine
+from concurrent.futures import Future
+from typing import Any, TypeVar
+
+__all__ = ["EventLoop", "event_loop"]
+
+T = TypeVar("T")
+
+
+class EventLoop:
+    """
+    An asyncio event loop running in a background thread.
+
+    Parameters
+    ----------
+    name : str, optional
+        Name of the thread, by default ``zendo-event-loop``.
+    """
+
+    def __init__(self, name: str = "zendo-event-loop"):
+        self.name = name
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        # The thread is not copied into the child, and the lock may be held
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The running loop, started on first use."""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name=self.name, daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> Future[T]:
+        """Schedule coro on the loop, from another thread.
+
+        The task runs with a copy of the caller's context variables.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine[Any, Any, T], timeout: float | None = None) -> T:
+        """Run coro on the loop and wait for its result, from another thread."""
+        return self.submit(coro).result(timeout)
+
+    def stats(self) -> dict[str, Any]:
+        """Counters for monitoring."""
+        loop = self._loop
+        return {
+            "running": loop is not None,
+            "tasks": len(asyncio.all_tasks(loop)) if loop is not None else 0,
+        }
+
+
+event_loop = EventLoop()
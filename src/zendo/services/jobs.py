@@ -0,0 +1,345 @@
+"""
+Background jobs for Dash callbacks.
+
+Callbacks registered with ``background=True`` and ``manager=job_manager``
+run on a bounded pool of ``config.job_workers`` threads: the request that
+starts one returns as soon as the job is queued, and the browser polls for
+its progress and result. However many slow jobs are running, request
+threads stay free for other users. Results, progress and the status of
+jobs are kept in a diskcache ``Cache`` on local disk, so a poll answered by
+another worker process of the same host finds them.
+
+Unlike Dash's ``DiskcacheManager``, which forks a process per job, a job
+runs in the process that received it. It shares that process's caches and
+schedulers (e.g. the expiry of a timer it started) and costs a thread, not
+a process. It also cannot be killed: terminating a job (when the browser
+starts a newer one, or a cancel input fires) sets a flag the job checks
+with :func:`check_cancelled`, and the result of a cancelled job is dropped.
+
+Jobs run in a copy of the request that started them, so ``current_user``
+and the session work as in any other callback.
+
+A callback can also return an awaitable, e.g. to wait on an applet with an
+``async def process``. It is then awaited on the shared event loop (see
+``zendo.services.event_loop``) and the job's thread moves on to the next
+job, so jobs waiting on I/O are not limited by the number of threads.
+This relies on Dash internals checked for Dash 3 and 4; with other versions
+jobs use the job functions of ``DiskcacheManager`` and an awaitable keeps
+its thread until it is done.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import inspect
+import os
+import re
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from pathlib import Path
+from typing import Any, Callable
+
+import dash
+import diskcache
+from dash import DiskcacheManager
+from dash.background_callback.managers import BaseBackgroundCallbackManager
+from dash.exceptions import PreventUpdate
+from flask import Flask, current_app
+
+try:
+    # Private Dash internals that set up dash.ctx and dash.set_props in a
+    # job, unchanged from Dash 3.0 to 4.4
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict
+    from dash.background_callback._proxy_set_props import ProxySetProps
+except ImportError:  # pragma: no cover
+    context_value = None
+
+from zendo.config import config
+from zendo.services.event_loop import event_loop
+
+__all__ = [
+    "JobCancelled",
+    "ThreadJobManager",
+    "check_cancelled",
+    "job_cancelled",
+    "job_manager",
+    "job_stats",
+]
+
+# Seconds the status and cancel flag of a job are kept at most
+JOB_KEY_TTL = 24 * 60 * 60
+
+# Dash versions whose internals were checked, other versions run jobs with the
+# job functions of DiskcacheManager, see ThreadJobManager.make_job_fn
+DASH_VERSION = tuple(int(part) for part in re.findall(r"\d+", dash.__version__)[:2])
+OWN_JOB_FN = context_value is not None and (3, 0) <= DASH_VERSION < (5, 0)
+
+# Id of the job running in the current context
+current_job: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "current_job", default=None
+)
+
+
+class JobCancelled(Exception):
+    """Raised by check_cancelled in a job that was cancelled."""
+
+
+def error_output(err: Exception) -> dict[str, Any]:
+    """Stored result of a callback that raised err, as Dash expects it."""
+    if isinstance(err, PreventUpdate):
+        return {"_dash_no_update": "_dash_no_update"}
+    return {
+        "background_callback_error": {
+            "msg": str(err),
+            "tb": traceback.format_exc(),
+        }
+    }
+
+
+async def resolve(awaitable):
+    return await awaitable
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ThreadJobManager(DiskcacheManager):
+    """
+    Run background callbacks on a pool of threads, with results on disk.
+
+    Parameters
+    ----------
+    directory : str | Path
+        Directory of the result cache, shared by the processes of a server.
+    workers : int, optional
+        Threads running jobs, by default 4. Further jobs wait in line.
+    """
+
+    def __init__(self, directory: str | Path, workers: int = 4):
+        # DiskcacheManager.__init__ requires psutil and multiprocess, which
+        # only its process per job needs
+        BaseBackgroundCallbackManager.__init__(self, cache_by=None)
+        self.directory = str(directory)
+        self.workers = workers
+        self.expire = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.cancelled = 0
+        self.errors = 0
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        # Threads are not copied into the child, and connections must not be
+        # shared with the parent
+        self._lock = threading.Lock()
+        self._executor = None
+        self.__dict__.pop("handle", None)
+
+    @cached_property
+    def handle(self) -> diskcache.Cache:
+        # Opened on first use, so importing the app touches no files
+        return diskcache.Cache(self.directory)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="zendo-job"
+                )
+            return self._executor
+
+    def _status_key(self, job: str) -> str:
+        return f"zendo-job-{job}-status"
+
+    def _cancel_key(self, job: str) -> str:
+        return f"zendo-job-{job}-cancel"
+
+    def call_job_fn(self, key, job_fn, args, context) -> str:
+        # pid:uuid, so any process can tell whether the owner is alive
+        job = f"{os.getpid()}:{uuid.uuid4().hex}"
+        self.handle.set(self._status_key(job), "queued", expire=JOB_KEY_TTL)
+        self.submitted += 1
+        app = current_app._get_current_object()
+        self.executor.submit(self.run_job, app, job, key, job_fn, args, context)
+        return job
+
+    def make_job_fn(self, fn, progress, key=None) -> Callable[..., Any]:
+        if not OWN_JOB_FN:
+            # Dash's job function stores the output itself, an awaitable one
+            # is awaited while this thread waits
+            def resolved_fn(*args, **kwargs):
+                output = fn(*args, **kwargs)
+                if inspect.isawaitable(output):
+                    output = event_loop.run(resolve(output))
+                return output
+
+            dash_job_fn = super().make_job_fn(resolved_fn, progress, key)
+
+            def stored_job_fn(*args):
+                dash_job_fn(*args)
+                return self.UNDEFINED
+
+            return stored_job_fn
+
+        # Returns the output of the callback instead of storing it, so that
+        # run_job can await the awaitable ones on the event loop. Otherwise
+        # sets up the callback context as DiskcacheManager's job function does
+        def job_fn(result_key, progress_key, args, context):
+            def set_progress(value):
+                if not isinstance(value, (list, tuple)):
+                    value = [value]
+                self.handle.set(progress_key, value)
+
+            def set_props(_id, props):
+                self.handle.set(self._make_set_props_key(result_key), {_id: props})
+
+            callback_context = AttributeDict(**context)
+            callback_context.ignore_register_page = False
+            callback_context.updated_props = ProxySetProps(set_props)
+            context_value.set(callback_context)
+            maybe_progress = [set_progress] if progress else []
+            if isinstance(args, dict):
+                return fn(*maybe_progress, **args)
+            if isinstance(args, (list, tuple)):
+                return fn(*maybe_progress, *args)
+            return fn(*maybe_progress, args)
+
+        return job_fn
+
+    def request_context(self, app: Flask, context: dict[str, Any]):
+        """A copy of the request that started a job."""
+        headers = context.get("headers") or {}
+        return app.test_request_context(
+            context.get("path") or "/",
+            headers={"Cookie": headers.get("Cookie", "")},
+            environ_base={"REMOTE_ADDR": context.get("remote")},
+        )
+
+    def run_job(
+        self,
+        app: Flask,
+        job: str,
+        key: str,
+        job_fn: Callable[..., Any],
+        args: Any,
+        context: dict[str, Any],
+    ) -> None:
+        ctx = contextvars.copy_context()
+        ctx.run(current_job.set, job)
+        output = self.UNDEFINED
+        try:
+            if not self.is_cancelled(job):
+                self.handle.set(self._status_key(job), "running", expire=JOB_KEY_TTL)
+                output = ctx.run(self.call_job, app, job_fn, key, args, context)
+        except Exception:
+            self.errors += 1
+            traceback.print_exc()
+        if inspect.isawaitable(output):
+            # Awaited on the loop while this thread moves on to the next job,
+            # the task gets a copy of the job's context variables
+            ctx.run(event_loop.submit, self.await_job(app, job, key, output, context))
+        else:
+            self.end_job(job, key, output)
+
+    def call_job(self, app, job_fn, key, args, context) -> Any:
+        with self.request_context(app, context):
+            try:
+                return job_fn(key, self._make_progress_key(key), args, context)
+            except Exception as err:
+                return error_output(err)
+
+    async def await_job(self, app, job, key, awaitable, context) -> None:
+        output = self.UNDEFINED
+        try:
+            with self.request_context(app, context):
+                try:
+                    output = await awaitable
+                except Exception as err:
+                    output = error_output(err)
+        finally:
+            self.end_job(job, key, output)
+
+    def end_job(self, job: str, key: str, output: Any) -> None:
+        try:
+            if self.is_cancelled(job):
+                self.cancelled += 1
+                # Nobody polls for these anymore
+                self.clear_cache_entry(key)
+                self.clear_cache_entry(self._make_progress_key(key))
+                self.clear_cache_entry(self._make_set_props_key(key))
+            elif output is not self.UNDEFINED:
+                self.handle.set(key, output)
+        except Exception:
+            self.errors += 1
+            traceback.print_exc()
+        finally:
+            self.handle.delete(self._status_key(job))
+
+    def is_cancelled(self, job: str) -> bool:
+        return self._cancel_key(job) in self.handle
+
+    def terminate_job(self, job) -> None:
+        if job is None:
+            return
+        # Threads cannot be killed, the job stops at its next check
+        if self._status_key(job) in self.handle:
+            self.handle.set(self._cancel_key(job), True, expire=JOB_KEY_TTL)
+
+    def get_result(self, key, job):
+        # The job has finished once its result is there, do not flag it
+        return super().get_result(key, None)
+
+    def terminate_unhealthy_job(self, job) -> bool:
+        # Left behind by a process that died while running it
+        if job and self._status_key(job) in self.handle and not self.job_running(job):
+            self.handle.delete(self._status_key(job))
+            return True
+        return False
+
+    def job_running(self, job) -> bool:
+        if not job:
+            return False
+        pid = int(str(job).split(":", 1)[0])
+        return self._status_key(job) in self.handle and pid_alive(pid)
+
+    def stats(self) -> dict[str, Any]:
+        """Counters of this process, for monitoring."""
+        return {
+            "workers": self.workers,
+            "submitted": self.submitted,
+            "cancelled": self.cancelled,
+            "errors": self.errors,
+        }
+
+
+job_manager = ThreadJobManager(config.jobs_dir, workers=config.job_workers)
+
+
+def job_stats() -> dict[str, Any]:
+    return job_manager.stats()
+
+
+def job_cancelled() -> bool:
+    """Whether the job running in this context was cancelled."""
+    job = current_job.get()
+    return job is not None and job_manager.is_cancelled(job)
+
+
+def check_cancelled() -> None:
+    """Raise JobCancelled if the job running in this context was cancelled."""
+    if job_cancelled():
+        raise JobCancelled()
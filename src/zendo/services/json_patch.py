@@ -0,0 +1,269 @@
+"""
+JSON Patch (RFC 6902) and JSON Merge Patch (RFC 7396) support.
+
+Applets return these deltas from ``process`` instead of a full state. They
+can be applied to a decoded document in Python, or, for the common
+operations, translated into SQLite JSON functions so the database updates
+the stored document without it being decoded and re-encoded in Python.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Union
+
+from sqlalchemy import ColumnElement, String, and_, case, func, literal
+
+__all__ = [
+    "JsonPatch",
+    "MergePatch",
+    "StatePatch",
+    "JsonPatchError",
+    "apply_json_patch",
+    "apply_merge_patch",
+    "patch_from_dict",
+]
+
+_ARRAY_INDEX = re.compile(r"^(0|[1-9][0-9]*)$")
+
+
+class JsonPatchError(ValueError):
+    """Raised when a patch cannot be applied to a document."""
+
+
+@dataclass
+class JsonPatch:
+    """RFC 6902 JSON Patch, a list of operations."""
+
+    operations: list[dict[str, Any]]
+
+    def apply(self, document: Any) -> Any:
+        return apply_json_patch(document, self.operations)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"type": "json-patch", "operations": self.operations}
+
+    def to_sql(self, column: ColumnElement) -> ColumnElement | None:
+        """Translate the patch into SQLite JSON functions applied to column.
+
+        Returns None when an operation has no exact SQLite equivalent (e.g.
+        inserting in the middle of an array, ``move``/``copy``/``test`` or
+        paths with array indices), the patch must be applied in Python then.
+        The expression is NULL where the patch must be applied in Python
+        after all: where :meth:`apply` raises (e.g. replacing a missing
+        member), as SQLite's functions would silently skip or create the
+        member instead, or appends to an object.
+        """
+        expression = column
+        # Conditions on the stored document, for each operation the member
+        # it needs and whether it must be an array or an object
+        conditions = []
+        changed: list[list[str]] = []
+        for operation in self.operations:
+            tokens = parse_pointer(operation["path"])
+            if not tokens or any(_ARRAY_INDEX.match(t) for t in tokens):
+                return None
+            if any('"' in t for t in tokens) or "-" in tokens[:-1]:
+                return None
+            op = operation["op"]
+            if op == "add":
+                needed, kind = tokens[:-1], "array" if tokens[-1] == "-" else "object"
+            elif op in ("replace", "remove") and tokens[-1] != "-":
+                needed, kind = tokens, None
+            else:
+                return None
+            # Checked on the stored document, not valid once an earlier
+            # operation replaced the member or one of its parents
+            if any(path == needed[: len(path)] for path in changed):
+                return None
+            changed.append(tokens)
+            needed_type = func.json_type(column, _sql_path(needed))
+            if kind is None:
+                conditions.append(needed_type.is_not(None))
+            else:
+                conditions.append(needed_type == kind)
+            path = _sql_path(tokens)
+            if op == "remove":
+                expression = func.json_remove(expression, path)
+                continue
+            value = func.json(json.dumps(operation["value"]))
+            if op == "replace":
+                expression = func.json_replace(expression, path, value)
+            elif tokens[-1] == "-":
+                expression = func.json_insert(expression, path, value)
+            else:
+                expression = func.json_set(expression, path, value)
+        return case((and_(*conditions), expression), else_=None)
+
+
+def _sql_path(tokens: list[str]) -> str:
+    return "$" + "".join("[#]" if token == "-" else f'."{token}"' for token in tokens)
+
+
+@dataclass
+class MergePatch:
+    """RFC 7396 JSON Merge Patch."""
+
+    patch: dict[str, Any]
+
+    def apply(self, document: Any) -> Any:
+        return apply_merge_patch(document, self.patch)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"type": "merge-patch", "patch": self.patch}
+
+    def to_sql(self, column: ColumnElement) -> ColumnElement | None:
+        """Translate the patch into the SQLite ``json_patch`` function."""
+        empty = literal("{}", type_=String)
+        return func.json_patch(func.coalesce(column, empty), json.dumps(self.patch))
+
+
+StatePatch = Union[JsonPatch, MergePatch]
+
+
+def patch_from_dict(data: dict[str, Any]) -> StatePatch:
+    """Rebuild a patch serialized with ``to_dict``."""
+    if data["type"] == "json-patch":
+        return JsonPatch(data["operations"])
+    if data["type"] == "merge-patch":
+        return MergePatch(data["patch"])
+    raise JsonPatchError(f"Unknown patch type: {data['type']!r}")
+
+
+def parse_pointer(pointer: str) -> list[str]:
+    """Split an RFC 6901 JSON Pointer into its unescaped reference tokens."""
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise JsonPatchError(f"Invalid JSON pointer: {pointer!r}")
+    return [
+        token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")
+    ]
+
+
+def _resolve(document: Any, tokens: list[str]) -> Any:
+    for token in tokens:
+        document = _get_child(document, token)
+    return document
+
+
+def _get_child(container: Any, token: str) -> Any:
+    try:
+        if isinstance(container, list):
+            if not _ARRAY_INDEX.match(token):
+                raise JsonPatchError(f"Invalid array index: {token!r}")
+            return container[int(token)]
+        if isinstance(container, dict):
+            return container[token]
+    except (IndexError, KeyError):
+        pass
+    raise JsonPatchError(f"Path not found: {token!r}")
+
+
+def _add(document: Any, tokens: list[str], value: Any) -> Any:
+    if not tokens:
+        return value
+    parent = _resolve(document, tokens[:-1])
+    token = tokens[-1]
+    if isinstance(parent, list):
+        if token == "-":
+            parent.append(value)
+        elif _ARRAY_INDEX.match(token) and int(token) <= len(parent):
+            parent.insert(int(token), value)
+        else:
+            raise JsonPatchError(f"Invalid array index: {token!r}")
+    elif isinstance(parent, dict):
+        parent[token] = value
+    else:
+        raise JsonPatchError(f"Cannot add to a {type(parent).__name__}")
+    return document
+
+
+def _remove(document: Any, tokens: list[str]) -> tuple[Any, Any]:
+    if not tokens:
+        raise JsonPatchError("Cannot remove the whole document")
+    parent = _resolve(document, tokens[:-1])
+    value = _get_child(parent, tokens[-1])
+    if isinstance(parent, list):
+        del parent[int(tokens[-1])]
+    else:
+        del parent[tokens[-1]]
+    return document, value
+
+
+def apply_json_patch(document: Any, operations: list[dict[str, Any]]) -> Any:
+    """
+    Apply RFC 6902 operations to a document.
+
+    The document is modified in place where possible, the (possibly new)
+    root document is returned.
+
+    Parameters
+    ----------
+    document : Any
+        Decoded JSON document.
+    operations : list[dict[str, Any]]
+        Patch operations.
+
+    Returns
+    -------
+    Any
+        The patched document.
+    """
+    for operation in operations:
+        op = operation.get("op")
+        tokens = parse_pointer(operation.get("path", ""))
+        if op == "add":
+            document = _add(document, tokens, operation["value"])
+        elif op == "remove":
+            document, _ = _remove(document, tokens)
+        elif op == "replace":
+            _resolve(document, tokens)
+            if tokens:
+                document, _ = _remove(document, tokens)
+            document = _add(document, tokens, operation["value"])
+        elif op == "move":
+            from_tokens = parse_pointer(operation["from"])
+            document, value = _remove(document, from_tokens)
+            document = _add(document, tokens, value)
+        elif op == "copy":
+            value = json.loads(
+                json.dumps(_resolve(document, parse_pointer(operation["from"])))
+            )
+            document = _add(document, tokens, value)
+        elif op == "test":
+            if _resolve(document, tokens) != operation["value"]:
+                raise JsonPatchError(f"Test failed at {operation['path']!r}")
+        else:
+            raise JsonPatchError(f"Unknown operation: {op!r}")
+    return document
+
+
+def apply_merge_patch(document: Any, patch: Any) -> Any:
+    """
+    Apply an RFC 7396 merge patch to a document.
+
+    Parameters
+    ----------
+    document : Any
+        Decoded JSON document, modified in place when it is an object.
+    patch : Any
+        Merge patch.
+
+    Returns
+    -------
+    Any
+        The patched document.
+    """
+    if not isinstance(patch, dict):
+        return patch
+    if not isinstance(document, dict):
+        document = {}
+    for key, value in patch.items():
+        if value is None:
+            document.pop(key, None)
+        else:
+            document[key] = apply_merge_patch(document.get(key), value)
+    return document
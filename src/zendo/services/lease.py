@@ -0,0 +1,86 @@
+"""
+Leases electing the one process of a host that does some work.
+
+A lease is an exclusive ``flock`` on a file. Of all the processes trying to
+take it (e.g. the workers of ``zendo serve``, of old and new generations
+during a reload, or of uvicorn), one holds it at a time and the others keep
+failing to take it. The kernel releases the lock when the holder exits or
+dies, so the next process that tries takes over. Leases are per host: the
+processes must share the file.
+
+Without ``fcntl`` (not POSIX), every process holds the lease.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from zendo.config import config
+
+__all__ = ["FileLease", "scheduler_lease"]
+
+
+class FileLease:
+    """
+    An exclusive lock on a file, held until the process exits.
+
+    Parameters
+    ----------
+    path : str | Path
+        The lock file, created if missing.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._fd: int | None = None
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        # The lock belongs to the parent, the child only closes its copy of
+        # the file descriptor
+        self._lock = threading.Lock()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    @property
+    def held(self) -> bool:
+        """Whether this process holds the lease."""
+        return self._fd is not None or fcntl is None
+
+    def acquire(self) -> bool:
+        """Take the lease if it is free, return whether this process holds it."""
+        with self._lock:
+            if self.held:
+                return True
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            # For whoever wonders which process it is
+            os.ftruncate(fd, 0)
+            os.write(fd, f"{os.getpid()}\n".encode())
+            self._fd = fd
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+# Held by the process running the applet ticks and timer expiries
+scheduler_lease = FileLease(config.scheduler_lock_file)
@@ -0,0 +1,105 @@
+"""
+Password hashing off the request threads.
+
+Hashing and verifying passwords is deliberately slow, CPU-bound work. It
+runs in a bounded process pool (``config.password_hash_workers``
+processes) so that a burst of logins cannot occupy every core the server
+needs for other requests. With zero workers passwords are hashed in the
+calling thread.
+
+The hash method and cost are configured with ``config.password_hash_method``
+using werkzeug's notation (e.g. ``scrypt:32768:8:1`` or
+``pbkdf2:sha256:600000``). Stored hashes record the parameters they were
+made with, :func:`needs_rehash` tells when one is outdated.
+
+Request threads still wait for their hashing job, so the number of jobs in
+flight is bounded too (``config.password_hash_queue``): beyond it
+:class:`PasswordHashBusy` is raised right away instead of tying up every
+request thread behind the pool.
+"""
+
+from __future__ import annotations
+
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from zendo.config import config
+
+__all__ = [
+    "PasswordHashBusy",
+    "hash_password",
+    "needs_rehash",
+    "verify_password",
+]
+
+_executor: Executor | None = None
+_executor_lock = threading.Lock()
+_slots: threading.BoundedSemaphore | None = None
+
+
+class PasswordHashBusy(RuntimeError):
+    """Raised when too many hashing jobs are already in flight."""
+
+
+def get_executor() -> Executor | None:
+    """Get the process pool, started on first use."""
+    global _executor, _slots
+    if config.password_hash_workers <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _slots = threading.BoundedSemaphore(
+                max(config.password_hash_queue, config.password_hash_workers)
+            )
+            # spawn: forking a multi-threaded server process is unsafe
+            _executor = ProcessPoolExecutor(
+                max_workers=config.password_hash_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _executor
+
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+def run(fn, *args):
+    executor = get_executor()
+    if executor is None:
+        return fn(*args)
+    slots = _slots
+    if not slots.acquire(blocking=False):
+        raise PasswordHashBusy("Too many password hashing jobs in flight")
+    try:
+        return executor.submit(fn, *args).result()
+    finally:
+        slots.release()
+
+
+def hash_password(password: str) -> str:
+    """Hash a password with the configured method."""
+    return run(generate_password_hash, password, config.password_hash_method)
+
+
+def verify_password(pwhash: str, password: str) -> bool:
+    """Check a password against a stored hash."""
+    return run(check_password_hash, pwhash, password)
+
+
+@functools.cache
+def hash_parameters(method: str) -> str:
+    # werkzeug fills in defaults, e.g. "scrypt" becomes "scrypt:32768:8:1"
+    return generate_password_hash("", method).split("$", 1)[0]
+
+
+def needs_rehash(pwhash: str) -> bool:
+    """Whether a hash was made with other parameters than configured."""
+    return pwhash.split("$", 1)[0] != hash_parameters(config.password_hash_method)
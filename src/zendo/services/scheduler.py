@@ -0,0 +1,161 @@
+"""
+In-process scheduling of timed callbacks.
+
+One background thread sleeps until the earliest due time in a heap, so any
+number of pending callbacks costs no polling and scheduling, replacing or
+cancelling one is O(log n). Callbacks are keyed: scheduling a key again
+replaces its callback, and replaced or cancelled entries are dropped lazily
+when they reach the top of the heap.
+
+Callbacks run on the scheduler thread, or with ``workers`` on a bounded
+pool of threads, so slow callbacks do not delay the others.
+
+The schedule lives in the memory of each process. A process forked from
+one with pending callbacks starts with an empty schedule, the callbacks
+only run in the process that scheduled them.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import os
+import threading
+import time
+import traceback
+from collections.abc import Callable, Hashable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+__all__ = ["Scheduler"]
+
+
+class Scheduler:
+    """
+    Run keyed callbacks at given (``time.time()``) times.
+
+    Parameters
+    ----------
+    name : str, optional
+        Name of the background thread, by default ``zendo-scheduler``.
+    workers : int, optional
+        Threads running the callbacks, by default 0 (the scheduler thread
+        runs them).
+    """
+
+    def __init__(self, name: str = "zendo-scheduler", workers: int = 0):
+        self.name = name
+        self.workers = workers
+        self._executor: ThreadPoolExecutor | None = None
+        # (when, seq, key), entries superseded in _entries are skipped
+        self._heap: list[tuple[float, int, Hashable]] = []
+        self._entries: dict[Hashable, tuple[float, int, Callable[[], Any]]] = {}
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self.fired = 0
+        self.errors = 0
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        # The thread is not copied into the child, and the lock may be held.
+        # The parent keeps running its callbacks, the child must not.
+        self._cond = threading.Condition()
+        self._thread = None
+        self._executor = None
+        self._heap = []
+        self._entries = {}
+
+    def _start(self) -> None:
+        if self.workers > 0:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix=f"{self.name}-worker"
+            )
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def schedule(self, key: Hashable, when: float, fn: Callable[[], Any]) -> None:
+        """Run fn at time when, replacing the callback scheduled for key."""
+        with self._cond:
+            seq = next(self._counter)
+            self._entries[key] = (when, seq, fn)
+            heapq.heappush(self._heap, (when, seq, key))
+            if len(self._heap) > 2 * len(self._entries) + 64:
+                self._compact()
+            if self._thread is None:
+                self._start()
+            elif self._heap[0][1] == seq:
+                # Due before everything else, wake the thread up
+                self._cond.notify()
+
+    def cancel(self, key: Hashable) -> bool:
+        """Cancel the callback scheduled for key, return whether there was one."""
+        with self._cond:
+            return self._entries.pop(key, None) is not None
+
+    def when(self, key: Hashable) -> float | None:
+        """Time the callback for key is due, None when nothing is scheduled."""
+        entry = self._entries.get(key)
+        return None if entry is None else entry[0]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _compact(self) -> None:
+        self._heap = [(when, seq, key) for key, (when, seq, _) in self._entries.items()]
+        heapq.heapify(self._heap)
+
+    def _pop_due(self) -> Callable[[], Any]:
+        """Wait for the next due callback and remove it from the schedule."""
+        with self._cond:
+            while True:
+                while self._heap:
+                    when, seq, key = self._heap[0]
+                    entry = self._entries.get(key)
+                    if entry is not None and entry[1] == seq:
+                        break
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                delay = self._heap[0][0] - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                _, _, key = heapq.heappop(self._heap)
+                return self._entries.pop(key)[2]
+
+    def _run(self) -> None:
+        while True:
+            fn = self._pop_due()
+            if self._executor is None:
+                self._call(fn)
+                continue
+            try:
+                self._executor.submit(self._call, fn)
+            except RuntimeError:
+                # The interpreter is shutting down
+                return
+
+    def _call(self, fn: Callable[[], Any]) -> None:
+        try:
+            fn()
+        except Exception:
+            traceback.print_exc()
+            with self._cond:
+                self.errors += 1
+        else:
+            # Callbacks may run on several threads of the pool
+            with self._cond:
+                self.fired += 1
+
+    def stats(self) -> dict[str, Any]:
+        """Counters for monitoring."""
+        with self._cond:
+            return {
+                "scheduled": len(self._entries),
+                "heap": len(self._heap),
+                "fired": self.fired,
+                "errors": self.errors,
+            }
@@ -0,0 +1,96 @@
+"""
+In-memory token-bucket rate limiting.
+
+Each key (a username, an IP address) has a bucket of ``burst`` tokens that
+refills at ``rate`` tokens per second; an attempt takes one token and is
+refused when the bucket is empty. Buckets live in a bounded LRU map, so a
+flood of distinct keys evicts the least recently seen buckets instead of
+growing memory. Limits are per process.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any
+
+__all__ = ["RateLimiter"]
+
+
+class RateLimiter:
+    """
+    Token buckets keyed by an arbitrary hashable value.
+
+    Parameters
+    ----------
+    rate : float
+        Tokens added to a bucket per second.
+    burst : int
+        Capacity of a bucket, the number of attempts allowed at once.
+    maxsize : int
+        Maximum number of buckets kept, least recently used buckets are
+        evicted (and so start full again when seen next).
+    """
+
+    def __init__(self, rate: float, burst: int, maxsize: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        # key -> (tokens, time of the last update)
+        self._buckets: OrderedDict[Hashable, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.throttled = 0
+        self.refunded = 0
+        self.evictions = 0
+
+    def hit(self, key: Hashable) -> bool:
+        """Take a token for key, return False when the key is throttled."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+                self.allowed += 1
+            else:
+                self.throttled += 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+            return allowed
+
+    def refund(self, key: Hashable) -> None:
+        """Give back the token taken by an attempt that does not count."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                # Evicted, it starts full again anyway
+                return
+            tokens, updated = bucket
+            tokens = min(self.burst, tokens + (now - updated) * self.rate + 1)
+            self._buckets[key] = (tokens, now)
+            self.refunded += 1
+
+    def retry_after(self, key: Hashable) -> float:
+        """Seconds until key has a token again."""
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, time.monotonic()))
+        tokens = min(self.burst, tokens + (time.monotonic() - updated) * self.rate)
+        return max(0.0, (1 - tokens) / self.rate) if self.rate else float("inf")
+
+    def stats(self) -> dict[str, Any]:
+        """Counters for monitoring."""
+        return {
+            "buckets": len(self._buckets),
+            "maxsize": self.maxsize,
+            "allowed": self.allowed,
+            "throttled": self.throttled,
+            "refunded": self.refunded,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,187 @@
+"""
+Timer applet state and countdown expiry.
+
+A timer state records when the timer was started (``started_at``, epoch
+milliseconds, None while stopped) and the time accumulated by earlier runs
+(``accumulated``, milliseconds), so the elapsed time can be computed at any
+moment without the state being updated while the timer runs.
+
+Running countdowns are tracked by one shared :class:`Scheduler`, in the
+process holding ``scheduler_lease`` only (see ``zendo.services.lease``).
+When one expires, ``expired_at`` is written to its stored state. Browsers
+draw the time themselves and never poll the server for it.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from flask import Flask, current_app
+from sqlalchemy import select
+
+from zendo.models import AppletState, db
+from zendo.services.applet_state import load_applet, patch_applet
+from zendo.services.json_patch import JsonPatch
+from zendo.services.lease import scheduler_lease
+from zendo.services.scheduler import Scheduler
+
+__all__ = [
+    "elapsed_ms",
+    "expires_at",
+    "expiry_scheduler",
+    "init_timer_state",
+    "schedule_expiry",
+    "schedule_running_timers",
+    "update_timer_state",
+]
+
+# Applet name the timer states are stored under
+TIMER_APPLET = "timer"
+
+expiry_scheduler = Scheduler(name="zendo-timer-expiry")
+
+
+def now_ms() -> float:
+    return time.time() * 1000
+
+
+def init_timer_state(mode: str = "stopwatch", duration: int = 0) -> dict[str, Any]:
+    return {
+        "mode": mode,
+        "duration": duration,
+        "started_at": None,
+        "accumulated": 0,
+        "expired_at": None,
+    }
+
+
+def elapsed_ms(state: dict[str, Any], now: float | None = None) -> float:
+    """Milliseconds the timer has been running."""
+    elapsed = state.get("accumulated") or 0
+    if state.get("started_at") is not None:
+        elapsed += (now_ms() if now is None else now) - state["started_at"]
+    return elapsed
+
+
+def expires_at(state: dict[str, Any]) -> float | None:
+    """Epoch milliseconds a running countdown reaches zero, None otherwise."""
+    if state.get("mode") != "countdown" or state.get("started_at") is None:
+        return None
+    return state["started_at"] + state["duration"] * 1000 - state["accumulated"]
+
+
+def update_timer_state(
+    state: dict[str, Any], action: str, now: float | None = None
+) -> dict[str, Any]:
+    """
+    Apply a timer action to a state.
+
+    Parameters
+    ----------
+    state : dict
+        Current timer state, not modified.
+    action : str
+        ``start``, ``pause``, ``reset``, ``stopwatch`` or ``countdown
+        <seconds>``.
+    now : float, optional
+        Time of the action in epoch milliseconds, by default now.
+
+    Returns
+    -------
+    dict
+        The new state.
+
+    Raises
+    ------
+    ValueError
+        If the action is not recognized.
+    """
+    now = now_ms() if now is None else now
+    state = {**init_timer_state(), **(state or {})}
+    command, *args = action.split() or [""]
+    if command == "start":
+        if state["started_at"] is None:
+            state["started_at"] = now
+    elif command == "pause":
+        if state["started_at"] is not None:
+            state["accumulated"] = elapsed_ms(state, now)
+            state["started_at"] = None
+    elif command == "reset":
+        state = init_timer_state(state["mode"], state["duration"])
+    elif command == "stopwatch" and not args:
+        state = init_timer_state()
+    elif command == "countdown" and len(args) == 1 and args[0].isdigit():
+        state = init_timer_state("countdown", int(args[0]))
+    else:
+        raise ValueError("Usage: start, pause, reset, stopwatch or countdown <seconds>")
+    return state
+
+
+def expire_timer(applet_id: str, deadline: float) -> None:
+    """Record the expiry of a countdown that is still running to deadline."""
+    user_id = db.session.execute(
+        select(AppletState.user_id).where(AppletState.id == applet_id)
+    ).scalar_one_or_none()
+    if user_id is None:
+        return
+    # Read from the database, the timer may have been changed by a request
+    # another process served
+    entry = load_applet(user_id, applet_id)
+    # Paused, reset or restarted since it was scheduled
+    if entry is None or expires_at(entry.state_data or {}) != deadline:
+        return
+    state = entry.state_data
+    if state.get("expired_at") is None:
+        # Unless it changed since it was read
+        patch = JsonPatch(
+            [
+                {"op": "test", "path": "/started_at", "value": state["started_at"]},
+                {"op": "test", "path": "/accumulated", "value": state["accumulated"]},
+                {"op": "add", "path": "/expired_at", "value": deadline},
+            ]
+        )
+        patch_applet(user_id, applet_id, patch)
+
+
+def run_expiry(app: Flask, applet_id: str, deadline: float) -> None:
+    with app.app_context():
+        expire_timer(applet_id, deadline)
+
+
+def schedule_expiry(applet_id: str, state: dict[str, Any]) -> None:
+    """Track the expiry of a timer after its state changed."""
+    if not scheduler_lease.held:
+        # Picked up by the process holding it, see schedule_running_timers
+        return
+    deadline = expires_at(state)
+    if deadline is None or state.get("expired_at") is not None:
+        expiry_scheduler.cancel(applet_id)
+        return
+    app = current_app._get_current_object()
+    expiry_scheduler.schedule(
+        applet_id, deadline / 1000, lambda: run_expiry(app, applet_id, deadline)
+    )
+
+
+def schedule_running_timers() -> int:
+    """Schedule the expiry of every stored running countdown.
+
+    Countdowns already scheduled to their deadline are left as they are.
+    Returns the number of countdowns scheduled.
+    """
+    rows = db.session.execute(
+        select(AppletState.id, AppletState.state_data).where(
+            AppletState.applet_name == TIMER_APPLET
+        )
+    )
+    count = 0
+    for row in rows:
+        state = row.state_data or {}
+        deadline = expires_at(state)
+        if deadline is None or state.get("expired_at") is not None:
+            continue
+        if expiry_scheduler.when(row.id) != deadline / 1000:
+            schedule_expiry(row.id, state)
+            count += 1
+    return count
@@ -0,0 +1,228 @@
+"""
+Bulk import of user accounts.
+
+Rows are streamed from a CSV or NDJSON file and imported in batches: one
+query per batch finds the usernames and emails that are already taken,
+passwords are hashed in parallel, and the remaining rows are written with a
+single executemany insert per batch. Rows that cannot be imported are
+reported with their line number and do not abort their batch.
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import re
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+
+from zendo.config import config
+from zendo.constants import (
+    EMAIL_REGEX_PATTERN,
+    EMAIL_REGEX_PATTERN_ERROR,
+    USERNAME_REGEX_PATTERN,
+    USERNAME_REGEX_PATTERN_ERROR,
+)
+from zendo.models import User, db, normalize_login
+
+__all__ = [
+    "ImportBatch",
+    "import_users",
+    "read_rows",
+]
+
+# Columns read from every row, the first three are required
+FIELDS = ["username", "email", "password", "first_name", "last_name"]
+
+
+@dataclass
+class ImportBatch:
+    """Outcome of importing one batch of rows."""
+
+    imported: int = 0
+    # (line number, message) of the rows that were not imported
+    errors: list[tuple[int, str]] = field(default_factory=list)
+
+
+def read_rows(path: str | Path) -> Iterator[tuple[int, dict]]:
+    """
+    Stream the rows of a CSV (with a header) or NDJSON file.
+
+    Parameters
+    ----------
+    path : str | Path
+        File to read, NDJSON when the suffix is ``.ndjson``, ``.jsonl`` or
+        ``.json``, CSV otherwise.
+
+    Yields
+    ------
+    tuple[int, dict]
+        Line number and row.
+    """
+    path = Path(path)
+    with path.open(newline="", encoding="utf-8") as f:
+        if path.suffix.lower() in {".ndjson", ".jsonl", ".json"}:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    row = {"__error__": f"Invalid JSON: {e}"}
+                if not isinstance(row, dict):
+                    row = {"__error__": "Expected a JSON object"}
+                yield line_no, row
+        else:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+
+
+def batched(rows: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def validate(row: dict) -> str | None:
+    """Error message of a row that cannot be imported, None when valid."""
+    if "__error__" in row:
+        return row["__error__"]
+    # NDJSON values can be of any JSON type
+    for name in FIELDS:
+        value = row.get(name)
+        if value is not None and not isinstance(value, str):
+            return f"Invalid {name}: expected a string"
+    for name in FIELDS[:3]:
+        if not (row.get(name) or "").strip():
+            return f"Missing {name}"
+    # The rules of the registration form
+    if not re.match(USERNAME_REGEX_PATTERN, row["username"].strip()):
+        return USERNAME_REGEX_PATTERN_ERROR
+    if not re.match(EMAIL_REGEX_PATTERN, row["email"].strip()):
+        return EMAIL_REGEX_PATTERN_ERROR
+    return None
+
+
+def import_batch(
+    batch: list[tuple[int, dict]], executor: Executor | None = None
+) -> ImportBatch:
+    result = ImportBatch()
+    # Validate and drop rows duplicated within the batch
+    rows: list[tuple[int, dict]] = []
+    usernames: set[str] = set()
+    emails: set[str] = set()
+    for line_no, row in batch:
+        error = validate(row)
+        if error is None:
+            username_key = normalize_login(row["username"])
+            email_key = normalize_login(row["email"])
+            if username_key in usernames:
+                error = "Duplicate username in file"
+            elif email_key in emails:
+                error = "Duplicate email in file"
+        if error is not None:
+            result.errors.append((line_no, error))
+            continue
+        usernames.add(username_key)
+        emails.add(email_key)
+        rows.append((line_no, row))
+    if not rows:
+        return result
+    # One set-based query for the identifiers already taken
+    taken = db.session.execute(
+        select(User.username_key, User.email_key).where(
+            or_(User.username_key.in_(usernames), User.email_key.in_(emails))
+        )
+    ).all()
+    taken_usernames = {row.username_key for row in taken}
+    taken_emails = {row.email_key for row in taken}
+    new_rows = []
+    for line_no, row in rows:
+        if normalize_login(row["username"]) in taken_usernames:
+            result.errors.append((line_no, "Username already exists"))
+        elif normalize_login(row["email"]) in taken_emails:
+            result.errors.append((line_no, "Email already exists"))
+        else:
+            new_rows.append((line_no, row))
+    if not new_rows:
+        return result
+    # Hash in parallel, the executor's processes use all cores
+    passwords = [row["password"] for _, row in new_rows]
+    methods = [config.password_hash_method] * len(passwords)
+    if executor is None:
+        hashes = list(map(generate_password_hash, passwords, methods))
+    else:
+        chunksize = max(1, len(passwords) // 64)
+        hashes = list(
+            executor.map(
+                generate_password_hash, passwords, methods, chunksize=chunksize
+            )
+        )
+    values = [
+        {
+            "username": row["username"].strip(),
+            "email": row["email"].strip(),
+            "username_key": normalize_login(row["username"]),
+            "email_key": normalize_login(row["email"]),
+            "password_hash": pwhash,
+            "first_name": row.get("first_name") or None,
+            "last_name": row.get("last_name") or None,
+        }
+        for (_, row), pwhash in zip(new_rows, hashes)
+    ]
+    table = User.__table__
+    try:
+        db.session.execute(insert(table), values)
+        db.session.commit()
+        result.imported += len(values)
+    except IntegrityError:
+        # Taken meanwhile by a concurrent registration, find the row(s)
+        db.session.rollback()
+        for (line_no, _), value in zip(new_rows, values):
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(table), value)
+                result.imported += 1
+            except IntegrityError as e:
+                result.errors.append((line_no, f"Insert failed: {e.orig}"))
+        db.session.commit()
+    return result
+
+
+def import_users(
+    rows: Iterable[tuple[int, dict]],
+    batch_size: int = 1000,
+    executor: Executor | None = None,
+) -> Iterator[ImportBatch]:
+    """
+    Import users in batches, each batch in its own transaction.
+
+    Parameters
+    ----------
+    rows : Iterable[tuple[int, dict]]
+        Line numbers and rows, as yielded by :func:`read_rows`.
+    batch_size : int, optional
+        Rows per batch, by default 1000.
+    executor : Executor, optional
+        Executor hashing the passwords, by default they are hashed in the
+        calling thread.
+
+    Yields
+    ------
+    ImportBatch
+        The outcome of every batch.
+    """
+    for batch in batched(rows, batch_size):
+        yield import_batch(batch, executor=executor)
@@ -0,0 +1,61 @@
+"""Applet states written through the applet cache."""
+
+import uuid
+
+import pytest
+
+from zendo.app import create_app
+from zendo.config import Config
+from zendo.models import db
+from zendo.services import applet_state, auth
+from zendo.services.json_patch import JsonPatch
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    path = tmp_path_factory.mktemp("applet_state") / "database.db"
+    return create_app(Config(database_url=f"sqlite:///{path}"))
+
+
+@pytest.fixture(scope="module")
+def user_id(app):
+    with app.server.app_context():
+        _, _, user = auth.register_user("alice", "alice@example.com", "secret1")
+        return user.id
+
+
+@pytest.mark.parametrize(
+    "storage, operation",
+    [
+        # Patched by SQLite
+        ("state", {"op": "replace", "path": "/count", "value": 1}),
+        # Patched in Python
+        ("state", {"op": "copy", "from": "/count", "path": "/copy"}),
+        ("events", {"op": "replace", "path": "/count", "value": 1}),
+    ],
+)
+def test_failed_commit_leaves_cache(app, user_id, storage, operation, monkeypatch):
+    applet_id = str(uuid.uuid4())
+    state = {"count": 0}
+    patch = JsonPatch([operation])
+    with app.server.app_context():
+        applet_state.create_applet(applet_id, user_id, "counter", state, storage)
+        # As held by a concurrent request
+        cached = applet_state.lookup_applet(user_id, applet_id)
+
+        def commit():
+            raise RuntimeError("disk full")
+
+        with monkeypatch.context() as m:
+            m.setattr(db.session, "commit", commit)
+            success, _, _ = applet_state.patch_applet(user_id, applet_id, patch)
+        assert not success
+        assert (cached.state_data, cached.revision) == (state, 0)
+        entry = applet_state.lookup_applet(user_id, applet_id)
+        assert (entry.state_data, entry.revision) == (state, 0)
+        success, _, applet = applet_state.patch_applet(user_id, applet_id, patch)
+        assert success
+        expected = patch.apply(dict(state))
+        assert applet.state_data == expected
+        entry = applet_state.lookup_applet(user_id, applet_id)
+        assert (entry.state_data, entry.revision) == (expected, 1)
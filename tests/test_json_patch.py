@@ -0,0 +1,157 @@
+"""JSON patches applied in Python and translated into SQLite JSON functions."""
+
+import copy
+import json
+
+import pytest
+from sqlalchemy import String, create_engine, literal, select
+
+from zendo.services.json_patch import (
+    JsonPatch,
+    JsonPatchError,
+    MergePatch,
+    patch_from_dict,
+)
+
+DOCUMENT = {"a": [1], "b": {"c": 2, "d": None}, "e": "x"}
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = create_engine("sqlite://")
+    yield engine
+    engine.dispose()
+
+
+def apply(patch, document):
+    """The patched document, None where the patch does not apply."""
+    try:
+        return patch.apply(copy.deepcopy(document))
+    except JsonPatchError:
+        return None
+
+
+def apply_sql(engine, patch, document):
+    column = literal(None if document is None else json.dumps(document), String)
+    expression = patch.to_sql(column)
+    assert expression is not None
+    with engine.connect() as conn:
+        result = conn.execute(select(expression)).scalar()
+    return None if result is None else json.loads(result)
+
+
+@pytest.mark.parametrize(
+    "operations",
+    [
+        # Append to an array
+        [{"op": "add", "path": "/a/-", "value": 2}],
+        [
+            {"op": "add", "path": "/a/-", "value": 2},
+            {"op": "add", "path": "/a/-", "value": {"f": 3}},
+        ],
+        [{"op": "add", "path": "/x/-", "value": 2}],
+        [{"op": "add", "path": "/e/-", "value": 2}],
+        # Add or set a member
+        [{"op": "add", "path": "/f", "value": [1, 2]}],
+        [{"op": "add", "path": "/b/c", "value": 3}],
+        [{"op": "add", "path": "/x/y", "value": 3}],
+        [{"op": "add", "path": "/a/y", "value": 3}],
+        [{"op": "add", "path": "/e/y", "value": 3}],
+        # Replace and remove, also on missing paths
+        [{"op": "replace", "path": "/e", "value": "y"}],
+        [{"op": "replace", "path": "/b/d", "value": 1}],
+        [{"op": "replace", "path": "/x", "value": 1}],
+        [{"op": "replace", "path": "/b/x", "value": 1}],
+        [{"op": "remove", "path": "/b/c"}],
+        [{"op": "remove", "path": "/x"}],
+        [{"op": "remove", "path": "/x/y"}],
+        [
+            {"op": "remove", "path": "/e"},
+            {"op": "add", "path": "/e", "value": 1},
+        ],
+        # A failing operation fails the whole patch
+        [
+            {"op": "add", "path": "/f", "value": 1},
+            {"op": "remove", "path": "/x"},
+        ],
+        [
+            {"op": "remove", "path": "/e"},
+            {"op": "add", "path": "/b/f", "value": 1},
+        ],
+    ],
+)
+def test_json_patch_sql_matches_python(engine, operations):
+    patch = JsonPatch(operations)
+    assert apply_sql(engine, patch, DOCUMENT) == apply(patch, DOCUMENT)
+
+
+def test_json_patch_sql_defers_to_python(engine):
+    # "-" names a member of an object, left to the Python code
+    patch = JsonPatch([{"op": "add", "path": "/b/-", "value": 2}])
+    assert apply(patch, DOCUMENT)["b"]["-"] == 2
+    assert apply_sql(engine, patch, DOCUMENT) is None
+
+
+@pytest.mark.parametrize(
+    "operations",
+    [
+        # Array indices
+        [{"op": "add", "path": "/a/0", "value": 0}],
+        [{"op": "replace", "path": "/a/0", "value": 0}],
+        [{"op": "remove", "path": "/a/0"}],
+        # No SQLite function
+        [{"op": "move", "from": "/e", "path": "/f"}],
+        [{"op": "copy", "from": "/e", "path": "/f"}],
+        [{"op": "test", "path": "/e", "value": "x"}],
+        [{"op": "remove", "path": "/a/-"}],
+        # Depends on an earlier operation of the patch
+        [
+            {"op": "remove", "path": "/b"},
+            {"op": "add", "path": "/b/f", "value": 1},
+        ],
+        [
+            {"op": "add", "path": "/f", "value": {}},
+            {"op": "add", "path": "/f/g", "value": 1},
+        ],
+        # The whole document
+        [{"op": "replace", "path": "", "value": {}}],
+    ],
+)
+def test_json_patch_falls_back_to_python(operations):
+    patch = JsonPatch(operations)
+    assert patch.to_sql(literal("{}", String)) is None
+    apply(patch, DOCUMENT)
+
+
+def test_json_patch_array_indices():
+    patch = JsonPatch([{"op": "add", "path": "/a/0", "value": 0}])
+    assert patch.apply({"a": [1]}) == {"a": [0, 1]}
+    patch = JsonPatch([{"op": "remove", "path": "/a/1"}])
+    with pytest.raises(JsonPatchError):
+        patch.apply({"a": [1]})
+
+
+@pytest.mark.parametrize(
+    "patch, document",
+    [
+        # null deletes a member
+        ({"b": {"c": None}, "e": None}, DOCUMENT),
+        ({"x": None}, DOCUMENT),
+        ({"b": {"x": {"y": 1}}, "a": {"z": 2}}, DOCUMENT),
+        ({"a": [None]}, DOCUMENT),
+        ({"f": {"g": None}}, DOCUMENT),
+        # Anything but an object is replaced by one
+        ({"f": 1}, None),
+        ({"f": 1}, [1, 2]),
+    ],
+)
+def test_merge_patch_sql_matches_python(engine, patch, document):
+    patch = MergePatch(patch)
+    assert apply_sql(engine, patch, document) == apply(patch, document)
+
+
+def test_patch_from_dict():
+    for patch in (JsonPatch([{"op": "remove", "path": "/e"}]), MergePatch({"e": 1})):
+        assert patch_from_dict(patch.to_dict()) == patch
+    with pytest.raises(JsonPatchError):
+        patch_from_dict({"type": "unknown"})
@@ -0,0 +1,119 @@
+"""SQL statements run by each command of the chat input callback."""
+
+import json
+
+import pytest
+from sqlalchemy import event
+
+from zendo.app import create_app
+from zendo.config import Config
+from zendo.constants import APP_ID
+from zendo.layouts import MainLayout
+from zendo.models import db
+from zendo.services import auth
+
+ids = MainLayout.ids
+
+
+def prop_id(component_id: dict) -> str:
+    return json.dumps(component_id, separators=(",", ":"), sort_keys=True)
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    path = tmp_path_factory.mktemp("statements") / "database.db"
+    return create_app(Config(database_url=f"sqlite:///{path}"))
+
+
+@pytest.fixture(scope="module")
+def client(app):
+    server = app.server
+    with server.app_context():
+        auth.register_user("alice", "alice@example.com", "secret1")
+    session = server.session_interface.get_signing_serializer(server)
+    client = server.test_client()
+    client.set_cookie("session", session.dumps({"_user_id": "alice"}))
+    return client
+
+
+@pytest.fixture(scope="module")
+def send(app, client):
+    dependencies = client.get("/_dash-dependencies").get_json()
+    output = next(
+        d["output"]
+        for d in dependencies
+        if '"send_job"' in d["output"] and '"send_button"' in d["inputs"][0]["id"]
+    )
+    statements = []
+
+    with app.server.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    app_state = {"mode": "chat", "conversation_id": None, "messages": []}
+
+    def send(message: str) -> list[str]:
+        body = {
+            "output": output,
+            "outputs": [
+                {"id": ids.state(APP_ID), "property": "data"},
+                {"id": ids.send_job(APP_ID), "property": "data"},
+            ],
+            "inputs": [
+                {"id": ids.send_button(APP_ID), "property": "n_clicks", "value": 1}
+            ],
+            "state": [
+                {
+                    "id": ids.input_textarea(APP_ID),
+                    "property": "value",
+                    "value": message,
+                },
+                {"id": ids.state(APP_ID), "property": "data", "value": app_state},
+            ],
+            "changedPropIds": [prop_id(ids.send_button(APP_ID)) + ".n_clicks"],
+        }
+        statements.clear()
+        response = client.post("/_dash-update-component", json=body)
+        assert response.status_code == 200
+        app_state.update(
+            response.get_json()["response"][prop_id(ids.state(APP_ID))]["data"]
+        )
+        return list(statements)
+
+    # Warm the user and applet caches
+    send("hello")
+    send("/new chat_history")
+    send.app_state = app_state
+    yield send
+    event.remove(engine, "before_cursor_execute", count)
+
+
+@pytest.mark.parametrize(
+    "message, expected",
+    [
+        # Owner of the conversation, then one INSERT of both messages
+        ("hello", 2),
+        ("/help", 2),
+        ("/avail", 2),
+        ("/state", 2),
+        ("/send hi", 2),
+        # The applet INSERT too
+        ("/new chat_history", 3),
+        # The applets of the user too
+        ("/list", 3),
+    ],
+)
+def test_statements_per_command(send, message, expected):
+    assert len(send(message)) == expected
+
+
+def test_switch_statements(send):
+    send("/new chat_history")
+    applet_id = send.app_state["current_applet"]
+    # Found in the applet cache
+    assert len(send(f"/switch {applet_id}")) == 2
+    # Looked up in the database
+    assert len(send("/switch 00000000-0000-0000-0000-000000000000")) == 3
@@ -0,0 +1,24 @@
+"""Token-bucket rate limiting of login attempts."""
+
+from zendo.services.throttle import RateLimiter
+
+
+def test_hit_throttles_when_empty():
+    limiter = RateLimiter(rate=0, burst=2)
+    assert [limiter.hit("alice") for _ in range(3)] == [True, True, False]
+    assert limiter.hit("bob")
+    assert limiter.retry_after("alice") == float("inf")
+
+
+def test_refund_gives_back_a_token():
+    limiter = RateLimiter(rate=0, burst=2)
+    for _ in range(10):
+        assert limiter.hit("alice")
+        limiter.refund("alice")
+    assert limiter.hit("alice") and limiter.hit("alice")
+    limiter.refund("alice")
+    limiter.refund("alice")
+    limiter.refund("alice")
+    # Never more than burst
+    assert [limiter.hit("alice") for _ in range(3)] == [True, True, False]
+    assert limiter.stats()["refunded"] == 13
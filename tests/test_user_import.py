@@ -0,0 +1,79 @@
+"""Bulk import of user accounts from CSV and NDJSON files."""
+
+import json
+
+import pytest
+from flask import Flask
+
+from zendo.models import User, db
+from zendo.services.user_import import import_users, read_rows
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = Flask(__name__)
+    server.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'db.sqlite'}"
+    db.init_app(server)
+    with server.app_context():
+        db.create_all()
+        yield server
+        db.session.remove()
+        db.engine.dispose()
+
+
+def write_ndjson(path, rows):
+    path.write_text(
+        "".join(
+            (row if isinstance(row, str) else json.dumps(row)) + "\n" for row in rows
+        )
+    )
+    return path
+
+
+def test_malformed_ndjson_rows_are_reported(server, tmp_path):
+    valid = {"username": "alice", "email": "alice@example.com", "password": "secret1"}
+    path = write_ndjson(
+        tmp_path / "users.ndjson",
+        [
+            valid,
+            {**valid, "username": 42},
+            {**valid, "username": "bob", "email": ["bob@example.com"]},
+            {**valid, "username": "carol", "email": "c@example.com", "password": 7},
+            {**valid, "username": "dave", "email": "d@example.com", "last_name": {}},
+            {**valid, "username": "e v", "email": "e@example.com"},
+            {**valid, "username": "frank", "email": "frank@"},
+            {**valid, "username": "gina", "email": "g@example.com", "password": " "},
+            "[1, 2]",
+            "{not json",
+        ],
+    )
+    batches = list(import_users(read_rows(path), batch_size=4))
+    errors = dict(error for batch in batches for error in batch.errors)
+    assert sum(batch.imported for batch in batches) == 1
+    assert errors[2] == "Invalid username: expected a string"
+    assert errors[3] == "Invalid email: expected a string"
+    assert errors[4] == "Invalid password: expected a string"
+    assert errors[5] == "Invalid last_name: expected a string"
+    assert errors[6].startswith("Username must be")
+    assert errors[7].startswith("Invalid email format")
+    assert errors[8] == "Missing password"
+    assert errors[9] == "Expected a JSON object"
+    assert errors[10].startswith("Invalid JSON")
+    assert [user.username for user in User.query.all()] == ["alice"]
+
+
+def test_existing_users_are_reported(server, tmp_path):
+    path = tmp_path / "users.csv"
+    path.write_text(
+        "username,email,password\n"
+        "alice,alice@example.com,secret1\n"
+        "ALICE,other@example.com,secret1\n"
+        "bob,Alice@Example.com,secret1\n"
+    )
+    assert [batch.imported for batch in import_users(read_rows(path))] == [1]
+    errors = next(import_users(read_rows(path))).errors
+    assert sorted(errors) == [
+        (2, "Username already exists"),
+        (3, "Duplicate username in file"),
+        (4, "Duplicate email in file"),
+    ]
@@ -0,0 +1,81 @@
+"""Case-insensitive username and email lookup keys of users."""
+
+import pytest
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from zendo.migrations import MIGRATIONS, MigrationError, upgrade
+from zendo.models import User, db, normalize_login
+
+
+def add_user(conn, username: str, email: str) -> None:
+    conn.execute(
+        insert(User.__table__).values(
+            username=username,
+            email=email,
+            username_key=normalize_login(username),
+            email_key=normalize_login(email),
+            password_hash="x",
+        )
+    )
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    db.metadata.create_all(engine)
+    upgrade(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize(
+    "column, index",
+    [
+        (User.username_key, "ix_user_username_key"),
+        (User.email_key, "ix_user_email_key"),
+    ],
+)
+def test_lookup_uses_index(engine, column, index):
+    query = select(User.id).where(column == "alice")
+    sql = str(query.compile(engine, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as conn:
+        plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").all()
+    # e.g. SEARCH user USING COVERING INDEX ix_user_username_key (username_key=?)
+    assert any(f"INDEX {index} (" in row.detail for row in plan)
+    assert not any(row.detail.startswith("SCAN") for row in plan)
+
+
+@pytest.mark.parametrize(
+    "username, email",
+    [("ALICE", "other@example.com"), ("other", "Alice@Example.com")],
+)
+def test_keys_are_unique(engine, username, email):
+    with engine.begin() as conn:
+        add_user(conn, "alice", "alice@example.com")
+    with pytest.raises(IntegrityError), engine.begin() as conn:
+        add_user(conn, username, email)
+
+
+def test_migration_refuses_case_collisions(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        # As upgraded before the keys were unique
+        for name in ("username_key", "email_key"):
+            conn.exec_driver_sql(f"DROP INDEX ix_user_{name}")
+            conn.exec_driver_sql(f"CREATE INDEX ix_user_{name} ON user ({name})")
+        conn.exec_driver_sql(f"PRAGMA user_version = {len(MIGRATIONS) - 1}")
+        add_user(conn, "alice", "alice@example.com")
+        add_user(conn, "Alice", "alice2@example.com")
+    with pytest.raises(MigrationError, match="alice"):
+        upgrade(engine)
+    with engine.begin() as conn:
+        assert conn.exec_driver_sql("PRAGMA user_version").scalar() == (
+            len(MIGRATIONS) - 1
+        )
+        conn.execute(User.__table__.delete().where(User.username == "Alice"))
+    assert upgrade(engine) == len(MIGRATIONS)
+    with pytest.raises(IntegrityError), engine.begin() as conn:
+        add_user(conn, "ALICE", "alice3@example.com")
+    engine.dispose()